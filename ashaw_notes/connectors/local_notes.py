@@ -4,12 +4,30 @@
 """
 import re
 import os
+import gzip
+import lzma
+import json
+import time
+import calendar
+import heapq
+import itertools
+import threading
+import contextlib
+import concurrent.futures
+from array import array
+from bisect import bisect_left
 from datetime import datetime
 import shutil
 import ashaw_notes.utils.search
+import ashaw_notes.utils.snapshot
 import ashaw_notes.utils.configuration
 from ashaw_notes.utils.search import datestring_to_timestamp
 
+try:
+    import fcntl
+except ImportError:  # file locks are only taken on platforms providing them
+    fcntl = None
+
 
 CONFIG_SECTION = 'local_notes'
 
@@ -26,6 +44,11 @@ def save_note(timestamp, note):
     add_local_note(timestamp, note)
 
 
+def save_notes(notes):
+    """Saves (timestamp, note) pairs with a single write"""
+    add_local_notes(notes)
+
+
 def delete_note(timestamp):
     """Removes note at supplied timestamp"""
     delete_local_note(timestamp)
@@ -43,85 +66,559 @@ def find_notes(search_terms):
     return find_local_notes(request)
 
 
+def iter_notes(search_terms, newest_first=True):
+    """Yields notes corresponding to supplied search object one at a time"""
+    request = ashaw_notes.utils.search.get_search_request(search_terms)
+    return iter_local_notes(request, newest_first)
+
+
 def get_common_words():
     """Finds all common words in note file"""
-    # not yet implemented
-    return set()
+    words = set()
+    for location in list_segments():
+        words.update(read_segment_header(location)['tokens'])
+    word_index = load_word_index()
+    if word_index:
+        words.update(word_index['tokens'])
+        words.update(word_index['recent'])
+    return words
+
+
+def complete(prefix, limit=0):
+    """Returns the indexed words starting with a prefix in lexical order"""
+    prefix = prefix.lower()
+    words = sorted(word for word in get_common_words()
+                   if word.startswith(prefix))
+    return words[:limit] if limit else words
 
 
 # Module Specific Methods
 
 __line_regex__ = re.compile(r'\[([^\]]+)\] (.*)')
+__regex_characters__ = re.compile(r'[.^$*+?{}\[\]\\|()]')
+__header_regex__ = re.compile(r'^(\d{4}-\d{2}-\d{2})$')
+__day_regex__ = re.compile(r'^\[\w{3} (\w{3}) ([ \d]\d) [\d:]{8} (\d{4})\]')
+__timestamp_names__ = [
+    'mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun',
+    'jan', 'feb', 'mar', 'apr', 'may', 'jun',
+    'jul', 'aug', 'sep', 'oct', 'nov', 'dec',
+]
+__months__ = {
+    'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+    'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12,
+}
+
+
+__write_lock__ = threading.RLock()  # serialises writers against compaction
+__lock_file__ = None  # descriptor holding the cross process file lock
+__lock_depth__ = 0
 
 
 def add_local_note(timestamp, note):
     """Inserts note into local file"""
-    backup_notes()
-    if os.path.isfile(get_notes_file_location()):
-        reading_file = open(get_notes_file_location(), "r+", encoding="utf8")
-    else:
-        reading_file = None
+    commit_notes([(timestamp, note)])
+
+
+def add_local_notes(notes):
+    """Inserts notes into local file oldest first, under one backup"""
+    commit_notes(sorted(notes, key=lambda pair: pair[0]))
+
+
+def commit_notes(notes):
+    """Appends notes under the notes file lock, backed up as one batch"""
+    notes = list(notes)
+    with lock_notes():
+        with backup_operations([('add',) + tuple(note) for note in notes]):
+            append_notes(notes)
+
+
+@contextlib.contextmanager
+def lock_notes():
+    """Holds the notes file exclusively against other threads and processes
+
+    The lock is reentrant within a process, with the lock file only
+    taken by the outermost holder.
+    """
+    global __lock_file__, __lock_depth__
+    with __write_lock__:
+        if not __lock_depth__ and fcntl:
+            try:
+                __lock_file__ = os.open(get_lock_location(),
+                                        os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(__lock_file__, fcntl.LOCK_EX)
+            except OSError:
+                if __lock_file__ is not None:
+                    os.close(__lock_file__)
+                __lock_file__ = None
+        __lock_depth__ += 1
+        try:
+            yield
+        finally:
+            __lock_depth__ -= 1
+            if not __lock_depth__ and __lock_file__ is not None:
+                fcntl.flock(__lock_file__, fcntl.LOCK_UN)
+                os.close(__lock_file__)
+                __lock_file__ = None
+
+
+def get_lock_location():
+    """Returns the lock file shared by every writer of the notes file"""
+    return "%s.lock" % get_notes_file_location()
+
+
+def use_sync_writes():
+    """Checks if appended notes are fsynced before returning"""
+    config = ashaw_notes.utils.configuration.load_config()
+    return config.get(CONFIG_SECTION, 'sync_writes', fallback='0') == '1'
+
+
+def append_note(timestamp, note):
+    """Appends note to the end of the local file"""
+    append_notes([(timestamp, note)])
+
+
+def append_notes(notes):
+    """Appends notes to the end of the local file in one write session"""
+    day_index = load_day_index(rebuild=False)
+    word_index = load_word_index(rebuild=False)
+    word_entries = []
+    archive_due = False
+    last_header = None
     writing_file = open(get_notes_file_location(), "a+", encoding="utf8")
-    if not is_header_found(reading_file, timestamp):
-        write_header(writing_file, get_date_header(timestamp))
-    write_line(writing_file, build_note_line(timestamp, note))
-    if reading_file:
-        reading_file.close()
-    writing_file.close()
+    try:
+        for timestamp, note in notes:
+            header = get_date_header(timestamp)
+            header_found = header == last_header or \
+                is_header_current(timestamp)
+            archive_due = archive_due or \
+                (not header_found and is_archive_due(timestamp))
+            if not header_found:
+                write_header(writing_file, header)
+            last_header = header
+            line = build_note_line(timestamp, note)
+            write_line(writing_file, line)
+            # headers and sidecars are checked against the file itself
+            writing_file.flush()
+            if day_index:
+                update_day_index(day_index, header, save=False)
+            if word_index:
+                line_size = len(line.encode('utf8')) + len(os.linesep)
+                word_entries.append(get_word_index_entry(line_size, note))
+        if use_sync_writes():
+            os.fsync(writing_file.fileno())
+    finally:
+        writing_file.close()
+        # sidecars are saved once for the whole session
+        if day_index:
+            save_day_index(day_index)
+        log_word_index_entries(word_entries)
+    if archive_due:
+        threading.Thread(target=archive_notes).start()
 
 
 def delete_local_note(timestamp):
-    """Removes note at timestamp from file"""
-    backup_notes()
-    log = open(get_notes_file_location(), "r+", encoding="utf8").readlines()
-    writing_file = open(get_notes_file_location(), "w", encoding="utf8")
-    for line in log:
-        if line.find(build_note_line(timestamp, '')) != 0:
-            writing_file.write(line)
-    writing_file.close()
+    """Journals the removal of the note at timestamp"""
+    with lock_notes():
+        with backup_operations([('delete', timestamp)]):
+            entries = journal_delete(timestamp)
+    if entries >= get_compaction_threshold():
+        threading.Thread(target=compact_notes).start()
+
+
+def journal_delete(timestamp):
+    """Tombstones the note at timestamp, returning the journal length"""
+    try:
+        stat = os.stat(get_notes_file_location())
+    except OSError:
+        return 0
+    write_journal_entry(
+        stat, 'delete', get_tombstone_key(timestamp), stat.st_size)
+    return get_journal_entry_count()
 
 
 def find_local_notes(search_request):
     """Searches notes file for given request"""
-    results = []
+    if search_request.is_paged():
+        # pages are counted from the newest note but listed oldest first
+        return list(reversed(list(iter_local_notes(search_request))))
 
-    reading_file = open(get_notes_file_location(), "r+", encoding="utf8")
-    for line in reading_file:
-        matching_line = True
+    if is_unfiltered(search_request):
+        snapshot = load_notes_snapshot()
+        if snapshot:
+            return list(snapshot.iter_notes(*get_note_bounds(search_request)))
 
-        for term in search_request.inclusion_terms:
-            if not re.search(r'(%s)\b' % term, line):
-                matching_line = False
-                break
+    tombstones = load_tombstones()
+    notes = list(iter_segment_notes(search_request, tombstones))
+    ranges = get_search_ranges(search_request)
+    offsets = find_candidate_offsets(search_request.inclusion_terms)
 
-        if not matching_line:
-            continue
+    if offsets is None and ranges == [(0, None)]:
+        chunks = get_scan_chunks(get_notes_file_location())
+        if len(chunks) > 1:
+            return notes + scan_chunks_in_parallel(
+                chunks, search_request, tombstones)
 
-        for term in search_request.exclusion_terms:
-            if re.search(r'%s' % term, line):
-                matching_line = False
-                break
+    matcher = LineMatcher(search_request)
+    with open(get_notes_file_location(), "rb") as reading_file:
+        if offsets is not None:
+            lines = read_offset_lines(reading_file, offsets, ranges, matcher)
+        else:
+            lines = scan_ranges(reading_file, ranges, matcher)
+        return notes + list(iter_matching_notes(
+            lines, search_request, matcher, tombstones))
+
+
+def iter_local_notes(search_request, newest_first=True):
+    """Streams the notes matching the request, newest first by default"""
+    snapshot = None
+    if is_unfiltered(search_request):
+        snapshot = load_notes_snapshot()
 
-        if not matching_line:
+    if snapshot:
+        start, end = get_note_bounds(search_request)
+        notes = snapshot.iter_notes(start, end, newest_first)
+    else:
+        tombstones = load_tombstones()
+        notes = iter_active_notes(search_request, tombstones, newest_first)
+        archived = iter_segment_notes(
+            search_request, tombstones, newest_first)
+        if newest_first:
+            # back-dated notes can land in the notes file after newer ones
+            notes = heapq.merge(notes, archived,
+                                key=lambda note: note[0], reverse=True)
+        else:
+            notes = itertools.chain(archived, notes)
+    yield from ashaw_notes.utils.search.page_notes(notes, search_request)
+
+
+def get_note_bounds(search_request):
+    """Returns the inclusive note timestamp bounds of a request, None if open
+
+    Note timestamps read the local clock of each line as UTC, so the
+    requested days are converted the same way rather than with mktime.
+    """
+    first, last = search_request.get_day_range() or (None, None)
+    start = end = None
+    if first:
+        start = calendar.timegm(time.strptime(first, '%Y-%m-%d'))
+    if last:
+        end = calendar.timegm(time.strptime(last, '%Y-%m-%d')) + 86399
+    return start, end
+
+
+def is_unfiltered(search_request):
+    """Checks if a request selects notes by date alone"""
+    return not search_request.inclusion_terms and \
+        not search_request.exclusion_terms
+
+
+def iter_active_notes(search_request, tombstones, newest_first):
+    """Streams the notes matching the request from the notes file"""
+    ranges = get_search_ranges(search_request)
+    offsets = find_candidate_offsets(search_request.inclusion_terms)
+    matcher = LineMatcher(search_request)
+
+    with open(get_notes_file_location(), "rb") as reading_file:
+        if newest_first:
+            yield from iter_newest_notes(
+                reading_file, search_request, offsets, matcher, tombstones)
+            return
+        if offsets is not None:
+            lines = read_offset_lines(reading_file, offsets, ranges, matcher)
+        else:
+            lines = scan_ranges(reading_file, ranges, matcher)
+        yield from iter_matching_notes(
+            lines, search_request, matcher, tombstones)
+
+
+def iter_newest_notes(file, search_request, offsets, matcher, tombstones):
+    """Streams the notes matching the request by descending timestamp
+
+    Notes are appended in the order they are saved, so a back-dated note
+    follows newer ones in the notes file. The day index ranges are walked
+    newest day first and each day's matches sorted before being yielded.
+    """
+    day_index = load_day_index()
+    if not day_index:
+        lines = scan_ranges(file, [(0, None)], matcher)
+        yield from sort_newest_first(iter_matching_notes(
+            lines, search_request, matcher, tombstones))
+        return
+
+    days = {}
+    for day, start, end in day_index['ranges']:
+        if search_request.includes_day(day):
+            days.setdefault(day, []).append((start, end))
+
+    for day in sorted(days, reverse=True):
+        ranges = days[day]
+        if offsets is not None:
+            lines = read_offset_lines(
+                file, get_range_offsets(offsets, ranges), ranges, matcher)
+        else:
+            lines = scan_ranges(file, ranges, matcher)
+        yield from sort_newest_first(iter_matching_notes(
+            lines, search_request, matcher, tombstones))
+
+
+def get_range_offsets(offsets, ranges):
+    """Returns the sorted offsets falling within the given byte ranges"""
+    selected = []
+    for start, end in ranges:
+        selected += offsets[bisect_left(offsets, start):
+                            bisect_left(offsets, end)]
+    return selected
+
+
+def sort_newest_first(notes):
+    """Orders notes by descending timestamp, later lines first on ties"""
+    notes = list(notes)
+    notes.reverse()
+    notes.sort(key=lambda note: note[0], reverse=True)
+    return notes
+
+
+def iter_matching_notes(lines, search_request, matcher, tombstones):
+    """Parses the raw lines which fully match the request into notes"""
+    dated = search_request.get_day_range() is not None
+
+    for offset, raw_line in lines:
+        line = decode_line(raw_line)
+        if not matcher.matches(line):
+            continue
+
+        if dated and not search_request.includes_day(get_line_day(line)):
             continue
 
         timestamp, note = parse_note_line(line)
-        
+
         if not timestamp:
             continue
 
-        if search_request.date:
-            pattern = re.compile(
-                search_request.date.strftime("%a %b %d [^ ]+ %Y"))
-            if not pattern.match(timestamp):
-                continue
+        if is_tombstoned(tombstones, timestamp, offset):
+            continue
 
         if note:
-            epoch = datestring_to_timestamp(timestamp)
-            results.append((epoch, note))
+            yield datestring_to_timestamp(timestamp), note
+
+
+class LineMatcher:
+    """Search request terms compiled for matching raw note lines"""
+
+    def __init__(self, search_request):
+        inclusion_terms = search_request.inclusion_terms
+        exclusion_terms = search_request.exclusion_terms
+
+        # literal terms can be checked on the undecoded bytes
+        self.required = [term.encode('utf8') for term in inclusion_terms
+                         if is_literal(term)]
+        self.forbidden = [term.encode('utf8') for term in exclusion_terms
+                          if is_literal(term)]
+        self.anchor = max(self.required, key=len) if self.required else None
+
+        self.inclusions = [re.compile(r'(?:%s)\b' % term)
+                           for term in inclusion_terms]
+
+        self.exclusion = None
+        patterns = [term for term in exclusion_terms
+                    if not is_literal(term)]
+        if patterns:
+            self.exclusion = re.compile('|'.join(
+                '(?:%s)' % term for term in patterns))
+
+    def scan(self, buffer):
+        """Yields the positions and raw lines of a buffer passing the prefilter
+
+        With a literal required term only the lines around its occurrences
+        are looked at, otherwise every line is checked.
+        """
+        if self.anchor:
+            filtered = len(self.required) > 1 or bool(self.forbidden)
+            position = buffer.find(self.anchor)
+            while position != -1:
+                line_start = buffer.rfind(b'\n', 0, position) + 1
+                line_end = buffer.find(b'\n', position)
+                if line_end == -1:
+                    line_end = len(buffer)
+                line = buffer[line_start:line_end]
+                if not filtered or self.prefilter(line):
+                    yield line_start, line
+                position = buffer.find(self.anchor, line_end)
+            return
+
+        position = 0
+        filtered = bool(self.forbidden)
+        for line in buffer.split(b'\n'):
+            if line and (not filtered or self.prefilter(line)):
+                yield position, line
+            position += len(line) + 1
+
+    def prefilter(self, raw_line):
+        """Cheaply rejects lines by substring before any decoding"""
+        for term in self.required:
+            if term not in raw_line:
+                return False
+        for term in self.forbidden:
+            if term in raw_line:
+                return False
+        return True
+
+    def matches(self, line):
+        """Checks a decoded line against the compiled terms"""
+        for inclusion in self.inclusions:
+            if not inclusion.search(line):
+                return False
+        if self.exclusion and self.exclusion.search(line):
+            return False
+        return True
+
+
+def get_search_ranges(search_request):
+    """Returns the byte ranges of the notes file a request has to read"""
+    day_index = None
+    if search_request.get_day_range():
+        day_index = load_day_index()
+
+    if not day_index:
+        return [(0, None)]
+
+    # neighbouring days are merged so a span is read with a single seek
+    ranges = []
+    for day, start, end in day_index['ranges']:
+        if not search_request.includes_day(day):
+            continue
+        if ranges and ranges[-1][1] == start:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((start, end))
+    return ranges
+
+
+def scan_ranges(file, ranges, matcher):
+    """Yields the lines of every range passing the prefilter"""
+    for start, end in ranges:
+        yield from scan_range(file, start, end, matcher)
+
+
+def read_offset_lines(file, offsets, ranges, matcher):
+    """Yields the lines starting at the given offsets within the ranges"""
+    starts = [start for start, _ in ranges]
+    for offset in offsets:
+        position = bisect_left(starts, offset + 1) - 1
+        if position < 0:
+            continue
+        end = ranges[position][1]
+        if end is not None and offset >= end:
+            continue
+        file.seek(offset)
+        line = file.readline().rstrip(b'\n')
+        if matcher.prefilter(line):
+            yield offset, line
+
+
+def scan_range(file, start, end, matcher, block_size=1 << 20):
+    """Yields lines between two byte offsets of a file passing the prefilter
+
+    The range is read in large blocks cut at line ends so that
+    the matcher can search many lines at once.
+    """
+    file.seek(start)
+    offset = start
+    remainder = b''
+    while end is None or offset < end:
+        size = block_size if end is None else min(block_size, end - offset)
+        block = file.read(size)
+        if not block:
+            break
+        offset += len(block)
+        buffer = remainder + block
+        cut = buffer.rfind(b'\n') + 1
+        remainder = buffer[cut:]
+        base = offset - len(buffer)
+        for position, line in matcher.scan(buffer[:cut]):
+            yield base + position, line
+    if remainder:
+        for position, line in matcher.scan(remainder):
+            yield offset - len(remainder) + position, line
+
+
+__scan_pool__ = None  # reused between parallel scans
+
+
+def get_scan_processes():
+    """Returns the number of processes used to scan large notes files"""
+    config = ashaw_notes.utils.configuration.load_config()
+    processes = config.get(CONFIG_SECTION, 'scan_processes', fallback='1')
+    if processes == 'auto':
+        return os.cpu_count() or 1
+    return int(processes)
+
+
+def get_parallel_scan_size():
+    """Returns the notes file size from which scans run in parallel"""
+    config = ashaw_notes.utils.configuration.load_config()
+    return float(config.get(CONFIG_SECTION, 'parallel_scan_size',
+                            fallback=64e6))
+
+
+def get_scan_chunks(location):
+    """Splits the notes file into line aligned ranges, one per scan process"""
+    processes = get_scan_processes()
+    signature = get_file_signature(location)
+    if processes < 2 or not signature or \
+            signature[0] < get_parallel_scan_size():
+        return [(0, None)]
+
+    boundaries = [0]
+    with open(location, "rb") as reading_file:
+        for chunk in range(1, processes):
+            reading_file.seek(signature[0] * chunk // processes)
+            reading_file.readline()
+            if reading_file.tell() > boundaries[-1]:
+                boundaries.append(reading_file.tell())
+    boundaries.append(None)
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:])
+            if end is None or start < end]
+
+
+def scan_chunks_in_parallel(chunks, search_request, tombstones):
+    """Scans the notes file chunks in a process pool, keeping file order"""
+    global __scan_pool__
+    if not __scan_pool__:
+        __scan_pool__ = concurrent.futures.ProcessPoolExecutor(
+            max_workers=get_scan_processes())
+
+    location = get_notes_file_location()
+    futures = [
+        __scan_pool__.submit(
+            scan_chunk, location, start, end, search_request, tombstones)
+        for start, end in chunks
+    ]
+    results = []
+    for future in futures:
+        results += future.result()
     return results
 
 
+def scan_chunk(location, start, end, search_request, tombstones):
+    """Process pool worker finding the notes of one notes file chunk"""
+    matcher = LineMatcher(search_request)
+    with open(location, "rb") as reading_file:
+        return list(iter_matching_notes(
+            scan_range(reading_file, start, end, matcher),
+            search_request, matcher, tombstones))
+
+
+def is_literal(term):
+    """Checks if a search term holds no regex syntax"""
+    return not __regex_characters__.search(term)
+
+
+def decode_line(raw_line):
+    """Decodes a raw note file line"""
+    return raw_line.decode('utf8').rstrip('\r')
+
+
 def get_notes_file_location():
     """Returns the note file location from the config"""
     config = ashaw_notes.utils.configuration.load_config()
@@ -134,21 +631,898 @@ def use_backup():
     return config.get(CONFIG_SECTION, 'create_backup')
 
 
+def get_backup_mode():
+    """Returns the backup mode, either full or journal"""
+    config = ashaw_notes.utils.configuration.load_config()
+    return config.get(CONFIG_SECTION, 'backup_mode', fallback='full')
+
+
+def get_backup_log_location():
+    """Returns the location of operations logged since the last snapshot"""
+    return "%s.bak.log" % get_notes_file_location()
+
+
 def backup_notes():
-    """Creates a local backup of the notes file"""
+    """Creates a local backup of the notes file
+
+    In full mode every write copies the notes file. In journal mode the
+    notes file is only copied once the snapshot is older or the log
+    larger than configured.
+    """
     if not use_backup():
         return
-    if os.path.isfile(get_notes_file_location()):
-        shutil.copyfile(get_notes_file_location(),
-                        "%s.bak" % get_notes_file_location())
+    if os.path.isfile(get_notes_file_location()) and is_snapshot_due():
+        take_snapshot()
+
+
+@contextlib.contextmanager
+def backup_operations(operations):
+    """Backs up the notes file around a batch of operations
+
+    The operations are only logged once the body has written them, so
+    a failed write is never replayed by restore_from_backup.
+    """
+    backup_notes()
+    yield
+    log_operations(operations)
+
+
+def log_operations(operations):
+    """Appends written operations to the journal mode backup log"""
+    if operations and use_backup() and get_backup_mode() == 'journal':
+        with open(get_backup_log_location(), "a", encoding="utf8") as log_file:
+            log_file.write(''.join(
+                "%s\n" % json.dumps(operation) for operation in operations))
+
+
+def is_snapshot_due():
+    """Checks if the backup snapshot has to be retaken"""
+    if get_backup_mode() != 'journal':
+        return True
+    config = ashaw_notes.utils.configuration.load_config()
+    try:
+        snapshot = os.stat("%s.bak" % get_notes_file_location())
+    except OSError:
+        return True
+    interval = float(config.get(CONFIG_SECTION, 'snapshot_interval',
+                                fallback=86400))
+    if time.time() - snapshot.st_mtime >= interval:
+        return True
+    try:
+        log_size = os.path.getsize(get_backup_log_location())
+    except OSError:
+        return False
+    return log_size >= float(config.get(CONFIG_SECTION, 'snapshot_log_size',
+                                        fallback=1e6))
+
+
+def take_snapshot():
+    """Copies the notes to the backup and restarts the backup log
+
+    Full mode copies the notes file and its delete journal as they are,
+    journal mode writes the visible notes with the journal applied.
+    """
+    location = get_notes_file_location()
+    tombstones = load_tombstones()
+    if get_backup_mode() != 'journal':
+        copy_notes_file(location, "%s.bak" % location)
+        if tombstones:
+            copy_notes_file(get_journal_location(),
+                            get_journal_backup_location())
+        else:
+            remove_file(get_journal_backup_location())
+    elif tombstones:
+        write_compacted_notes(tombstones, "%s.bak" % location)
+    else:
+        copy_notes_file(location, "%s.bak" % location)
+    remove_file(get_backup_log_location())
+
+
+def remove_file(location):
+    """Removes a file if it exists"""
+    try:
+        os.remove(location)
+    except FileNotFoundError:
+        pass
 
 
 def restore_from_backup():
-    """Restores previous note file"""
+    """Restores the notes file from its snapshot and replays logged operations"""
     if not use_backup():
         return
-    shutil.copyfile("%s.bak" % get_notes_file_location(),
-                    get_notes_file_location())
+    with lock_notes():
+        copy_notes_file("%s.bak" % get_notes_file_location(),
+                        get_notes_file_location())
+        if get_backup_mode() != 'journal' and \
+                os.path.isfile(get_journal_backup_location()):
+            restore_journal()
+        elif os.path.isfile(get_journal_location()):
+            # journal mode snapshots are taken with the journal applied
+            os.remove(get_journal_location())
+        for operation in load_backup_log():
+            if operation[0] == 'add':
+                append_note(operation[1], operation[2])
+            elif operation[0] == 'delete':
+                journal_delete(operation[1])
+
+
+def restore_journal():
+    """Restores the journal backup, handing it to the restored notes file"""
+    with open(get_journal_backup_location(), "r", encoding="utf8") \
+            as backup_file:
+        entries = backup_file.readlines()[1:]
+    location = get_journal_location()
+    owner = "notes\t%s\n" % os.stat(get_notes_file_location()).st_ino
+    with open("%s.tmp" % location, "w", encoding="utf8") as journal_file:
+        journal_file.writelines([owner] + entries)
+    os.replace("%s.tmp" % location, location)
+
+
+def copy_notes_file(source, target):
+    """Copies a notes file through a temporary file and an atomic rename"""
+    shutil.copyfile(source, "%s.tmp" % target)
+    os.replace("%s.tmp" % target, target)
+
+
+def load_backup_log():
+    """Returns the operations logged since the last snapshot"""
+    try:
+        with open(get_backup_log_location(), "r", encoding="utf8") as log_file:
+            return [json.loads(line) for line in log_file if line.strip()]
+    except OSError:
+        return []
+
+
+def get_journal_location():
+    """Returns the delete journal location"""
+    return "%s.journal" % get_notes_file_location()
+
+
+def get_journal_backup_location():
+    """Returns the location of the delete journal copied by full snapshots"""
+    return "%s.bak" % get_journal_location()
+
+
+def get_compaction_threshold():
+    """Returns the number of journal entries which triggers compaction"""
+    config = ashaw_notes.utils.configuration.load_config()
+    return int(config.get(CONFIG_SECTION, 'compact_threshold', fallback=100))
+
+
+def get_tombstone_key(timestamp):
+    """Builds the note line timestamp a tombstone applies to"""
+    return ashaw_notes.utils.search.timestamp_to_datestring(timestamp)
+
+
+def write_journal_entry(stat, *fields):
+    """Appends an entry to the journal of the notes file described by stat"""
+    location = get_journal_location()
+    owner = "notes\t%s\n" % stat.st_ino
+    try:
+        with open(location, "r", encoding="utf8") as journal_file:
+            current = journal_file.readline() == owner
+    except OSError:
+        current = False
+
+    entry = "%s\n" % "\t".join(str(field) for field in fields)
+    if current:
+        with open(location, "a", encoding="utf8") as journal_file:
+            journal_file.write(entry)
+        return
+
+    # a new journal replaces the stale one in a single rename
+    with open("%s.tmp" % location, "w", encoding="utf8") as journal_file:
+        journal_file.write(owner + entry)
+    os.replace("%s.tmp" % location, location)
+
+
+def get_journal_entry_count():
+    """Counts the entries in the journal"""
+    try:
+        with open(get_journal_location(), "rb") as journal_file:
+            return max(sum(1 for _ in journal_file) - 1, 0)
+    except OSError:
+        return 0
+
+
+def load_tombstones():
+    """Returns the journaled deletes which apply to the notes file
+
+    Tombstones map a note timestamp to the file size at deletion, hiding
+    only the lines written before it. A journal left over from a notes
+    file that has since been replaced is ignored.
+    """
+    try:
+        inode = os.stat(get_notes_file_location()).st_ino
+        journal_file = open(get_journal_location(), "r", encoding="utf8")
+    except OSError:
+        return {}
+
+    tombstones = {}
+    with journal_file:
+        for entry in journal_file:
+            fields = entry.rstrip('\n').split('\t')
+            if fields[0] == 'notes' and fields[1] != str(inode):
+                return {}
+            if fields[0] == 'delete':
+                tombstones[fields[1]] = max(
+                    tombstones.get(fields[1], 0), int(fields[2]))
+    return tombstones
+
+
+def is_tombstoned(tombstones, timestamp, offset):
+    """Checks if the note line at offset was deleted"""
+    return timestamp in tombstones and offset < tombstones[timestamp]
+
+
+def compact_notes():
+    """Folds the journal into the notes file through an atomic replace
+
+    Compaction only drops lines already hidden by tombstones, so the
+    visible notes are unchanged and no backup is taken.
+    """
+    with lock_notes():
+        tombstones = load_tombstones()
+        if tombstones:
+            compact_segments(tombstones)
+            write_compacted_notes(tombstones, get_notes_file_location())
+        if os.path.isfile(get_journal_location()):
+            os.remove(get_journal_location())
+
+
+def write_compacted_notes(tombstones, target):
+    """Atomically writes the notes file without its tombstoned lines"""
+    location = get_notes_file_location()
+    with open(location, "rb") as reading_file, \
+            open("%s.tmp" % target, "wb") as writing_file:
+        offset = 0
+        for line in reading_file:
+            timestamp, _ = parse_note_line(line.decode('utf8'))
+            if not is_tombstoned(tombstones, timestamp, offset):
+                writing_file.write(line)
+            offset += len(line)
+        writing_file.flush()
+        os.fsync(writing_file.fileno())
+    shutil.copymode(location, "%s.tmp" % target)
+    os.replace("%s.tmp" % target, target)
+
+
+__segment_formats__ = {'gzip': ('gz', gzip.open), 'lzma': ('xz', lzma.open)}
+__segment_headers__ = {}  # segment headers keyed by location and signature
+
+
+def get_archive_format():
+    """Returns the compression used for archived months, or none"""
+    config = ashaw_notes.utils.configuration.load_config()
+    return config.get(CONFIG_SECTION, 'archive_format', fallback='none')
+
+
+def get_segments_location():
+    """Returns the directory holding the archived month segments"""
+    return "%s.segments" % get_notes_file_location()
+
+
+def list_segments():
+    """Returns the archived segment locations, oldest month first"""
+    try:
+        names = os.listdir(get_segments_location())
+    except OSError:
+        return []
+    extensions = [extension for extension, _ in __segment_formats__.values()]
+    return [os.path.join(get_segments_location(), name)
+            for name in sorted(names)
+            if name.rpartition('.')[2] in extensions]
+
+
+def open_segment(location):
+    """Opens a segment for reading"""
+    return get_segment_opener(location)(location, "rb")
+
+
+def get_segment_opener(location):
+    """Returns the open function for the compression a segment's extension names"""
+    for extension, opener in __segment_formats__.values():
+        if location.endswith('.%s' % extension):
+            return opener
+    raise ValueError("Unknown segment format: %s" % location)
+
+
+def read_segment_header(location):
+    """Returns a segment's time range and token summary
+
+    Only the first line of the segment is decompressed, and headers are
+    cached until the segment is rewritten.
+    """
+    signature = get_file_signature(location)
+    cached = __segment_headers__.get(location)
+    if cached and cached[0] == signature:
+        return cached[1]
+    with open_segment(location) as segment_file:
+        header = json.loads(segment_file.readline().decode('utf8'))
+    __segment_headers__[location] = (signature, header)
+    return header
+
+
+def read_segment(location):
+    """Returns the notes file lines held in a segment"""
+    with open_segment(location) as segment_file:
+        segment_file.readline()
+        return segment_file.read()
+
+
+def write_segment(location, body):
+    """Atomically writes a segment, summarising its notes into the header"""
+    days = []
+    tokens = set()
+    for raw_line in body.splitlines():
+        line = raw_line.decode('utf8', 'replace')
+        day = get_line_day(line)
+        if day:
+            days.append(day)
+        _, note = parse_note_line(line)
+        if note:
+            tokens.update(ashaw_notes.utils.search.get_note_words(note))
+    header = {'first': min(days), 'last': max(days), 'tokens': sorted(tokens)}
+
+    opener = get_segment_opener(location)
+    with opener("%s.tmp" % location, "wb") as segment_file:
+        segment_file.write(json.dumps(header).encode('utf8') + b'\n')
+        segment_file.write(body)
+    os.replace("%s.tmp" % location, location)
+
+
+def is_segment_match(header, search_request, runs):
+    """Checks a segment header against a request's days and word runs"""
+    day_range = search_request.get_day_range()
+    if day_range:
+        first, last = day_range
+        if (first and header['last'] < first) or \
+                (last and header['first'] > last):
+            return False
+    for run in runs:
+        if not any(run in token for token in header['tokens']):
+            return False
+    return True
+
+
+def iter_segment_notes(search_request, tombstones, newest_first=False):
+    """Streams the archived notes matching the request
+
+    Segments whose header rules the request out are never decompressed.
+    Archived lines predate every journaled delete, so any tombstone on
+    their timestamp hides them.
+    """
+    runs = get_indexable_runs(search_request.inclusion_terms)
+    locations = [location for location in list_segments()
+                 if is_segment_match(read_segment_header(location),
+                                     search_request, runs)]
+    if newest_first:
+        locations.reverse()
+
+    matcher = LineMatcher(search_request)
+    for location in locations:
+        lines = [(-1, line) for _, line in matcher.scan(read_segment(location))]
+        notes = iter_matching_notes(lines, search_request, matcher, tombstones)
+        if newest_first:
+            notes = sort_newest_first(notes)
+        yield from notes
+
+
+def is_archive_due(timestamp):
+    """Checks if a note opens a new month, leaving the last one cold"""
+    if get_archive_format() not in __segment_formats__ or \
+            not os.path.isfile(get_notes_file_location()):
+        return False
+    last_header = get_last_header(get_notes_file_location())
+    return bool(last_header) and \
+        last_header[:7] < get_date_header(timestamp)[:7]
+
+
+def archive_notes():
+    """Moves the months before the newest one into compressed segments
+
+    Journaled deletes are applied on the way, as in compaction, and the
+    notes file is atomically replaced by its newest month.
+    """
+    archive_format = get_archive_format()
+    if archive_format not in __segment_formats__:
+        return
+
+    with lock_notes():
+        location = get_notes_file_location()
+        day_index = load_day_index()
+        if not day_index or not day_index['ranges']:
+            return
+        active_month = max(day for day, _, _ in day_index['ranges'])[:7]
+        tombstones = load_tombstones()
+
+        months = {}
+        active = []
+        pending = []
+        with open(location, "rb") as reading_file:
+            offset = 0
+            for raw_line in reading_file:
+                line = raw_line.decode('utf8', 'replace')
+                timestamp, _ = parse_note_line(line)
+                tombstoned = is_tombstoned(tombstones, timestamp, offset)
+                offset += len(raw_line)
+                if tombstoned:
+                    continue
+                pending.append(raw_line)
+                day = get_line_day(line)
+                if not day:
+                    # separators belong to the day block they introduce
+                    continue
+                month = day[:7]
+                target = active if month >= active_month else \
+                    months.setdefault(month, [])
+                target += pending
+                pending = []
+        if not months:
+            return
+
+        if not os.path.isdir(get_segments_location()):
+            os.makedirs(get_segments_location())
+        compact_segments(tombstones)
+        extension = __segment_formats__[archive_format][0]
+        for month, lines in sorted(months.items()):
+            segment = os.path.join(get_segments_location(),
+                                   "%s.%s" % (month, extension))
+            body = b''.join(lines)
+            for existing in list_segments():
+                if os.path.basename(existing).startswith(month + '.'):
+                    body = read_segment(existing) + body
+                    if existing != segment:
+                        os.remove(existing)
+            write_segment(segment, body)
+
+        with open("%s.tmp" % location, "wb") as writing_file:
+            writing_file.writelines(active + pending)
+            writing_file.flush()
+            os.fsync(writing_file.fileno())
+        shutil.copymode(location, "%s.tmp" % location)
+        os.replace("%s.tmp" % location, location)
+        if os.path.isfile(get_journal_location()):
+            os.remove(get_journal_location())
+        if use_backup():
+            take_snapshot()
+
+
+def compact_segments(tombstones):
+    """Rewrites the segments holding tombstoned notes without them"""
+    months = set()
+    for key in tombstones:
+        day = get_line_day('[%s]' % key)
+        if day:
+            months.add(day[:7])
+
+    for location in list_segments():
+        month = os.path.basename(location).partition('.')[0]
+        if month not in months:
+            continue
+        lines = read_segment(location).splitlines(True)
+        kept = [line for line in lines
+                if parse_note_line(line.decode('utf8', 'replace'))[0]
+                not in tombstones]
+        if len(kept) == len(lines):
+            continue
+        if any(parse_note_line(line.decode('utf8', 'replace'))[1]
+               for line in kept):
+            write_segment(location, b''.join(kept))
+        else:
+            os.remove(location)
+
+
+__notes_snapshot__ = None  # the mapped snapshot of the last load
+__snapshot_thread__ = None  # the background snapshot rebuild, if any
+__snapshot_lock__ = threading.Lock()
+
+
+def get_notes_snapshot_location():
+    """Returns where all notes are snapshotted, if anywhere"""
+    config = ashaw_notes.utils.configuration.load_config()
+    return config.get(CONFIG_SECTION, 'notes_snapshot_location',
+                      fallback=None)
+
+
+def get_notes_snapshot_signature():
+    """Returns the state of every file a notes snapshot is built from"""
+    return [
+        get_file_signature(get_notes_file_location()),
+        get_file_signature(get_journal_location()),
+        [[os.path.basename(location), get_file_signature(location)]
+         for location in list_segments()],
+    ]
+
+
+def load_notes_snapshot():
+    """Maps the snapshot of all visible notes while it is current
+
+    Returns None when snapshots are disabled or stale, leaving callers
+    to scan the notes file instead. A stale snapshot is rebuilt in the
+    background, never on the search path.
+    """
+    global __notes_snapshot__
+    location = get_notes_snapshot_location()
+    if not location:
+        return None
+
+    signature = get_notes_snapshot_signature()
+    if __notes_snapshot__ and __notes_snapshot__.signature == signature:
+        return __notes_snapshot__
+
+    snapshot = ashaw_notes.utils.snapshot.load_snapshot(location, signature)
+    if snapshot:
+        __notes_snapshot__ = snapshot
+    elif signature[0]:
+        start_snapshot_refresh()
+    return snapshot
+
+
+def start_snapshot_refresh():
+    """Rebuilds the notes snapshot on a background thread, one at a time"""
+    global __snapshot_thread__
+    with __snapshot_lock__:
+        if __snapshot_thread__ and __snapshot_thread__.is_alive():
+            return
+        __snapshot_thread__ = threading.Thread(
+            target=refresh_notes_snapshot, daemon=True)
+        __snapshot_thread__.start()
+
+
+def refresh_notes_snapshot():
+    """Writes the snapshot of all visible notes, returning if written
+
+    The signature is taken before reading, so a write landing during
+    the rebuild leaves the snapshot stale rather than wrong.
+    """
+    location = get_notes_snapshot_location()
+    signature = get_notes_snapshot_signature()
+    if not location or not signature[0]:
+        return False
+    request = ashaw_notes.utils.search.SearchRequest([])
+    tombstones = load_tombstones()
+    notes = itertools.chain(
+        iter_segment_notes(request, tombstones),
+        iter_active_notes(request, tombstones, False))
+    try:
+        ashaw_notes.utils.snapshot.write_snapshot(location, notes, signature)
+    except OSError:
+        return False
+    return True
+
+
+def get_day_index_location():
+    """Returns the day index sidecar location"""
+    return "%s.idx" % get_notes_file_location()
+
+
+def get_file_signature(location):
+    """Returns the size and modified time used to validate sidecars"""
+    try:
+        stat = os.stat(location)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def load_day_index(rebuild=True):
+    """Loads the day index, rebuilding it when it no longer matches the notes file"""
+    signature = get_file_signature(get_notes_file_location())
+    if not signature:
+        return None
+
+    try:
+        with open(get_day_index_location(), "r", encoding="utf8") as index_file:
+            day_index = json.load(index_file)
+        if day_index.get('signature') == signature:
+            return day_index
+    except (OSError, ValueError):
+        pass
+
+    if not rebuild:
+        return None
+    day_index = build_day_index(get_notes_file_location())
+    day_index['signature'] = signature
+    save_day_index(day_index)
+    return day_index
+
+
+def build_day_index(location):
+    """Scans notes file for the byte ranges holding each day's notes"""
+    day_index = {'ranges': []}
+    offset = 0
+    pending = None
+    with open(location, "rb") as reading_file:
+        for line in reading_file:
+            day = get_line_day(line.decode('utf8', 'replace'))
+            if not day:
+                # separators belong to the day block they introduce
+                if pending is None:
+                    pending = offset
+            else:
+                start = offset if pending is None else pending
+                add_day_range(day_index, day, start, offset + len(line))
+                pending = None
+            offset += len(line)
+    return day_index
+
+
+def add_day_range(day_index, day, start, end):
+    """Extends the last day range or opens a new one"""
+    ranges = day_index['ranges']
+    if ranges and ranges[-1][0] == day and ranges[-1][2] == start:
+        ranges[-1][2] = end
+    else:
+        ranges.append([day, start, end])
+
+
+def update_day_index(day_index, day, save=True):
+    """Records lines appended to the notes file since the index was loaded"""
+    signature = get_file_signature(get_notes_file_location())
+    if not signature:
+        return
+    add_day_range(day_index, day, day_index['signature'][0], signature[0])
+    day_index['signature'] = signature
+    if save:
+        save_day_index(day_index)
+
+
+def save_day_index(day_index):
+    """Atomically writes the day index sidecar"""
+    location = get_day_index_location()
+    try:
+        with open("%s.tmp" % location, "w", encoding="utf8") as index_file:
+            json.dump(day_index, index_file)
+        os.replace("%s.tmp" % location, location)
+    except OSError:
+        pass
+
+
+def get_line_day(line):
+    """Returns the YYYY-MM-DD day of a note or header line"""
+    line = line.rstrip('\r\n')
+    header = __header_regex__.match(line)
+    if header:
+        return header.group(1)
+    parts = __day_regex__.match(line)
+    if not parts or parts.group(1) not in __months__:
+        return None
+    return "%s-%02d-%02d" % (
+        parts.group(3), __months__[parts.group(1)], int(parts.group(2)))
+
+
+def get_word_index_location():
+    """Returns the word index sidecar location"""
+    return "%s.words" % get_notes_file_location()
+
+
+def load_word_index(rebuild=True, max_log=1000):
+    """Loads the word index header, rebuilding it when stale
+
+    The sidecar holds a JSON header, mapping each token to the start and
+    length of its postings, followed by the sorted line offsets of every
+    token as one array. Notes appended since the last build are kept in
+    a log alongside it and merged into the 'recent' postings.
+    """
+    signature = get_file_signature(get_notes_file_location())
+    if not signature:
+        return None
+
+    word_index = read_word_index()
+    if word_index and word_index['signature'] == signature and \
+            len(word_index['log']) <= max_log:
+        return word_index
+
+    if not rebuild:
+        return None
+    postings, lines = build_word_index(get_notes_file_location())
+    save_word_index(postings, lines, signature)
+    return read_word_index()
+
+
+def read_word_index():
+    """Reads the word index header and its appended log"""
+    try:
+        with open(get_word_index_location(), "rb") as index_file:
+            header = index_file.readline()
+            word_index = json.loads(header.decode('utf8'))
+    except (OSError, ValueError):
+        return None
+    word_index['blob_start'] = len(header)
+    word_index['recent'] = {}
+    word_index['log'] = []
+
+    try:
+        with open("%s.log" % get_word_index_location(), "r",
+                  encoding="utf8") as log_file:
+            for entry in log_file:
+                fields = entry.rstrip('\n').split('\t')
+                if len(fields) < 3:
+                    break
+                word_index['log'].append(fields)
+                word_index['signature'] = [int(fields[0]), int(fields[1])]
+                for token in fields[3:]:
+                    word_index['recent'].setdefault(token, []).append(
+                        int(fields[2]))
+                word_index['lines'] += 1
+    except OSError:
+        pass
+    return word_index
+
+
+def build_word_index(location):
+    """Scans notes file for the line offsets of every note token"""
+    postings = {}
+    lines = 0
+    offset = 0
+    with open(location, "rb") as reading_file:
+        for raw_line in reading_file:
+            _, note = parse_note_line(raw_line.decode('utf8', 'replace'))
+            if note:
+                lines += 1
+                for word in ashaw_notes.utils.search.get_note_words(note):
+                    postings.setdefault(word, array('q')).append(offset)
+            offset += len(raw_line)
+    return postings, lines
+
+
+def save_word_index(postings, lines, signature):
+    """Atomically writes the word index and clears its log"""
+    location = get_word_index_location()
+    tokens = {}
+    start = 0
+    for token in sorted(postings):
+        tokens[token] = [start, len(postings[token])]
+        start += len(postings[token])
+    header = {
+        'signature': signature,
+        'lines': lines,
+        'typecode': 'q',
+        'tokens': tokens,
+    }
+    try:
+        with open("%s.tmp" % location, "wb") as index_file:
+            index_file.write(json.dumps(header).encode('utf8') + b'\n')
+            for token in sorted(postings):
+                postings[token].tofile(index_file)
+        os.replace("%s.tmp" % location, location)
+        if os.path.isfile("%s.log" % location):
+            os.remove("%s.log" % location)
+    except OSError:
+        pass
+
+
+def get_word_index_entry(line_size, note):
+    """Builds the log entry of the note line just appended, None if unknown"""
+    signature = get_file_signature(get_notes_file_location())
+    if not signature:
+        return None
+    fields = [signature[0], signature[1], signature[0] - line_size]
+    fields += ashaw_notes.utils.search.get_note_words(note)
+    return "\t".join(str(field) for field in fields)
+
+
+def log_word_index_entries(entries):
+    """Appends entries to the word index log in one write"""
+    entries = [entry for entry in entries if entry]
+    if not entries:
+        return
+    with open("%s.log" % get_word_index_location(), "a",
+              encoding="utf8") as log_file:
+        log_file.write("".join("%s\n" % entry for entry in entries))
+
+
+def get_postings(index_file, word_index, token):
+    """Reads the sorted line offsets of a token"""
+    postings = array(word_index['typecode'])
+    if token in word_index['tokens']:
+        start, count = word_index['tokens'][token]
+        index_file.seek(word_index['blob_start'] + start * postings.itemsize)
+        postings.frombytes(index_file.read(count * postings.itemsize))
+    postings.extend(word_index['recent'].get(token, []))
+    return postings
+
+
+def get_indexable_runs(terms):
+    """Returns word runs which every line matching the terms must contain
+
+    Regex terms are skipped, as are runs which could match the
+    '[Thu Jul 11 00:00:00 2013]' prefix rather than the note itself.
+    """
+    runs = set()
+    for term in terms:
+        if not is_literal(term):
+            continue
+        for run in re.findall(r'\w+', term):
+            # names are capitalised so only their tails can match
+            if run.isdigit() or any(
+                    run in name[1:] for name in __timestamp_names__):
+                continue
+            runs.add(run)
+    return runs
+
+
+def find_candidate_offsets(terms, selectivity=8):
+    """Intersects word postings into the offsets of candidate lines
+
+    Returns None when the index cannot help, either because no term is
+    indexable or because the candidates would cover more than one in
+    selectivity lines, where a block scan is cheaper.
+    """
+    runs = get_indexable_runs(terms)
+    if not runs:
+        return None
+    word_index = load_word_index()
+    if not word_index:
+        return None
+
+    vocabulary = set(word_index['tokens']) | set(word_index['recent'])
+    run_tokens = {}
+    for run in runs:
+        run_tokens[run] = [token for token in vocabulary if run in token]
+
+    def count(run):
+        """Counts the postings a run would read"""
+        return sum(word_index['tokens'].get(token, [0, 0])[1] +
+                   len(word_index['recent'].get(token, []))
+                   for token in run_tokens[run])
+
+    runs = sorted(runs, key=count)
+    if count(runs[0]) * selectivity > word_index['lines']:
+        return None
+
+    candidates = None
+    with open(get_word_index_location(), "rb") as index_file:
+        for run in runs:
+            offsets = set()
+            for token in run_tokens[run]:
+                offsets.update(get_postings(index_file, word_index, token))
+            candidates = offsets if candidates is None else candidates & offsets
+            if not candidates:
+                break
+    return sorted(candidates)
+
+
+def is_header_current(timestamp):
+    """Checks for the timestamp's header without rescanning the notes file
+
+    Notes are appended in order, so only the most recent header needs
+    to be read. Back-dated notes fall back to a full is_header_found scan.
+    """
+    location = get_notes_file_location()
+    if not os.path.isfile(location):
+        return False
+
+    header = get_date_header(timestamp)
+    last_header = get_last_header(location)
+    if last_header is None or header > last_header:
+        return False
+    if header == last_header:
+        return True
+
+    with open(location, "r", encoding="utf8") as reading_file:
+        return is_header_found(reading_file, timestamp)
+
+
+def get_last_header(location, block_size=4096):
+    """Reads the notes file backwards until the most recent header"""
+    with open(location, "rb") as reading_file:
+        position = reading_file.seek(0, os.SEEK_END)
+        remainder = b''
+        while position > 0:
+            size = min(block_size, position)
+            position -= size
+            reading_file.seek(position)
+            lines = (reading_file.read(size) + remainder).split(b'\n')
+            # the first piece may be a partial line until the file start
+            remainder = lines.pop(0) if position else b''
+            for line in reversed(lines):
+                header = __header_regex__.match(
+                    line.decode('utf8', 'replace').rstrip('\r'))
+                if header:
+                    return header.group(1)
+    return None
 
 
 def is_header_found(file, timestamp):
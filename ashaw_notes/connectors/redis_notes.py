@@ -2,11 +2,16 @@
 
 """ Redis Note Connector module
 """
-import re
 import time
+import calendar
 import redis
-import uuid
+import json
+import hashlib
+import itertools
+import threading
+import ashaw_notes.utils.cache
 import ashaw_notes.utils.search
+import ashaw_notes.utils.snapshot
 import ashaw_notes.utils.configuration
 
 
@@ -26,6 +31,11 @@ def save_note(timestamp, note):
     add_redis_note(timestamp, note)
 
 
+def save_notes(notes):
+    """Saves (timestamp, note) pairs in pipelined batches"""
+    add_redis_notes(notes)
+
+
 def delete_note(timestamp):
     """Removes note at supplied timestamp"""
     delete_redis_note(timestamp)
@@ -45,107 +55,279 @@ def find_notes(search_terms):
     return find_redis_notes(request)
 
 
-def get_common_words():
-    """Finds all common words in Redis"""
-    redis_connection = get_redis_connection()
-    words = redis_connection.keys(get_word_key("*"))
-    return set([word[2:].decode('utf-8') for word in words])
+def iter_notes(search_terms, newest_first=True):
+    """Yields notes corresponding to supplied search object one at a time"""
+    request = ashaw_notes.utils.search.get_search_request(search_terms)
+    return iter_redis_notes(request, newest_first)
 
 
-# Module Specific Methods
+def get_common_words():
+    """Finds the most used words in Redis"""
+    return set(get_top_words(get_common_words_limit()))
 
-__redis__ = None  # reduces the number of simultaneous redis connections
 
+def complete(prefix, limit=0):
+    """Returns the words starting with a prefix in lexical order"""
+    return get_lexicon_words(prefix, limit)
 
-def add_redis_note(timestamp, note):
-    """Adds a note to redis"""
-    redis_connection = get_redis_connection()
-    note_key = get_note_key(timestamp)
-    watch_key = get_watch_key(timestamp)
-    if redis_connection.exists(note_key) or redis_connection.exists(watch_key):
-        # no duplicates are allowed
-        # add a little bit to the timestamp and try again
-        logger.warning("%s already exists, " \
-                    "adding 1 to timestamp and trying note " \
-                    "\"%s\" again", timestamp, note)
-        return add_redis_note(timestamp + 1, note)
 
-    with redis_connection.pipeline() as pipe:
-        try:
-            start_watch(watch_key, pipe)
-
-            tokens = get_note_tokens(timestamp, note)
-            logger.debug("Adding %s tokens", len(tokens))
-            for token in tokens:
-                add_note_token(pipe, token, timestamp)
+# Module Specific Methods
 
-            # add source token
-            add_note_token(pipe, get_note_source_key(), timestamp)
+__redis__ = None  # shares one connection pool across the process
+__redis_lock__ = threading.Lock()
+
+# the indexes load_indexes marks built in the indexes hash
+__indexes__ = ('timeline', 'vocabulary', 'sources', 'dates', 'lexicon')
+
+# KEYS: timeline, vocabulary, version, source, sources, note sources,
+#       built indexes, lexicon
+# ARGV: timestamp, note, built indexes required, bucketed layout, words...
+__insert_script__ = """
+if redis.call('HLEN', KEYS[7]) < tonumber(ARGV[3]) then
+    return false
+end
+
+local timestamp = tonumber(ARGV[1])
+while redis.call('EXISTS', 'note_' .. timestamp) == 1
+        or redis.call('HEXISTS', 'bucket_' .. math.floor(timestamp / 86400),
+                      timestamp) == 1 do
+    timestamp = timestamp + 1
+end
+
+for index = 5, #ARGV do
+    local word = ARGV[index]
+    redis.call('SADD', 'w_' .. word, timestamp)
+    local count = tonumber(redis.call('ZSCORE', KEYS[2], word) or 0)
+    redis.call('ZADD', KEYS[2], count + 1, word)
+    redis.call('ZADD', KEYS[8], 0, word)
+end
+
+-- the UTC date keys of get_date_keys, from days since the epoch
+local days = math.floor(timestamp / 86400)
+local era = math.floor((days + 719468) / 146097)
+local day_of_era = days + 719468 - era * 146097
+local year_of_era = math.floor((day_of_era - math.floor(day_of_era / 1460)
+    + math.floor(day_of_era / 36524) - math.floor(day_of_era / 146096)) / 365)
+local day_of_year = day_of_era - (365 * year_of_era
+    + math.floor(year_of_era / 4) - math.floor(year_of_era / 100))
+local month_index = math.floor((5 * day_of_year + 2) / 153)
+local day = day_of_year - math.floor((153 * month_index + 2) / 5) + 1
+local month = month_index < 10 and month_index + 3 or month_index - 9
+local year = year_of_era + era * 400 + (month <= 2 and 1 or 0)
+redis.call('SADD', 'year_' .. year, timestamp)
+redis.call('SADD', string.format('m_%04d-%02d', year, month), timestamp)
+redis.call('SADD', string.format('d_%04d-%02d-%02d', year, month, day),
+           timestamp)
+
+redis.call('SADD', KEYS[4], timestamp)
+redis.call('SADD', KEYS[5], KEYS[4])
+redis.call('HSET', KEYS[6], timestamp, KEYS[4])
+redis.call('ZADD', KEYS[1], timestamp, timestamp)
+redis.call('INCR', KEYS[3])
+if tonumber(ARGV[4]) == 1 then
+    redis.call('HSET', 'bucket_' .. days, timestamp, ARGV[2])
+else
+    redis.call('SET', 'note_' .. timestamp, ARGV[2])
+end
+return timestamp
+"""
 
-            logger.debug("Adding %s note", timestamp)
-            pipe.set(get_note_key(timestamp), note)
+# KEYS: vocabulary, lexicon
+# ARGV: words of removed notes
+__prune_script__ = """
+for index = 1, #ARGV do
+    if not redis.call('ZSCORE', KEYS[1], ARGV[index]) then
+        redis.call('ZREM', KEYS[2], ARGV[index])
+    end
+end
+"""
 
-            # Run pipe commands
-            pipe.execute()
+# KEYS: lexicon, result
+# ARGV: lexical range start, lexical range end, ttl
+__prefix_script__ = """
+local unpack = table.unpack or unpack
+local words = redis.call('ZRANGEBYLEX', KEYS[1], ARGV[1], ARGV[2])
+redis.call('DEL', KEYS[2])
+for first = 1, #words, 1000 do
+    local word_keys = {}
+    for index = first, math.min(first + 999, #words) do
+        word_keys[#word_keys + 1] = 'w_' .. words[index]
+    end
+    redis.call('SUNIONSTORE', KEYS[2], KEYS[2], unpack(word_keys))
+end
+redis.call('EXPIRE', KEYS[2], tonumber(ARGV[3]))
+return #words
+"""
 
-            # Clear out watch key
-            redis_connection.delete(watch_key)
-        except redis.WatchError:
-            # Redis has updated against the watch variable
-            logger.error("Watch failed on %s - \"%s\". " \
-                            "Attemping insert again.", watch_key, note)
-            add_redis_note(timestamp, note)
 
+def add_redis_note(timestamp, note):
+    """Adds a note to redis with a single atomic script call
 
-def add_note_token(pipe, token, timestamp):
-    """Adds note token to redis pipe"""
-    pipe.sadd(token, timestamp)
+    Returns the timestamp the note was saved at, as a taken timestamp
+    moves the note on to the next free second.
+    """
+    redis_connection = get_redis_connection()
+    keys = get_insert_keys()
+    buckets = use_buckets()
+    logger.debug("Adding %s note", timestamp)
+    saved_timestamp = eval_insert(
+        redis_connection, keys, timestamp, note, buckets=buckets)
+    if saved_timestamp is None:
+        # the script refuses to write into half built indexes
+        load_indexes()
+        saved_timestamp = eval_insert(
+            redis_connection, keys, timestamp, note,
+            indexes_loaded=True, buckets=buckets)
+
+    log_moved_note(timestamp, note, saved_timestamp)
+    return saved_timestamp
+
+
+def add_redis_notes(notes, batch_size=500):
+    """Adds notes to redis with one pipelined round trip per batch
+
+    Returns the timestamps the notes were saved at.
+    """
+    redis_connection = get_redis_connection()
+    keys = get_insert_keys()
+    buckets = use_buckets()
+    load_indexes()
+    saved_timestamps = []
+    notes = iter(notes)
+    while True:
+        batch = list(itertools.islice(notes, batch_size))
+        if not batch:
+            break
+        logger.debug("Adding %s notes", len(batch))
+        # every script call stays atomic, the batch needs no transaction
+        with redis_connection.pipeline(transaction=False) as pipe:
+            for timestamp, note in batch:
+                eval_insert(pipe, keys, timestamp, note,
+                            indexes_loaded=True, buckets=buckets)
+            batch_timestamps = pipe.execute()
+        for (timestamp, note), saved_timestamp in zip(batch, batch_timestamps):
+            log_moved_note(timestamp, note, saved_timestamp)
+        saved_timestamps += batch_timestamps
+    return saved_timestamps
+
+
+def get_insert_keys():
+    """Generates the keynames passed to the insert script"""
+    return [get_timeline_key(), get_vocabulary_key(), get_version_key(),
+            get_note_source_key(), get_sources_key(), get_note_sources_key(),
+            get_indexes_key(), get_lexicon_key()]
+
+
+def eval_insert(client, keys, timestamp, note, indexes_loaded=False,
+                buckets=False):
+    """Runs the insert script for a note on a connection or pipe"""
+    required = 0 if indexes_loaded else len(__indexes__)
+    arguments = [timestamp, note, required, int(buckets)]
+    arguments += ashaw_notes.utils.search.get_note_words(note)
+    return client.eval(__insert_script__, len(keys), *(keys + arguments))
+
+
+def log_moved_note(timestamp, note, saved_timestamp):
+    """Warns about notes saved past their requested timestamp"""
+    if saved_timestamp != timestamp:
+        logger.warning("%s already exists, " \
+                       "note \"%s\" saved at %s instead",
+                       timestamp, note, saved_timestamp)
 
 
 def delete_redis_note(timestamp):
     """Removes a note from redis"""
-    redis_connection = get_redis_connection()
-    note_key = get_note_key(timestamp)
-    watch_key = get_watch_key(timestamp)
+    delete_redis_notes([timestamp])
 
-    if not redis_connection.exists(note_key):
-        logger.warning("Attempted to delete non-existing note: %s", timestamp)
-        return
 
-    if redis_connection.exists(watch_key):
-        logger.error("Existing opperation on %s", watch_key)
-        raise RuntimeWarning("%s was found! Update against %s in progress", watch_key, timestamp)
+def delete_redis_notes(timestamps, batch_size=1000):
+    """Removes notes from redis in pipelined batches
 
-    with redis_connection.pipeline() as pipe:
-        start_watch(watch_key, pipe)
-        # get current notes tokens
-        note = pipe.get(get_note_key(timestamp)).decode('utf-8')
+    Every batch is read and removed in one transaction watching its note
+    keys and the version counter, so a tag's notes are cleaned up with a
+    couple of round trips per batch.
+    """
+    timestamps = list(timestamps)
+    redis_connection = get_redis_connection()
+    buckets = use_buckets()
+    load_indexes()
+    for start in range(0, len(timestamps), batch_size):
+        batch = timestamps[start:start + batch_size]
+        redis_connection.transaction(
+            lambda pipe, batch=batch: delete_note_batch(pipe, batch, buckets),
+            get_version_key(),
+            *set(get_storage_key(timestamp, buckets) for timestamp in batch))
+
+
+def delete_note_batch(pipe, timestamps, buckets=False):
+    """Queues the removal of notes on a pipe watching their storage keys"""
+    # read through the connection, the watch still guards the notes
+    notes = fetch_notes(timestamps, buckets)
+    sources = pipe.hmget(get_note_sources_key(), timestamps)
+    version = int(pipe.get(get_version_key()) or 0)
+
+    registered_sources = []
+    if any(note is not None and source is None
+           for note, source in zip(notes, sources)):
+        # notes saved before the source mapping may be in any source
+        registered_sources = pipe.smembers(get_sources_key())
+
+    # Return pipe to multi mode
+    pipe.multi()
+    deleted = []
+    words = set()
+    for timestamp, note, source in zip(timestamps, notes, sources):
+        if note is None:
+            logger.warning("Attempted to delete non-existing note: %s",
+                           timestamp)
+            continue
+        deleted.append(timestamp)
+
+        note = note.decode('utf-8')
         tokens = get_note_tokens(timestamp, note)
-        sources = pipe.keys("source_*")
-        # Return pipe to multi mode
-        pipe.multi()
-
         logger.debug("Deleting %s tokens", len(tokens))
         for token in tokens:
             pipe.srem(token, timestamp)
+        for word in ashaw_notes.utils.search.get_note_words(note):
+            pipe.zincrby(get_vocabulary_key(), word, -1)
+            words.add(word)
 
         logger.debug("Deleting %s note", timestamp)
-        pipe.delete(get_note_key(timestamp))
+        if buckets:
+            pipe.hdel(get_bucket_key(timestamp), timestamp)
+        else:
+            pipe.delete(get_note_key(timestamp))
 
         logger.debug("Deleting %s note source", timestamp)
-        for source in sources:
-            pipe.srem(source, timestamp)
+        for source_key in [source] if source else registered_sources:
+            pipe.srem(source_key, timestamp)
+        pipe.hdel(get_note_sources_key(), timestamp)
+
+        pipe.zrem(get_timeline_key(), timestamp)
 
-        # Run pipe commands
-        pipe.execute()
+    # words no longer used by any note leave the vocabulary
+    pipe.zremrangebyscore(get_vocabulary_key(), '-inf', 0)
+    if words:
+        pipe.eval(__prune_script__, 2, get_vocabulary_key(),
+                  get_lexicon_key(), *sorted(words))
 
-        # Clear out watch key
-        redis_connection.delete(watch_key)
+    if deleted:
+        # the watched counter makes version + 1 the batch's version
+        pipe.incr(get_version_key())
+        log_deleted_notes(pipe, deleted, version + 1)
 
 
-def get_watch_key(timestamp):
-    """Generates watch keyname for note"""
-    return "watch_%s" % timestamp
+def log_deleted_notes(pipe, timestamps, version):
+    """Queues the logging of deleted notes against the version removing them
+
+    Clients evict cached bodies logged past their cached version. The
+    log is trimmed to its newest entries.
+    """
+    pipe.zadd(get_deleted_notes_key(),
+              *itertools.chain.from_iterable(
+                  (version, timestamp) for timestamp in timestamps))
+    pipe.zremrangebyrank(get_deleted_notes_key(),
+                         0, -DELETED_NOTES_LOG_SIZE - 1)
 
 
 def get_note_key(timestamp):
@@ -153,6 +335,18 @@ def get_note_key(timestamp):
     return "note_%s" % timestamp
 
 
+def get_bucket_key(timestamp):
+    """Generates redis keyname for the hash of a UTC day's notes"""
+    return "bucket_%s" % (int(timestamp) // 86400)
+
+
+def get_storage_key(timestamp, buckets=False):
+    """Generates the keyname a note is stored under in a layout"""
+    if buckets:
+        return get_bucket_key(timestamp)
+    return get_note_key(timestamp)
+
+
 def get_note_source_key():
     """Generates redis source keyname for note"""
     config = ashaw_notes.utils.configuration.load_config()
@@ -160,122 +354,761 @@ def get_note_source_key():
     return "source_%s" % source
 
 
+def get_sources_key():
+    """Generates redis keyname for the set of all source keynames"""
+    return "sources"
+
+
+def get_note_sources_key():
+    """Generates redis keyname for the hash of each note's source keyname"""
+    return "sources_by_note"
+
+
+def get_timeline_key():
+    """Generates redis keyname for the timestamp sorted set of notes"""
+    return "timeline"
+
+
+def get_version_key():
+    """Generates redis keyname for the counter bumped by every write"""
+    return "notes_version"
+
+
+def get_deleted_notes_key():
+    """Generates redis keyname for the sorted set of notes deleted by version"""
+    return "deleted_notes"
+
+
+def get_vocabulary_key():
+    """Generates redis keyname for the sorted set of word usage counts"""
+    return "vocabulary"
+
+
+def get_lexicon_key():
+    """Generates redis keyname for the lexically sorted set of words"""
+    return "lexicon"
+
+
+def get_prefix_key(prefix):
+    """Generates redis keyname for the union of a prefix's word sets"""
+    return "prefix_%s" % prefix.lower()
+
+
+def get_term_key(term):
+    """Generates redis keyname for a search term, prefix* terms included"""
+    if len(term) > 1 and term.endswith('*'):
+        return get_prefix_key(term[:-1])
+    return get_word_key(term)
+
+
 def get_word_key(word):
     """Generates redis keyname for word"""
     return "w_%s" % word.lower()
 
 
+def get_indexes_key():
+    """Generates redis keyname for the hash marking each built index"""
+    return "indexes"
+
+
 def get_date_keys(timestamp):
     """Generates redis keysnames for timestamp"""
     note_time = time.gmtime(timestamp)
     return [
         "year_%s" % note_time.tm_year,
-        "month_%s" % note_time.tm_mon,
-        "day_%s" % note_time.tm_mday,
-        "hour_%s" % note_time.tm_hour,
-        "weekday_%s" % note_time.tm_wday,
+        "m_%04d-%02d" % note_time[:2],
+        "d_%04d-%02d-%02d" % note_time[:3],
     ]
 
 
+def get_date_filter_key(start, end):
+    """Returns the date key holding exactly the UTC day or month bounded"""
+    if start is None or end is None:
+        return None
+    first_day = time.gmtime(start)
+    if first_day[3:6] != (0, 0, 0):
+        return None
+    if end == start + 86399:
+        return "d_%04d-%02d-%02d" % first_day[:3]
+    days = calendar.monthrange(*first_day[:2])[1]
+    if first_day.tm_mday == 1 and end == start + days * 86400 - 1:
+        return "m_%04d-%02d" % first_day[:2]
+    return None
+
+
 def get_note_tokens(timestamp, line):
     """Generates a list of tokens for a supplied note"""
-    tokens = []
-    parts = re.findall(r'(\w+)', line)
-    for part in parts:
-        token = get_word_key(part.lower())
-        if token not in tokens:
-            tokens.append(get_word_key(part.lower()))
-
-    parts = re.findall(r'(#[A-z0-9-_]+)', line)
-    for part in parts:
-        token = get_word_key(part.lower())
-        if token not in tokens:
-            tokens.append(get_word_key(part.lower()))
-
+    tokens = [get_word_key(word)
+              for word in ashaw_notes.utils.search.get_note_words(line)]
     tokens += get_date_keys(timestamp)
     return tokens
 
 
-def start_watch(watch_key, pipe):
-    """Adds watch to redis pipe"""
-    # Create watch key
-    get_redis_connection().set(watch_key, uuid.uuid4())
-    # Start the watch
-    pipe.watch(watch_key)
-
-
 def find_redis_notes(search_request):
     """Finds all notes related to the request"""
     logger.debug("Finding notes")
+    snapshot = load_notes_snapshot(search_request)
+    if snapshot:
+        notes = list(ashaw_notes.utils.search.page_notes(
+            snapshot.iter_notes(*get_timestamp_bounds(search_request),
+                                newest_first=True), search_request))
+        notes.reverse()
+        return notes or [(None, None)]
+
+    # pages are counted from the newest note
+    timestamps = get_redis_timestamps(search_request, newest_first=True)
+    timestamps.reverse()
+
+    if not timestamps:
+        return [(None, None)]
+
+    return list(zip(timestamps, get_redis_notes(timestamps)))
+
+
+def iter_redis_notes(search_request, newest_first=True, batch_size=1000):
+    """Streams the notes related to the request, fetching them in batches"""
+    snapshot = load_notes_snapshot(search_request)
+    if snapshot:
+        yield from ashaw_notes.utils.search.page_notes(
+            snapshot.iter_notes(*get_timestamp_bounds(search_request),
+                                newest_first=newest_first), search_request)
+        return
+
+    timestamps = get_redis_timestamps(search_request, newest_first)
+    for start in range(0, len(timestamps), batch_size):
+        batch = timestamps[start:start + batch_size]
+        yield from zip(batch, get_redis_notes(batch))
+
+
+def get_redis_timestamps(search_request, newest_first=False):
+    """Returns the ordered timestamps of the notes related to the request
+
+    Filtered requests are resolved on the server into a result sorted
+    set kept for a short while, so later pages of the same search only
+    range over it. Pages are cut with LIMIT. Results are also cached
+    locally until the notes version moves on.
+    """
+    required_keys = sorted(set(get_term_key(term)
+                               for term in search_request.inclusion_terms))
+    excluded_keys = sorted(set(get_term_key(term)
+                               for term in search_request.exclusion_terms))
+
+    start, end = get_timestamp_bounds(search_request)
+    date_key = get_date_filter_key(start, end)
+    if date_key and (required_keys or excluded_keys):
+        # the day or month set bounds the intersection's work
+        required_keys = sorted(required_keys + [date_key])
+    # excluded notes score -inf, so even open ranges leave them out
+    score_range = ('(-inf' if start is None else start,
+                   '+inf' if end is None else end)
+    page = {}
+    if search_request.is_paged():
+        page = {'start': search_request.page_index * search_request.page_limit,
+                'num': search_request.page_limit}
+
+    version = sync_caches()
+    query = (tuple(required_keys), tuple(excluded_keys), score_range,
+             tuple(sorted(page.items())), newest_first)
+    timestamps = get_query_cache().get(query)
+    if timestamps is None:
+        timestamps = query_redis_timestamps(
+            version, required_keys, excluded_keys, score_range,
+            newest_first, page)
+        get_query_cache().set(query, timestamps)
+    return list(timestamps)
+
+
+def query_redis_timestamps(version, required_keys, excluded_keys,
+                           score_range, newest_first, page):
+    """Resolves the timestamps of a normalised request on the server"""
     redis_connection = get_redis_connection()
-    timestamps = set([])
-
-    required_keys = []
-    excluded_keys = []
-
-    logger.debug("Building Redis Keys")
-    if search_request.inclusion_terms:
-        required_keys += [get_word_key(term)
-                          for term in search_request.inclusion_terms]
-    if search_request.exclusion_terms:
-        excluded_keys += [get_word_key(term)
-                          for term in search_request.exclusion_terms]
-
-    if search_request.date:
-        logger.debug("Building Redis Keys: Date")
-        date_keys = get_date_keys(
-            search_request.date.timestamp()
-        )
-        required_keys += [
-            date_keys[0],  # year
-            date_keys[1],  # month
-            date_keys[2],  # day
-        ]
-
-    logger.debug("Getting Timestamps")
+    load_timeline()
+    if not required_keys and not excluded_keys:
+        # a date alone is a single range over the timeline
+        with redis_connection.pipeline() as pipe:
+            range_results(pipe, get_timeline_key(), score_range,
+                          newest_first, page)
+            timestamps, = pipe.execute()
+        return [int(timestamp) for timestamp in timestamps]
+
+    load_date_index()
+    result_key = get_search_key(version, required_keys, excluded_keys)
+    with redis_connection.pipeline() as pipe:
+        pipe.expire(result_key, get_search_ttl())
+        range_results(pipe, result_key, score_range, newest_first, page)
+        cached, timestamps = pipe.execute()
+
+    if not cached:
+        logger.debug("Storing search results in %s", result_key)
+        prefix_keys = [key for key in required_keys + excluded_keys
+                       if key.startswith(get_prefix_key(''))]
+        if prefix_keys:
+            load_lexicon()
+        with redis_connection.pipeline() as pipe:
+            for prefix_key in prefix_keys:
+                expand_prefix(pipe, prefix_key)
+            store_results(pipe, result_key, required_keys, excluded_keys)
+            pipe.expire(result_key, get_search_ttl())
+            range_results(pipe, result_key, score_range, newest_first, page)
+            timestamps = pipe.execute()[-1]
+
+    return [int(timestamp) for timestamp in timestamps]
+
+
+def expand_prefix(pipe, prefix_key):
+    """Queues the union of the word sets of a prefix key's words"""
+    start, end = get_lexicon_range(prefix_key[len(get_prefix_key('')):])
+    pipe.eval(__prefix_script__, 2, get_lexicon_key(), prefix_key,
+              start, end, get_search_ttl())
+
+
+def store_results(pipe, result_key, required_keys, excluded_keys):
+    """Queues the commands storing a search's notes scored by timestamp"""
+    source_key = get_timeline_key()
     if required_keys:
-        # filter against required note keys
-        timestamps = redis_connection.sinter(required_keys)
+        # only the timeline contributes its timestamp to the scores
+        weights = dict((key, 0) for key in required_keys)
+        weights[source_key] = 1
+        pipe.zinterstore(result_key, weights)
+        source_key = result_key
+    if excluded_keys:
+        # there is no ZDIFFSTORE before Redis 6.2, so excluded notes
+        # are scored down to -inf instead
+        weights = dict((key, float('-inf')) for key in excluded_keys)
+        weights[source_key] = 1
+        pipe.zunionstore(result_key, weights)
+
+
+def range_results(pipe, key, score_range, newest_first, page):
+    """Queues the ranging of a page out of a timestamp scored set"""
+    if newest_first:
+        pipe.zrevrangebyscore(key, score_range[1], score_range[0], **page)
     else:
-        # filter against all notes if none are required
-        timestamps = set(
-            [key[len(get_note_key('')):]
-             for key in set(redis_connection.keys(get_note_key("*")))]
-        )
+        pipe.zrangebyscore(key, score_range[0], score_range[1], **page)
 
-    if timestamps and excluded_keys:
-        logger.debug("Excluding Timestamps")
-        timestamps = timestamps.difference(
-            redis_connection.sunion(excluded_keys))
 
-    logger.debug("Sorting timestamps")
-    timestamps = sorted([int(timestamp.decode('utf-8'))
-                         for timestamp in timestamps])
+def get_search_key(version, required_keys, excluded_keys):
+    """Generates the keyname caching a search's results at a notes version"""
+    terms = json.dumps([required_keys, excluded_keys])
+    return "search_%s_%s" % (
+        version, hashlib.sha1(terms.encode('utf8')).hexdigest())
 
-    if not timestamps:
-        return [(None, None)]
 
-    logger.debug("Getting Notes")
-    notes = redis_connection.mget(
-        [get_note_key(timestamp) for timestamp in timestamps])
-    logger.debug("Decoding Notes")
-    notes = [note.decode('utf-8') for note in notes]
-    logger.debug("Zipping Notes")
-    return list(zip(timestamps, notes))
+def get_search_ttl():
+    """Returns how many seconds search results are kept for paging"""
+    config = ashaw_notes.utils.configuration.load_config()
+    return int(config.get(CONFIG_SECTION, 'search_ttl', fallback=60))
 
 
-def get_redis_connection():
-    """Returns a common redis connection"""
-    global __redis__
+def get_timestamp_bounds(search_request):
+    """Returns the inclusive timestamp bounds of a request, None if open
+
+    Both single dates and date ranges select UTC days, like the date keys.
+    """
+    first, last = search_request.get_day_range() or (None, None)
+    start = end = None
+    if first:
+        start = calendar.timegm(time.strptime(first, '%Y-%m-%d'))
+    if last:
+        end = calendar.timegm(time.strptime(last, '%Y-%m-%d')) + 86399
+    return start, end
+
+
+def load_indexes():
+    """Builds every index missing from an older keyspace"""
+    if get_redis_connection().hlen(get_indexes_key()) >= len(__indexes__):
+        return
+    load_timeline()
+    load_vocabulary()
+    load_sources()
+    load_date_index()
+    load_lexicon()
+
+
+def load_index(name, rebuild, data_key=None):
+    """Builds an index once, marking it built in the indexes hash
+
+    The marker, not the index's own keys, records the build: those keys
+    are missing whenever no note feeds them. An existing data key is
+    trusted as built by an older version.
+    """
+    redis_connection = get_redis_connection()
+    if redis_connection.hexists(get_indexes_key(), name):
+        return
+    if data_key is None or not redis_connection.exists(data_key):
+        rebuild()
+    redis_connection.hset(get_indexes_key(), name, 1)
+
+
+def load_date_index():
+    """Builds the date keys when missing from an older keyspace"""
+    load_index('dates', rebuild_date_index)
+
 
+def rebuild_date_index(batch_size=1000):
+    """Indexes every note into its year, month and day keys
+
+    Walks the timeline in batches and drops the month, day, hour and
+    weekday keys shared across years once done. Returns the note count.
+    """
+    redis_connection = get_redis_connection()
+    load_timeline()
+    count = redis_connection.zcard(get_timeline_key())
+    for start in range(0, count, batch_size):
+        timestamps = redis_connection.zrange(
+            get_timeline_key(), start, start + batch_size - 1)
+        with redis_connection.pipeline(transaction=False) as pipe:
+            for timestamp in timestamps:
+                for date_key in get_date_keys(int(timestamp)):
+                    pipe.sadd(date_key, timestamp)
+            pipe.execute()
+
+    for pattern in ("month_*", "day_*", "hour_*", "weekday_*"):
+        legacy_keys = list(redis_connection.scan_iter(
+            match=pattern, count=batch_size))
+        for start in range(0, len(legacy_keys), batch_size):
+            redis_connection.delete(*legacy_keys[start:start + batch_size])
+    redis_connection.hset(get_indexes_key(), 'dates', 1)
+    logger.debug("Indexed the dates of %s notes", count)
+    return count
+
+
+def load_sources():
+    """Registers the source keys of an older keyspace"""
+    load_index('sources', rebuild_sources, get_sources_key())
+
+
+def rebuild_sources():
+    """Registers every source key found with SCAN"""
+    redis_connection = get_redis_connection()
+    source_keys = list(redis_connection.scan_iter(
+        match="source_*", count=1000))
+    if source_keys:
+        redis_connection.sadd(get_sources_key(), *source_keys)
+
+
+def load_timeline():
+    """Builds the timeline when missing from an older keyspace"""
+    load_index('timeline', rebuild_timeline, get_timeline_key())
+
+
+def rebuild_timeline(batch_size=1000):
+    """Indexes every stored note into the timestamp sorted set
+
+    Walks the note and bucket keys with SCAN so the server is never
+    blocked.
+    """
+    redis_connection = get_redis_connection()
+    timestamps = [key[len(get_note_key('')):].decode('utf-8')
+                  for key in redis_connection.scan_iter(
+                      match=get_note_key("*"), count=batch_size)]
+    for bucket_key in redis_connection.scan_iter(
+            match="bucket_*", count=batch_size):
+        timestamps += [timestamp.decode('utf-8') for timestamp
+                       in redis_connection.hkeys(bucket_key)]
+    logger.debug("Indexing %s notes into the timeline", len(timestamps))
+    for start in range(0, len(timestamps), batch_size):
+        with redis_connection.pipeline() as pipe:
+            for timestamp in timestamps[start:start + batch_size]:
+                pipe.zadd(get_timeline_key(), int(timestamp), timestamp)
+            pipe.execute()
+
+
+def get_common_words_limit():
+    """Returns how many words completers are offered, 0 being all"""
+    config = ashaw_notes.utils.configuration.load_config()
+    return int(config.get(CONFIG_SECTION, 'common_words_limit', fallback=0))
+
+
+def get_top_words(limit=0):
+    """Returns the most used words, most used first"""
+    load_vocabulary()
+    return [word.decode('utf-8') for word in get_redis_connection().zrevrange(
+        get_vocabulary_key(), 0, limit - 1 if limit else -1)]
+
+
+def get_lexicon_words(prefix, limit=0):
+    """Returns the words starting with a prefix from the lexicon"""
+    load_lexicon()
+    page = {'start': 0, 'num': limit} if limit else {}
+    return [word.decode('utf-8')
+            for word in get_redis_connection().zrangebylex(
+                get_lexicon_key(),
+                *get_lexicon_range(prefix.lower()), **page)]
+
+
+def get_lexicon_range(prefix):
+    """Returns the ZRANGEBYLEX bounds of the words starting with a prefix"""
+    # words compare as UTF-8, so the highest code point closes the range
+    return '[' + prefix, '(' + prefix + '\U0010ffff'
+
+
+def load_lexicon():
+    """Builds the lexicon when missing from an older keyspace"""
+    load_index('lexicon', rebuild_lexicon, get_lexicon_key())
+
+
+def rebuild_lexicon(batch_size=1000):
+    """Copies every vocabulary word into the lexicon"""
+    redis_connection = get_redis_connection()
+    load_vocabulary()
+    count = redis_connection.zcard(get_vocabulary_key())
+    logger.debug("Copying %s words into the lexicon", count)
+    for start in range(0, count, batch_size):
+        words = redis_connection.zrange(
+            get_vocabulary_key(), start, start + batch_size - 1)
+        redis_connection.zadd(get_lexicon_key(), *itertools.chain.from_iterable(
+            (0, word) for word in words))
+
+
+def load_vocabulary():
+    """Builds the vocabulary when missing from an older keyspace"""
+    load_index('vocabulary', rebuild_vocabulary, get_vocabulary_key())
+
+
+def rebuild_vocabulary(batch_size=1000):
+    """Counts the notes of every word key into the vocabulary
+
+    Walks the word keys with SCAN so the server is never blocked.
+    """
+    redis_connection = get_redis_connection()
+    word_keys = list(redis_connection.scan_iter(
+        match=get_word_key("*"), count=batch_size))
+    logger.debug("Counting %s words into the vocabulary", len(word_keys))
+    for start in range(0, len(word_keys), batch_size):
+        batch = word_keys[start:start + batch_size]
+        with redis_connection.pipeline() as pipe:
+            for word_key in batch:
+                pipe.scard(word_key)
+            counts = pipe.execute()
+        with redis_connection.pipeline() as pipe:
+            for word_key, count in zip(batch, counts):
+                if count:
+                    pipe.zadd(get_vocabulary_key(), count,
+                              word_key[len(get_word_key('')):])
+            pipe.execute()
+
+
+def get_redis_notes(timestamps):
+    """Fetches and decodes the notes stored at the given timestamps
+
+    Only the notes missing from the local cache are fetched.
+    """
+    note_cache = get_note_cache()
+    notes = [note_cache.get(timestamp) for timestamp in timestamps]
+    missing = [timestamp for timestamp, note in zip(timestamps, notes)
+               if note is None]
+    if not missing:
+        return notes
+
+    logger.debug("Getting %s Notes", len(missing))
+    fetched = {}
+    for timestamp, note in zip(missing, fetch_notes(missing, use_buckets())):
+        fetched[timestamp] = note.decode('utf-8')
+        note_cache.set(timestamp, fetched[timestamp])
+    return [fetched[timestamp] if note is None else note
+            for timestamp, note in zip(timestamps, notes)]
+
+
+def fetch_notes(timestamps, buckets=False):
+    """Fetches the raw notes stored in a layout, None where missing"""
+    redis_connection = get_redis_connection()
+    if not buckets:
+        return redis_connection.mget(
+            [get_note_key(timestamp) for timestamp in timestamps])
+
+    bucketed = {}
+    for timestamp in timestamps:
+        bucketed.setdefault(get_bucket_key(timestamp), []).append(timestamp)
+    with redis_connection.pipeline(transaction=False) as pipe:
+        for bucket_key, bucket_timestamps in bucketed.items():
+            pipe.hmget(bucket_key, bucket_timestamps)
+        notes = dict(
+            (timestamp, note)
+            for bucket_timestamps, bucket_notes
+            in zip(bucketed.values(), pipe.execute())
+            for timestamp, note in zip(bucket_timestamps, bucket_notes))
+    return [notes[timestamp] for timestamp in timestamps]
+
+
+def get_storage_layout():
+    """Returns how note bodies are stored, in note keys or day buckets"""
     config = ashaw_notes.utils.configuration.load_config()
+    return config.get(CONFIG_SECTION, 'storage_layout', fallback='keys')
+
+
+def use_buckets():
+    """Checks if note bodies are stored in hashes bucketed by day"""
+    return get_storage_layout() == 'buckets'
+
+
+def migrate_storage_layout(layout, batch_size=1000):
+    """Moves every note body into a storage layout, returning the count
+
+    Bodies are moved in timeline order, one transaction per batch. Other
+    writers should be stopped until storage_layout matches the layout.
+    """
+    if layout not in ('keys', 'buckets'):
+        raise ValueError("Unknown storage layout: %s" % layout)
+    to_buckets = layout == 'buckets'
+    redis_connection = get_redis_connection()
+    load_timeline()
+
+    moved = 0
+    for start in range(0, redis_connection.zcard(get_timeline_key()),
+                       batch_size):
+        timestamps = [int(timestamp) for timestamp in redis_connection.zrange(
+            get_timeline_key(), start, start + batch_size - 1)]
+        notes = fetch_notes(timestamps, buckets=not to_buckets)
+        with redis_connection.pipeline() as pipe:
+            for timestamp, note in zip(timestamps, notes):
+                if note is None:
+                    continue
+                if to_buckets:
+                    pipe.hset(get_bucket_key(timestamp), timestamp, note)
+                    pipe.delete(get_note_key(timestamp))
+                else:
+                    pipe.set(get_note_key(timestamp), note)
+                    pipe.hdel(get_bucket_key(timestamp), timestamp)
+                moved += 1
+            pipe.execute()
+    logger.debug("Moved %s notes into %s", moved, layout)
+    return moved
+
+
+DELETED_NOTES_LOG_SIZE = 10000
+
+__note_cache__ = None  # note bodies by timestamp
+__query_cache__ = None  # request timestamps at the cached version
+__cache_version__ = None  # the notes version both caches are valid for
+__cache_lock__ = threading.Lock()
+
+
+def get_note_cache():
+    """Returns the local cache of note bodies"""
+    global __note_cache__
+    if __note_cache__ is None:
+        config = ashaw_notes.utils.configuration.load_config()
+        __note_cache__ = ashaw_notes.utils.cache.LRUCache(
+            int(config.get(CONFIG_SECTION, 'note_cache_size', fallback=10000)))
+    return __note_cache__
+
+
+def get_query_cache():
+    """Returns the local cache of request results"""
+    global __query_cache__
+    if __query_cache__ is None:
+        config = ashaw_notes.utils.configuration.load_config()
+        __query_cache__ = ashaw_notes.utils.cache.LRUCache(
+            int(config.get(CONFIG_SECTION, 'query_cache_size', fallback=256)))
+    return __query_cache__
+
+
+def clear_caches():
+    """Forgets every locally cached note and result"""
+    global __cache_version__
+    with __cache_lock__:
+        get_note_cache().clear()
+        get_query_cache().clear()
+        __cache_version__ = None
+
+
+def sync_caches():
+    """Brings the local caches up to the notes version, returning it
+
+    Costs a GET while the version stands still. Once it moves, cached
+    results are dropped and only the bodies of notes deleted since are
+    evicted, as a saved note never changes under its timestamp.
+    """
+    global __cache_version__
+    redis_connection = get_redis_connection()
+    version = int(redis_connection.get(get_version_key()) or 0)
+    with __cache_lock__:
+        if version == __cache_version__:
+            return version
+
+        note_cache = get_note_cache()
+        if __cache_version__ is None or version < __cache_version__:
+            note_cache.clear()
+        else:
+            with redis_connection.pipeline(transaction=False) as pipe:
+                pipe.zrangebyscore(get_deleted_notes_key(),
+                                   '(%s' % __cache_version__, '+inf')
+                pipe.zcard(get_deleted_notes_key())
+                pipe.zrange(get_deleted_notes_key(), 0, 0, withscores=True)
+                deleted, logged, oldest = pipe.execute()
+            if logged >= DELETED_NOTES_LOG_SIZE and \
+                    oldest[0][1] > __cache_version__:
+                # the log was trimmed past the cached version
+                note_cache.clear()
+            for timestamp in deleted:
+                note_cache.pop(int(timestamp))
+
+        get_query_cache().clear()
+        __cache_version__ = version
+    return version
+
+
+__notes_snapshot__ = None  # the mapped snapshot of the last load
+__snapshot_thread__ = None  # the background snapshot rebuild, if any
+__snapshot_lock__ = threading.Lock()
+
+
+def get_snapshot_location():
+    """Returns where all notes are snapshotted locally, if anywhere"""
+    config = ashaw_notes.utils.configuration.load_config()
+    return config.get(CONFIG_SECTION, 'snapshot_location', fallback=None)
+
+
+def get_snapshot_signature():
+    """Returns the notes version counter a snapshot is built at"""
+    return [int(get_redis_connection().get(get_version_key()) or 0)]
+
+
+def load_notes_snapshot(search_request):
+    """Maps the local snapshot of all notes for requests it can answer
+
+    The snapshot is tagged with the notes version counter. Once a write
+    has moved the counter on it is rebuilt in the background, and None
+    is returned meanwhile so that callers query the server instead.
+    """
+    global __notes_snapshot__
+    location = get_snapshot_location()
+    if not location or search_request.inclusion_terms or \
+            search_request.exclusion_terms:
+        return None
+
+    signature = get_snapshot_signature()
+    if __notes_snapshot__ and __notes_snapshot__.signature == signature:
+        return __notes_snapshot__
+
+    snapshot = ashaw_notes.utils.snapshot.load_snapshot(location, signature)
+    if snapshot:
+        __notes_snapshot__ = snapshot
+    else:
+        start_snapshot_refresh()
+    return snapshot
+
+
+def start_snapshot_refresh():
+    """Rebuilds the notes snapshot on a background thread, one at a time"""
+    global __snapshot_thread__
+    with __snapshot_lock__:
+        if __snapshot_thread__ and __snapshot_thread__.is_alive():
+            return
+        __snapshot_thread__ = threading.Thread(
+            target=refresh_notes_snapshot, daemon=True)
+        __snapshot_thread__.start()
+
+
+def refresh_notes_snapshot():
+    """Writes the snapshot of all notes, returning if written
+
+    The version is read before the notes, so a write landing during
+    the rebuild leaves the snapshot stale rather than wrong.
+    """
+    location = get_snapshot_location()
+    if not location:
+        return False
+    signature = get_snapshot_signature()
+    timestamps = get_redis_timestamps(
+        ashaw_notes.utils.search.SearchRequest([]))
+    try:
+        ashaw_notes.utils.snapshot.write_snapshot(
+            location, zip(timestamps, get_redis_notes(timestamps)),
+            signature)
+    except OSError:
+        return False
+    return True
+
+
+def get_redis_connection():
+    """Returns a common redis client, safe to share between threads
+
+    Every command checks a connection out of the client's pool, so
+    concurrent callers never serialise on a single socket.
+    """
+    global __redis__
 
     if not __redis__:
-        __redis__ = redis.StrictRedis(
-            host=config.get(CONFIG_SECTION, 'endpoint'),
-            port=config.get(CONFIG_SECTION, 'port'),
-            db=config.get(CONFIG_SECTION, 'db'),
-            password=config.get(CONFIG_SECTION, 'password')
-        )
+        with __redis_lock__:
+            if not __redis__:
+                __redis__ = redis.StrictRedis(
+                    connection_pool=get_connection_pool())
 
     return __redis__
+
+
+def get_connection_pool():
+    """Builds the connection pool described by the config"""
+    config = ashaw_notes.utils.configuration.load_config()
+    endpoint = config.get(CONFIG_SECTION, 'endpoint')
+    connection_kwargs = {
+        'db': config.get(CONFIG_SECTION, 'db'),
+        'password': config.get(CONFIG_SECTION, 'password'),
+        'socket_timeout': get_seconds(config, 'socket_timeout'),
+    }
+
+    if endpoint.startswith('unix://') or endpoint.startswith('/'):
+        connection_kwargs['connection_class'] = \
+            redis.UnixDomainSocketConnection
+        connection_kwargs['path'] = endpoint.replace('unix://', '', 1)
+    else:
+        connection_kwargs['host'] = endpoint
+        connection_kwargs['port'] = config.get(CONFIG_SECTION, 'port')
+        connection_kwargs['socket_connect_timeout'] = get_seconds(
+            config, 'socket_connect_timeout')
+        connection_kwargs['socket_keepalive'] = config.get(
+            CONFIG_SECTION, 'socket_keepalive', fallback='1') == '1'
+
+    return HealthCheckedConnectionPool(
+        health_check_interval=get_seconds(
+            config, 'health_check_interval', 30),
+        max_connections=int(config.get(
+            CONFIG_SECTION, 'max_connections', fallback=16)),
+        timeout=get_seconds(config, 'pool_timeout', 20),
+        **connection_kwargs)
+
+
+def get_seconds(config, option, fallback=None):
+    """Reads an optional number of seconds from the config"""
+    value = config.get(CONFIG_SECTION, option, fallback=None)
+    if value is None or value == '':
+        return fallback
+    return float(value)
+
+
+class HealthCheckedConnectionPool(redis.BlockingConnectionPool):
+    """A blocking pool pinging connections left idle for too long
+
+    Connections failing the ping are dropped and transparently reopened
+    by their next command, instead of failing it.
+    """
+
+    def __init__(self, health_check_interval=None, **kwargs):
+        self.health_check_interval = health_check_interval
+        super().__init__(**kwargs)
+
+    def get_connection(self, command_name, *keys, **options):
+        connection = super().get_connection(command_name, *keys, **options)
+        if self.is_check_due(connection):
+            try:
+                connection.send_command('PING')
+                if connection.read_response() != b'PONG':
+                    raise redis.ConnectionError("Unexpected ping reply")
+            except (redis.ConnectionError, redis.TimeoutError, OSError):
+                logger.warning("Dropping unhealthy redis connection")
+                connection.disconnect()
+        return connection
+
+    def release(self, connection):
+        connection.last_used = time.time()
+        super().release(connection)
+
+    def is_check_due(self, connection):
+        """Checks if an open connection has idled past the interval"""
+        if not self.health_check_interval or \
+                getattr(connection, '_sock', None) is None:
+            return False
+        idle = time.time() - getattr(connection, 'last_used', 0)
+        return idle >= self.health_check_interval
@@ -0,0 +1,259 @@
+#!/usr/bin/python3
+
+""" SQLite Note Connector module
+"""
+import re
+import sys
+import sqlite3
+import threading
+import ashaw_notes.utils.search
+import ashaw_notes.utils.configuration
+
+
+CONFIG_SECTION = 'sqlite_notes'
+logger = ashaw_notes.utils.configuration.get_logger()
+
+
+def is_enabled():
+    """Checks if connector is enabled"""
+    backends = ashaw_notes.utils.configuration.load_config().get('base_config',
+                                                                 'data_backends')
+    return CONFIG_SECTION in backends
+
+
+def save_note(timestamp, note):
+    """Saves note to timestamp"""
+    add_sqlite_note(timestamp, note)
+
+
+def save_notes(notes):
+    """Saves (timestamp, note) pairs within a single transaction"""
+    add_sqlite_notes(notes)
+
+
+def delete_note(timestamp):
+    """Removes note at supplied timestamp"""
+    delete_sqlite_note(timestamp)
+
+
+def update_note(original_timestamp, new_timestamp, new_note):
+    """Updates note at supplied timestamp"""
+    update_sqlite_note(original_timestamp, new_timestamp, new_note)
+
+
+def find_notes(search_terms):
+    """Returns all notes corresponding to supplied search object"""
+    request = ashaw_notes.utils.search.get_search_request(search_terms)
+    return find_sqlite_notes(request)
+
+
+def iter_notes(search_terms, newest_first=True):
+    """Yields notes corresponding to supplied search object one at a time"""
+    request = ashaw_notes.utils.search.get_search_request(search_terms)
+    return iter_sqlite_notes(request, newest_first)
+
+
+def get_common_words():
+    """Finds all words indexed by the full text table"""
+    cursor = get_sqlite_connection().execute("SELECT term FROM notes_vocab")
+    return set(term for term, in cursor)
+
+
+def complete(prefix, limit=0):
+    """Returns the indexed words starting with a prefix in lexical order"""
+    prefix = prefix.lower()
+    # terms compare as UTF-8, so the highest code point closes the range
+    cursor = get_sqlite_connection().execute(
+        "SELECT term FROM notes_vocab WHERE term >= ? AND term < ? "
+        "ORDER BY term LIMIT ?", (prefix, prefix + '\U0010ffff', limit or -1))
+    return [term for term, in cursor]
+
+
+# Module Specific Methods
+
+__sqlite__ = None  # shared connection, statements are cached per connection
+__connection_lock__ = threading.Lock()
+__regex_characters__ = re.compile(r'[.^$*+?{}\[\]\\|()]')
+
+__schema__ = [
+    # the integer primary key is the table's rowid B-tree, ordered by time
+    """CREATE TABLE IF NOT EXISTS notes (
+        timestamp INTEGER PRIMARY KEY,
+        note TEXT NOT NULL
+    )""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS notes_fts USING fts5(
+        note, content='notes', content_rowid='timestamp'
+    )""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS notes_vocab
+        USING fts5vocab(notes_fts, 'row')""",
+    """CREATE TRIGGER IF NOT EXISTS notes_insert AFTER INSERT ON notes BEGIN
+        INSERT INTO notes_fts(rowid, note) VALUES (new.timestamp, new.note);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS notes_delete AFTER DELETE ON notes BEGIN
+        INSERT INTO notes_fts(notes_fts, rowid, note)
+            VALUES ('delete', old.timestamp, old.note);
+    END""",
+]
+
+
+def add_sqlite_note(timestamp, note):
+    """Adds a note to the database"""
+    connection = get_sqlite_connection()
+    with connection:
+        return insert_note(connection, timestamp, note)
+
+
+def add_sqlite_notes(notes):
+    """Adds notes to the database in one transaction"""
+    connection = get_sqlite_connection()
+    with connection:
+        return [insert_note(connection, timestamp, note)
+                for timestamp, note in notes]
+
+
+def update_sqlite_note(original_timestamp, new_timestamp, new_note):
+    """Replaces a note within a single transaction"""
+    connection = get_sqlite_connection()
+    with connection:
+        connection.execute(
+            "DELETE FROM notes WHERE timestamp = ?", (original_timestamp,))
+        return insert_note(connection, new_timestamp, new_note)
+
+
+def insert_note(connection, timestamp, note):
+    """Inserts a note within the open transaction, returning its timestamp"""
+    while True:
+        try:
+            connection.execute(
+                "INSERT INTO notes (timestamp, note) VALUES (?, ?)",
+                (timestamp, note))
+            return timestamp
+        except sqlite3.IntegrityError:
+            # no duplicates are allowed
+            # add a little bit to the timestamp and try again
+            logger.warning("%s already exists, " \
+                           "adding 1 to timestamp and trying note " \
+                           "\"%s\" again", timestamp, note)
+            timestamp += 1
+
+
+def delete_sqlite_note(timestamp):
+    """Removes a note from the database"""
+    connection = get_sqlite_connection()
+    with connection:
+        deleted = connection.execute(
+            "DELETE FROM notes WHERE timestamp = ?", (timestamp,)).rowcount
+    if not deleted:
+        logger.warning("Attempted to delete non-existing note: %s", timestamp)
+
+
+def find_sqlite_notes(search_request):
+    """Finds all notes related to the request, oldest first"""
+    if search_request.is_paged():
+        return list(reversed(list(iter_sqlite_notes(search_request))))
+    return list(iter_sqlite_notes(search_request, newest_first=False))
+
+
+def iter_sqlite_notes(search_request, newest_first=True):
+    """Streams the notes related to the request, newest first by default"""
+    query, parameters = build_search_query(search_request, newest_first)
+    cursor = get_sqlite_connection().execute(query, parameters)
+    for timestamp, note in cursor:
+        yield timestamp, note
+
+
+def build_search_query(search_request, newest_first=True):
+    """Builds the SELECT statement and parameters answering a request
+
+    Words of literal terms are looked up through the full text index and
+    confirmed as case insensitive substrings, keeping hashtags and
+    punctuation significant. Regex terms fall back to REGEXP, and dates
+    become a range over the timestamp key.
+    """
+    clauses = []
+    parameters = []
+
+    phrases = []
+    for term in search_request.inclusion_terms:
+        if not is_literal(term):
+            clauses.append("note REGEXP ?")
+            parameters.append(r'(?:%s)\b' % term)
+            continue
+        words = re.findall(r'\w+', term)
+        if words:
+            phrases.append('"%s"' % ' '.join(words))
+        clauses.append("instr(lower(note), ?) > 0")
+        parameters.append(term)
+    if phrases:
+        clauses.insert(0, "timestamp IN "
+                       "(SELECT rowid FROM notes_fts WHERE notes_fts MATCH ?)")
+        parameters.insert(0, ' AND '.join(phrases))
+
+    for term in search_request.exclusion_terms:
+        if is_literal(term):
+            clauses.append("instr(lower(note), ?) = 0")
+        else:
+            clauses.append("NOT note REGEXP ?")
+        parameters.append(term)
+
+    timestamp_range = search_request.get_timestamp_range()
+    if timestamp_range:
+        start, end = timestamp_range
+        if start is not None:
+            clauses.append("timestamp >= ?")
+            parameters.append(start)
+        if end is not None:
+            clauses.append("timestamp <= ?")
+            parameters.append(end)
+
+    query = "SELECT timestamp, note FROM notes"
+    if clauses:
+        query += " WHERE %s" % " AND ".join(clauses)
+    query += " ORDER BY timestamp %s" % ("DESC" if newest_first else "ASC")
+    if search_request.is_paged():
+        query += " LIMIT ? OFFSET ?"
+        parameters += [search_request.page_limit,
+                       search_request.page_index * search_request.page_limit]
+    return query, parameters
+
+
+def is_literal(term):
+    """Checks if a search term holds no regex syntax"""
+    return not __regex_characters__.search(term)
+
+
+def regexp(pattern, value):
+    """Implements the REGEXP operator, ignoring case like the full text index"""
+    if value is None:
+        return False
+    return re.search(pattern, value, re.IGNORECASE) is not None
+
+
+def get_database_location():
+    """Returns the database location from the config"""
+    config = ashaw_notes.utils.configuration.load_config()
+    return config.get(CONFIG_SECTION, 'location')
+
+
+def get_sqlite_connection():
+    """Returns a common sqlite connection, creating the schema on first use"""
+    global __sqlite__
+
+    with __connection_lock__:
+        if not __sqlite__:
+            connection = sqlite3.connect(
+                get_database_location(),
+                check_same_thread=False,
+                cached_statements=256)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            # deterministic functions are only accepted from Python 3.8
+            function_flags = {'deterministic': True} \
+                if sys.version_info >= (3, 8) else {}
+            connection.create_function("REGEXP", 2, regexp, **function_flags)
+            with connection:
+                for statement in __schema__:
+                    connection.execute(statement)
+            __sqlite__ = connection
+
+    return __sqlite__
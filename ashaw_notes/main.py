@@ -6,6 +6,7 @@
 import click
 import ashaw_notes.scripts.quicknote
 import ashaw_notes.scripts.migration
+import ashaw_notes.scripts.snapshot
 import ashaw_notes.gui.main
 
 @click.group()
@@ -32,9 +33,38 @@ def migrate(source, target):
     """Migrates notes from one backend to another"""
     ashaw_notes.scripts.migration.run(source, target)
 
+@click.command('migrate-layout')
+@click.argument('layout', type=click.Choice(['keys', 'buckets']))
+def migrate_layout(layout):
+    """Moves redis note bodies into note keys or day buckets"""
+    ashaw_notes.scripts.migration.run_layout_migration(layout)
+
+@click.command('migrate-date-index')
+def migrate_date_index():
+    """Rebuilds the redis date keys of every note"""
+    ashaw_notes.scripts.migration.run_date_index_migration()
+
+@click.command('snapshot-export')
+@click.argument('source')
+@click.argument('location')
+def snapshot_export(source, location):
+    """Exports all notes of a backend to a snapshot file"""
+    ashaw_notes.scripts.snapshot.export_notes(source, location)
+
+@click.command('snapshot-import')
+@click.argument('location')
+@click.argument('target')
+def snapshot_import(location, target):
+    """Imports the notes of a snapshot file into a backend"""
+    ashaw_notes.scripts.snapshot.import_notes(location, target)
+
 cli.add_command(gui)
 cli.add_command(quicknote)
 cli.add_command(migrate)
+cli.add_command(migrate_layout)
+cli.add_command(migrate_date_index)
+cli.add_command(snapshot_export)
+cli.add_command(snapshot_import)
 
 if __name__ == '__main__':
     cli()
@@ -1,6 +1,8 @@
 """ Date Handler Module
 """
 import re
+import calendar
+from datetime import datetime
 import dateparser
 from ashaw_notes.plugins import base_plugin
 from ashaw_notes.utils.search import timestamp_to_datestring
@@ -12,21 +14,61 @@ class Plugin(base_plugin.Plugin):
 
     logger = ashaw_notes.utils.configuration.get_logger()
     regex = re.compile(r"^today:", re.IGNORECASE)
+    month_regex = re.compile(r"^\d{4}-(0?[1-9]|1[0-2])$")
 
     def process_search_request(self, search_request):
         """Updates search request based on plugin parameters"""
-        for term in search_request.inclusion_terms:
-            if term[0:5] != 'date:':
+        for term in list(search_request.inclusion_terms):
+            prefix, _, date_term = term.partition(':')
+            first, last = search_request.date_range or (None, None)
+            if prefix == 'date' and '..' in date_term:
+                first_term, _, last_term = date_term.partition('..')
+                first = self.parse_date(first_term)
+                last = self.parse_date(last_term, last_day=True)
+                parsed = first or last
+            elif prefix == 'date' and Plugin.month_regex.match(date_term):
+                first, last = parsed = self.get_month_range(date_term)
+            elif prefix == 'since':
+                first = parsed = self.parse_date(date_term)
+            elif prefix == 'until':
+                last = parsed = self.parse_date(date_term, last_day=True)
+            elif prefix == 'date':
+                date = self.parse_date(date_term)
+                if date:
+                    search_request.inclusion_terms.remove(term)
+                    search_request.date = date
                 continue
-            date_term = term[5:]
-            self.logger.debug("Parsing %s", date_term)
-            date = dateparser.parse(date_term)
-            self.logger.debug("Date Parsed")
-            if date:
+            else:
+                continue
+
+            if parsed:
                 search_request.inclusion_terms.remove(term)
-                search_request.date = date
+                search_request.date_range = (first, last)
         return search_request
 
+    def parse_date(self, date_term, last_day=False):
+        """Parses a date term, allowing underscores for spaces
+
+        YYYY-MM months resolve to their first day, or their last day
+        when closing a range.
+        """
+        if not date_term:
+            return None
+        if Plugin.month_regex.match(date_term):
+            return self.get_month_range(date_term)[int(last_day)]
+        date_term = date_term.replace('_', ' ')
+        self.logger.debug("Parsing %s", date_term)
+        date = dateparser.parse(date_term)
+        self.logger.debug("Date Parsed")
+        return date
+
+    @staticmethod
+    def get_month_range(month_term):
+        """Returns the first and last day of a YYYY-MM month"""
+        year, month = [int(part) for part in month_term.split('-')]
+        last_day = calendar.monthrange(year, month)[1]
+        return datetime(year, month, 1), datetime(year, month, last_day)
+
     def format_note_line(self, timestamp, note_line):
         """Allows enabled plugins to modify note display"""
         note_line = Plugin.regex.sub(
@@ -4,6 +4,7 @@
 """
 
 import sys
+from ashaw_notes.connectors import redis_notes
 from ashaw_notes.utils.connection_manager import ConnectionManager
 from ashaw_notes.utils.search import timestamp_to_datestring
 
@@ -25,14 +26,35 @@ def run(source_name, target_name):
 
 def migrate_notes(source, target):
     """Migrations notes from source connector to target connector"""
-    notes = source.find_notes([])
+    # stream oldest first so appending targets stay in order
+    notes = source.iter_notes([], newest_first=False)
+    target.save_notes(print_notes(notes))
+
+
+def print_notes(notes):
+    """Prints notes as the target consumes them"""
     count = 1
     for timestamp, note in notes:
         print(
-            "%s/%s - [%s] %s" %
+            "%s - [%s] %s" %
             (count,
-             len(notes),
              timestamp_to_datestring(timestamp),
              note))
-        target.save_note(timestamp, note)
+        yield timestamp, note
         count += 1
+
+
+def run_layout_migration(layout):
+    """Moves the redis note bodies into another storage layout"""
+    if layout not in ('keys', 'buckets'):
+        print("Storage layout must be either keys or buckets")
+        return
+    count = redis_notes.migrate_storage_layout(layout)
+    print("Moved %s notes, set storage_layout = %s under [%s]" %
+          (count, layout, redis_notes.CONFIG_SECTION))
+
+
+def run_date_index_migration():
+    """Rebuilds the redis date keys of every note"""
+    count = redis_notes.rebuild_date_index()
+    print("Indexed the dates of %s notes" % count)
@@ -24,10 +24,7 @@ def import_connectors():
 
 def setup_auto_complete(modules):
     """Builds up Completer"""
-    words = set()
-    for module in modules:
-        words = words | module.get_common_words()
-    completer = Completer(list(words))
+    completer = Completer(modules)
     readline.parse_and_bind("tab: complete")
     readline.set_completer(completer.complete)
 
@@ -55,19 +52,20 @@ def process_note(note):
 
 
 class Completer:
-    """Auto completion class"""
+    """Auto completion class, asking the connectors for each new prefix"""
 
-    def __init__(self, words):
-        self.words = words
+    def __init__(self, modules):
+        self.modules = modules
         self.prefix = None
         self.matching_words = []
 
     def complete(self, prefix, index):
         """Auto completion method"""
         if prefix != self.prefix:
-            self.matching_words = [
-                w for w in self.words if w.startswith(prefix)
-            ]
+            words = set()
+            for module in self.modules:
+                words.update(module.complete(prefix))
+            self.matching_words = sorted(words)
             self.prefix = prefix
         try:
             return self.matching_words[index] + " "
@@ -0,0 +1,28 @@
+#!/usr/bin/python3
+""" Snapshot Script
+    Exports every note of a backend to a columnar snapshot file, or
+    imports one into a backend
+"""
+
+from ashaw_notes.utils.connection_manager import ConnectionManager
+import ashaw_notes.utils.snapshot
+
+
+def export_notes(source_name, location):
+    """Writes all notes of the source connector to a snapshot"""
+    source = ConnectionManager().load_connector(source_name)
+    notes = source.iter_notes([], newest_first=False)
+    ashaw_notes.utils.snapshot.write_snapshot(location, notes)
+    print("Exported notes from %s to %s" % (source_name, location))
+
+
+def import_notes(location, target_name):
+    """Saves every note of a snapshot to the target connector"""
+    snapshot = ashaw_notes.utils.snapshot.load_snapshot(location)
+    if not snapshot:
+        print("%s is not a notes snapshot" % location)
+        return
+    target = ConnectionManager().load_connector(target_name)
+    target.save_notes(snapshot.iter_notes())
+    print("Imported %s notes from %s to %s" % (
+        len(snapshot), location, target_name))
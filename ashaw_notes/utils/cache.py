@@ -0,0 +1,47 @@
+#!/usr/bin/python3
+
+""" Cache Module
+    A small thread safe least recently used cache
+"""
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Maps keys to values, dropping the least recently used past a size"""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        """Returns the value of a key, marking it as recently used"""
+        with self.lock:
+            if key not in self.entries:
+                return default
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def set(self, key, value):
+        """Stores a value, evicting the least recently used past the size"""
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def pop(self, key):
+        """Forgets a key"""
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def clear(self):
+        """Forgets every key"""
+        with self.lock:
+            self.entries.clear()
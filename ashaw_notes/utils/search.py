@@ -5,6 +5,8 @@
 import re
 import time
 import calendar
+import datetime
+import itertools
 from dateutil.parser import parse
 from ashaw_notes.utils.plugin_manager import PluginManager
 import ashaw_notes.utils.configuration
@@ -25,9 +27,73 @@ def is_hashtag(string):
     return False
 
 
+def get_note_words(note):
+    """Splits a note into its unique lowercased words and hashtags"""
+    words = []
+    for part in re.findall(r'(\w+)', note) + re.findall(r'(#[A-z0-9-_]+)', note):
+        word = part.lower()
+        if word not in words:
+            words.append(word)
+    return words
+
+
+__asctime_regex__ = re.compile(
+    r'^(?:Mon|Tue|Wed|Thu|Fri|Sat|Sun) (\w{3}) ([ \d]\d) '
+    r'[0-2]\d:[0-5]\d:[0-6]\d (\d{4})$')
+__months__ = {
+    'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+    'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12,
+}
+__day_bases__ = {}  # epoch of midnight keyed by the asctime day and year
+__epoch_offset__ = datetime.date(1970, 1, 1).toordinal() * 86400
+
+
 def datestring_to_timestamp(string):
     """Converts string to timestamp"""
-    return int(calendar.timegm(time.strptime(string)))
+    timestamp = parse_asctime(string)
+    if timestamp is None:
+        return int(calendar.timegm(time.strptime(string)))
+    return timestamp
+
+
+def parse_asctime(string):
+    """Converts a time.asctime string to a timestamp without strptime
+
+    The epoch of each day is memoized so only the clock is converted per
+    line. Returns None for anything outside the exact asctime layout,
+    leaving strptime to parse or reject it.
+    """
+    parts = __asctime_regex__.match(string)
+    if not parts:
+        return None
+
+    hours = int(string[11:13])
+    seconds = int(string[17:19])
+    if hours > 23 or seconds > 61:
+        return None
+
+    day_key = string[:11] + parts.group(3)
+    base = __day_bases__.get(day_key)
+    if base is None:
+        base = get_day_base(parts.group(1), parts.group(2), parts.group(3))
+        if base is None:
+            return None
+        if len(__day_bases__) > 100000:
+            __day_bases__.clear()
+        __day_bases__[day_key] = base
+    return base + hours * 3600 + int(string[14:16]) * 60 + seconds
+
+
+def get_day_base(month_name, day, year):
+    """Returns the epoch of midnight on the given asctime day"""
+    month = __months__.get(month_name)
+    if not month:
+        return None
+    try:
+        return datetime.date(int(year), month, int(day)).toordinal() \
+            * 86400 - __epoch_offset__
+    except ValueError:
+        return None
 
 
 def timestamp_to_datestring(timestamp, with_time=True):
@@ -46,21 +112,76 @@ def get_search_request(terms=None, allow_plugins=True):
     return request
 
 
+def page_notes(notes, search_request):
+    """Slices the requested page out of an iterable of notes"""
+    if not search_request.page_limit:
+        return iter(notes)
+    start = search_request.page_index * search_request.page_limit
+    return itertools.islice(notes, start, start + search_request.page_limit)
+
+
 class SearchRequest:
     """Search request object"""
 
+    __paging_regex__ = re.compile(r'^(limit|page):(\d+)$')
+
     def __init__(self, search_terms):
         self.inclusion_terms = []
         self.exclusion_terms = []
         self.date = None
-        self.page_limit = 0  # not implemented
-        self.page_index = 0  # not implemented
+        self.date_range = None  # (first, last) days, either may be None
+        self.page_limit = 0  # notes per page, newest first, 0 for all
+        self.page_index = 0
 
         if search_terms is None:
             search_terms = []
 
         for term in search_terms:
-            if term.find("!") == 0:
+            paging = SearchRequest.__paging_regex__.match(term.lower())
+            if paging and paging.group(1) == 'limit':
+                self.page_limit = int(paging.group(2))
+            elif paging:
+                self.page_index = int(paging.group(2))
+            elif term.find("!") == 0:
                 self.exclusion_terms.append(term[1:].lower())
             else:
                 self.inclusion_terms.append(term.lower())
+
+    def is_paged(self):
+        """Checks if only a page of the matching notes is requested"""
+        return bool(self.page_limit)
+
+    def get_day_range(self):
+        """Returns the first and last YYYY-MM-DD days requested, if any"""
+        if self.date_range:
+            return tuple(day.strftime('%Y-%m-%d') if day else None
+                         for day in self.date_range)
+        if self.date:
+            day = self.date.strftime('%Y-%m-%d')
+            return day, day
+        return None
+
+    def get_timestamp_range(self):
+        """Returns the local epoch bounds of the requested days, if any"""
+        day_range = self.get_day_range()
+        if not day_range:
+            return None
+        first, last = day_range
+        start = end = None
+        if first:
+            start = int(time.mktime(time.strptime(first, '%Y-%m-%d')))
+        if last:
+            following = datetime.datetime.strptime(last, '%Y-%m-%d') \
+                + datetime.timedelta(days=1)
+            end = int(time.mktime(following.timetuple())) - 1
+        return start, end
+
+    def includes_day(self, day):
+        """Checks if a YYYY-MM-DD day falls within the requested days"""
+        day_range = self.get_day_range()
+        if not day_range:
+            return True
+        if not day:
+            return False
+        first, last = day_range
+        return (not first or first <= day) and (not last or day <= last)
@@ -0,0 +1,123 @@
+#!/usr/bin/python3
+
+""" Note Snapshot Module
+    Columnar, memory-mapped snapshots of every note
+
+    A snapshot is a JSON header line followed by the note timestamps as
+    one sorted array('q'), the start offset of every note body (plus the
+    end of the last one) as a second array('q') and the UTF-8 note
+    bodies as a single blob. Loading maps the file and casts the arrays
+    in place, so no note is parsed until it is read.
+"""
+import os
+import sys
+import json
+import mmap
+from array import array
+from bisect import bisect_left, bisect_right
+
+
+FORMAT_VERSION = 1
+
+
+def write_snapshot(location, notes, signature=None):
+    """Atomically writes (timestamp, note) pairs as a snapshot"""
+    timestamps = array('q')
+    offsets = array('q', [0])
+    bodies = []
+    size = 0
+    for timestamp, note in sorted(notes, key=lambda pair: pair[0]):
+        body = note.encode('utf8')
+        timestamps.append(timestamp)
+        bodies.append(body)
+        size += len(body)
+        offsets.append(size)
+
+    header = json.dumps({
+        'format': FORMAT_VERSION,
+        'byteorder': sys.byteorder,
+        'count': len(timestamps),
+        'signature': signature,
+    }).encode('utf8') + b'\n'
+    # keeps the arrays aligned to their item size
+    header += b' ' * (-len(header) % timestamps.itemsize)
+
+    with open("%s.tmp" % location, "wb") as snapshot_file:
+        snapshot_file.write(header)
+        timestamps.tofile(snapshot_file)
+        offsets.tofile(snapshot_file)
+        snapshot_file.write(b''.join(bodies))
+    os.replace("%s.tmp" % location, location)
+
+
+def load_snapshot(location, signature=None):
+    """Maps a snapshot, or returns None if it is missing or out of date"""
+    try:
+        snapshot = Snapshot(location)
+    except (OSError, ValueError):
+        return None
+    if signature is not None and snapshot.signature != signature:
+        snapshot.close()
+        return None
+    return snapshot
+
+
+class Snapshot:
+    """A memory-mapped snapshot of notes sorted by timestamp"""
+
+    def __init__(self, location):
+        with open(location, "rb") as snapshot_file:
+            header_line = snapshot_file.readline()
+            header = json.loads(header_line.decode('utf8'))
+            if header.get('format') != FORMAT_VERSION or \
+                    header.get('byteorder') != sys.byteorder:
+                raise ValueError("Unsupported snapshot: %s" % location)
+            self.map = mmap.mmap(
+                snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        self.signature = header['signature']
+        count = header['count']
+        itemsize = array('q').itemsize
+        start = len(header_line)
+        start += -start % itemsize
+        self.view = view = memoryview(self.map)
+        self.timestamps = view[start:start + count * itemsize].cast('q')
+        start += count * itemsize
+        self.offsets = view[start:start + (count + 1) * itemsize].cast('q')
+        start += (count + 1) * itemsize
+        self.blob = view[start:]
+        if len(self.blob) != self.offsets[count]:
+            self.close()
+            raise ValueError("Truncated snapshot: %s" % location)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def get_note(self, index):
+        """Decodes the note at an index"""
+        return (self.timestamps[index], str(
+            self.blob[self.offsets[index]:self.offsets[index + 1]], 'utf8'))
+
+    def get_index_range(self, start=None, end=None):
+        """Returns the indexes of notes between two inclusive timestamps"""
+        first = 0 if start is None else bisect_left(self.timestamps, start)
+        last = len(self) if end is None else \
+            bisect_right(self.timestamps, end)
+        return first, max(first, last)
+
+    def iter_notes(self, start=None, end=None, newest_first=False):
+        """Yields the notes between two inclusive timestamps"""
+        first, last = self.get_index_range(start, end)
+        indexes = range(first, last)
+        if newest_first:
+            indexes = reversed(indexes)
+        for index in indexes:
+            yield self.get_note(index)
+
+    def close(self):
+        """Releases the mapped file"""
+        self.timestamps.release()
+        self.offsets.release()
+        self.blob.release()
+        self.view.release()
+        self.map.close()
@@ -0,0 +1,66 @@
+#!/usr/bin/python3
+""" Timestamp Parsing Benchmark
+    Measures datestring_to_timestamp against the strptime conversion it
+    replaced on the asctime strings find_local_notes parses per note
+
+    Run from the repository root after installing the package with
+    `pip install -e .`:
+        $ python3 benchmarks/datestring_to_timestamp.py --notes 200000
+"""
+
+import argparse
+import calendar
+import random
+import time
+import timeit
+from ashaw_notes.utils import search
+
+
+def build_corpus(notes, notes_per_day, seed=46):
+    """Returns asctime strings clustered into days like a notes file"""
+    rng = random.Random(seed)
+    start = int(time.time()) - (notes // notes_per_day) * 86400
+    corpus = []
+    for day in range(notes // notes_per_day):
+        day_start = start - start % 86400 + day * 86400
+        for second in sorted(rng.sample(range(86400), notes_per_day)):
+            corpus.append(search.timestamp_to_datestring(day_start + second))
+    return corpus
+
+
+def strptime_to_timestamp(string):
+    """The strptime conversion datestring_to_timestamp used to run"""
+    return int(calendar.timegm(time.strptime(string)))
+
+
+def run(notes, notes_per_day, repeat):
+    """Main benchmark method"""
+    corpus = build_corpus(notes, notes_per_day)
+    assert [strptime_to_timestamp(string) for string in corpus] == \
+        [search.datestring_to_timestamp(string) for string in corpus]
+
+    def parse_all(function):
+        """Parses the whole corpus with the given function"""
+        for string in corpus:
+            function(string)
+
+    before = min(timeit.repeat(
+        lambda: parse_all(strptime_to_timestamp), number=1, repeat=repeat))
+    after = min(timeit.repeat(
+        lambda: parse_all(search.datestring_to_timestamp),
+        number=1, repeat=repeat))
+    print("%s timestamps over %s days" % (
+        len(corpus), len(corpus) // notes_per_day))
+    print("%-24s %10.3f us/call" % ('strptime', before * 1e6 / len(corpus)))
+    print("%-24s %10.3f us/call" % (
+        'datestring_to_timestamp', after * 1e6 / len(corpus)))
+    print("%-24s %10.1fx" % ('speedup', before / after))
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser(description=__doc__)
+    PARSER.add_argument('--notes', type=int, default=200000)
+    PARSER.add_argument('--notes-per-day', type=int, default=40)
+    PARSER.add_argument('--repeat', type=int, default=3)
+    ARGS = PARSER.parse_args()
+    run(ARGS.notes, ARGS.notes_per_day, ARGS.repeat)
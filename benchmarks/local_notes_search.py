@@ -0,0 +1,119 @@
+#!/usr/bin/python3
+""" Local Notes Search Benchmark
+    Measures find_local_notes throughput on a generated multi-year notes file
+
+    Run from the repository root (so notes.config is found) after
+    installing the package with `pip install -e .`:
+        $ python3 benchmarks/local_notes_search.py --years 4
+"""
+
+import argparse
+import os
+import random
+import re
+import tempfile
+import time
+import ashaw_notes.utils.configuration
+from ashaw_notes.connectors import local_notes
+from ashaw_notes.utils.search import get_search_request
+from ashaw_notes.utils.search import datestring_to_timestamp
+
+
+WORDS = [
+    'deploy', 'meeting', 'standup', 'review', 'lunch', 'bug', 'ticket',
+    'customer', 'release', 'docs', 'refactor', 'redis', 'notes', 'call',
+    'email', 'planning', 'build', 'tests', 'server', 'backup', 'today:',
+]
+HASHTAGS = ['#ops', '#team', '#billing', '#oncall', '#infra']
+QUERIES = [
+    ['deploy'],
+    ['deploy', 'server', '!tests'],
+    ['#oncall'],
+    ['missing'],
+    ['dep.oy'],
+]
+
+
+def generate_notes_file(location, years, notes_per_day, seed=46):
+    """Writes a notes file spanning the requested number of years"""
+    rng = random.Random(seed)
+    start = int(time.time()) - years * 365 * 86400
+    with open(location, 'w', encoding='utf8') as notes_file:
+        for day in range(years * 365):
+            day_start = start - start % 86400 + day * 86400
+            local_notes.write_header(
+                notes_file, local_notes.get_date_header(day_start))
+            for timestamp in sorted(rng.sample(range(86400), notes_per_day)):
+                note = ' '.join(rng.choice(WORDS) for _ in range(8))
+                if rng.random() < 0.2:
+                    note += ' %s' % rng.choice(HASHTAGS)
+                local_notes.write_line(notes_file, local_notes.build_note_line(
+                    day_start + timestamp, note))
+
+
+def legacy_find_local_notes(search_request, location):
+    """The per term, per line regex scan find_local_notes used to run"""
+    results = []
+    with open(location, "r", encoding="utf8") as reading_file:
+        for line in reading_file:
+            matching_line = True
+            for term in search_request.inclusion_terms:
+                if not re.search(r'(%s)\b' % term, line):
+                    matching_line = False
+                    break
+            if not matching_line:
+                continue
+            for term in search_request.exclusion_terms:
+                if re.search(r'%s' % term, line):
+                    matching_line = False
+                    break
+            if not matching_line:
+                continue
+            timestamp, note = local_notes.parse_note_line(line)
+            if timestamp and note:
+                results.append((datestring_to_timestamp(timestamp), note))
+    return results
+
+
+def measure(function, repeat):
+    """Returns the best wall clock time of repeated calls"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(years, notes_per_day, repeat):
+    """Main benchmark method"""
+    directory = tempfile.mkdtemp()
+    location = os.path.join(directory, 'notes')
+    config = ashaw_notes.utils.configuration.load_config()
+    config.set(local_notes.CONFIG_SECTION, 'location', location)
+
+    generate_notes_file(location, years, notes_per_day)
+    with open(location, 'rb') as notes_file:
+        lines = sum(1 for _ in notes_file)
+    print("%s lines, %.1f MB" % (lines, os.path.getsize(location) / 1e6))
+    print("%-28s %14s %14s %8s" % ('query', 'before l/s', 'after l/s', 'speedup'))
+
+    for terms in QUERIES:
+        request = get_search_request(terms, allow_plugins=False)
+        assert legacy_find_local_notes(request, location) == \
+            local_notes.find_local_notes(request)
+        before = measure(
+            lambda: legacy_find_local_notes(request, location), repeat)
+        after = measure(lambda: local_notes.find_local_notes(request), repeat)
+        print("%-28s %14d %14d %7.1fx" % (
+            ' '.join(terms), lines / before, lines / after, before / after))
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser(description=__doc__)
+    PARSER.add_argument('--years', type=int, default=4)
+    PARSER.add_argument('--notes-per-day', type=int, default=40)
+    PARSER.add_argument('--repeat', type=int, default=3)
+    ARGS = PARSER.parse_args()
+    run(ARGS.years, ARGS.notes_per_day, ARGS.repeat)
@@ -0,0 +1,103 @@
+#!/usr/bin/python3
+""" Redis Storage Layout Benchmark
+    Compares the memory used by per note keys and day bucketed hashes on
+    a generated multi-year corpus
+
+    Needs a Redis server with an empty database to fill, which is
+    flushed between layouts. Run from the repository root (so
+    notes.config is found) after installing the package with
+    `pip install -e .`:
+        $ python3 benchmarks/redis_storage_layout.py --db 15 --years 4
+"""
+
+import argparse
+import random
+import sys
+import time
+import ashaw_notes.utils.configuration
+from ashaw_notes.connectors import redis_notes
+
+
+WORDS = [
+    'deploy', 'meeting', 'standup', 'review', 'lunch', 'bug', 'ticket',
+    'customer', 'release', 'docs', 'refactor', 'redis', 'notes', 'call',
+    'email', 'planning', 'build', 'tests', 'server', 'backup', 'today:',
+]
+HASHTAGS = ['#ops', '#team', '#billing', '#oncall', '#infra']
+LAYOUTS = ['keys', 'buckets']
+
+
+def generate_notes(years, notes_per_day, seed=46):
+    """Returns (timestamp, note) pairs spanning the requested years"""
+    rng = random.Random(seed)
+    start = int(time.time()) - years * 365 * 86400
+    notes = []
+    for day in range(years * 365):
+        day_start = start - start % 86400 + day * 86400
+        for timestamp in sorted(rng.sample(range(86400), notes_per_day)):
+            note = ' '.join(rng.choice(WORDS) for _ in range(8))
+            if rng.random() < 0.2:
+                note += ' %s' % rng.choice(HASHTAGS)
+            notes.append((day_start + timestamp, note))
+    return notes
+
+
+def get_used_memory(redis_connection):
+    """Returns the bytes of memory used by the Redis server"""
+    return redis_connection.info('memory')['used_memory']
+
+
+def run(host, port, db, password, years, notes_per_day, ziplist_value):
+    """Main benchmark method"""
+    config = ashaw_notes.utils.configuration.load_config()
+    config.set(redis_notes.CONFIG_SECTION, 'endpoint', host)
+    config.set(redis_notes.CONFIG_SECTION, 'port', str(port))
+    config.set(redis_notes.CONFIG_SECTION, 'db', str(db))
+    config.set(redis_notes.CONFIG_SECTION, 'password', password or '')
+    config.set(redis_notes.CONFIG_SECTION, 'note_source', 'benchmark')
+    redis_notes.__redis__ = None
+    redis_connection = redis_notes.get_redis_connection()
+    if redis_connection.dbsize():
+        sys.exit("Database %s is not empty, pick an unused one with --db" % db)
+
+    previous_value = None
+    if ziplist_value:
+        previous_value = redis_connection.config_get(
+            'hash-max-ziplist-value')['hash-max-ziplist-value']
+        redis_connection.config_set('hash-max-ziplist-value', ziplist_value)
+
+    notes = generate_notes(years, notes_per_day)
+    print("%s notes, %.1f MB of note text" % (
+        len(notes), sum(len(note) for _, note in notes) / 1e6))
+    print("%-10s %10s %12s %12s" % ('layout', 'keys', 'memory MB', 'bytes/note'))
+
+    try:
+        for layout in LAYOUTS:
+            config.set(redis_notes.CONFIG_SECTION, 'storage_layout', layout)
+            before = get_used_memory(redis_connection)
+            redis_notes.save_notes(notes)
+            used = get_used_memory(redis_connection) - before
+            print("%-10s %10d %12.1f %12.1f" % (
+                layout, redis_connection.dbsize(), used / 1e6,
+                used / len(notes)))
+            redis_connection.flushdb()
+    finally:
+        redis_connection.flushdb()
+        if previous_value is not None:
+            redis_connection.config_set(
+                'hash-max-ziplist-value', previous_value)
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser(description=__doc__)
+    PARSER.add_argument('--host', default='localhost')
+    PARSER.add_argument('--port', type=int, default=6379)
+    PARSER.add_argument('--db', type=int, default=15)
+    PARSER.add_argument('--password', default=None)
+    PARSER.add_argument('--years', type=int, default=4)
+    PARSER.add_argument('--notes-per-day', type=int, default=40)
+    PARSER.add_argument('--ziplist-value', type=int, default=None,
+                        help='temporarily sets hash-max-ziplist-value')
+    ARGS = PARSER.parse_args()
+    run(ARGS.host, ARGS.port, ARGS.db, ARGS.password, ARGS.years,
+        ARGS.notes_per_day, ARGS.ziplist_value)
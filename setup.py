@@ -11,7 +11,8 @@ setup(name='ashaw_notes',
       packages=find_packages(exclude="tests"),
       install_requires=[
       	'dateparser>=0.6.0',
-        'fakeredis>=0.8.0',
+        'fakeredis>=0.16.0',
+        'lupa>=1.9',
         'logzero>=1.3.0',
         'redis>=2.10.0',
         'mock>=2.0.0',
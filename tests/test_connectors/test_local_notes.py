@@ -1,7 +1,12 @@
 """ Testing Local Notes Module
 """
 
+import os
+import time
+import tempfile
 import unittest
+import threading
+import multiprocessing
 import datetime
 from mock import MagicMock, mock_open, patch, call
 from ddt import ddt, data, unpack
@@ -65,148 +70,99 @@ class LocalNotesTests(unittest.TestCase):
             set(),
             local_notes.get_common_words())
 
-    @patch('ashaw_notes.connectors.local_notes.write_line')
-    @patch('ashaw_notes.connectors.local_notes.write_header')
-    @patch('ashaw_notes.connectors.local_notes.is_header_found')
-    @patch('ashaw_notes.connectors.local_notes.get_notes_file_location')
-    @patch('builtins.open')
-    @patch('os.path.isfile')
-    @patch('ashaw_notes.connectors.local_notes.backup_notes')
-    def test_first_add_local_note(self,
-                                  backup_notes,
-                                  isfile,
-                                  mopen,
-                                  get_notes_file_location,
-                                  is_header_found,
-                                  write_header,
-                                  write_line):
-        """Verifies add_local_note is properly functioning when no notes file is present"""
-        isfile.return_value = False
-        get_notes_file_location.return_value = '/home/user/notes'
-        is_header_found.return_value = True
-        write_file = MagicMock()
-        mopen.side_effect = [write_file]
-
-        local_notes.add_local_note(1373500800, "testing")
-
-        mopen.assert_called_once_with(
-            '/home/user/notes', "a+", encoding="utf8")
-        backup_notes.assert_called_once()
-        write_header.assert_not_called()
-        write_line.assert_called_once_with(
-            write_file, '[Thu Jul 11 00:00:00 2013] testing')
-        write_file.close.assert_called_once()
+    @patch('ashaw_notes.connectors.local_notes.get_common_words')
+    def test_complete(self, get_common_words):
+        """Verifies complete filters and sorts the common words"""
+        get_common_words.return_value = {'deploy', 'deep', 'api', 'deployed'}
+        self.assertListEqual(
+            ['deep', 'deploy', 'deployed'], local_notes.complete('De'))
+        self.assertListEqual(['deep'], local_notes.complete('de', 1))
 
+    @patch('os.fsync')
+    @patch('ashaw_notes.connectors.local_notes.use_sync_writes')
     @patch('ashaw_notes.connectors.local_notes.write_line')
     @patch('ashaw_notes.connectors.local_notes.write_header')
-    @patch('ashaw_notes.connectors.local_notes.is_header_found')
+    @patch('ashaw_notes.connectors.local_notes.is_header_current')
     @patch('ashaw_notes.connectors.local_notes.get_notes_file_location')
     @patch('builtins.open')
-    @patch('os.path.isfile')
-    @patch('ashaw_notes.connectors.local_notes.backup_notes')
+    @patch('ashaw_notes.connectors.local_notes.backup_operations')
     def test_add_local_note(self,
-                            backup_notes,
-                            isfile,
+                            backup_operations,
                             mopen,
                             get_notes_file_location,
-                            is_header_found,
+                            is_header_current,
                             write_header,
-                            write_line):
+                            write_line,
+                            use_sync_writes,
+                            fsync):
         """Verifies add_local_note is properly functioning"""
-        isfile.return_value = True
         get_notes_file_location.return_value = '/home/user/notes'
-        is_header_found.return_value = True
-        read_file = MagicMock()
+        is_header_current.return_value = True
+        use_sync_writes.return_value = True
         write_file = MagicMock()
-        mopen.side_effect = [read_file, write_file]
+        mopen.side_effect = [write_file]
 
         local_notes.add_local_note(1373500800, "testing")
 
-        backup_notes.assert_called_once()
+        mopen.assert_called_once_with(
+            '/home/user/notes', "a+", encoding="utf8")
+        backup_operations.assert_called_once_with(
+            [('add', 1373500800, "testing")])
+        is_header_current.assert_called_once_with(1373500800)
         write_header.assert_not_called()
         write_line.assert_called_once_with(
             write_file, '[Thu Jul 11 00:00:00 2013] testing')
-        read_file.close.assert_called_once()
         write_file.close.assert_called_once()
+        fsync.assert_called_once_with(write_file.fileno())
 
+    @patch('os.fsync')
+    @patch('ashaw_notes.connectors.local_notes.use_sync_writes')
     @patch('ashaw_notes.connectors.local_notes.write_line')
     @patch('ashaw_notes.connectors.local_notes.write_header')
-    @patch('ashaw_notes.connectors.local_notes.is_header_found')
+    @patch('ashaw_notes.connectors.local_notes.is_header_current')
     @patch('ashaw_notes.connectors.local_notes.get_notes_file_location')
     @patch('builtins.open')
-    @patch('os.path.isfile')
-    @patch('ashaw_notes.connectors.local_notes.backup_notes')
+    @patch('ashaw_notes.connectors.local_notes.backup_operations')
     def test_add_local_note_with_header(self,
-                                        backup_notes,
-                                        isfile,
+                                        backup_operations,
                                         mopen,
                                         get_notes_file_location,
-                                        is_header_found,
+                                        is_header_current,
                                         write_header,
-                                        write_line):
+                                        write_line,
+                                        use_sync_writes,
+                                        fsync):
         """Verifies add_local_note is properly functioning"""
-        isfile.return_value = True
         get_notes_file_location.return_value = '/home/user/notes'
-        is_header_found.return_value = False
-        read_file = MagicMock()
+        is_header_current.return_value = False
+        use_sync_writes.return_value = False
         write_file = MagicMock()
-        mopen.side_effect = [read_file, write_file]
+        mopen.side_effect = [write_file]
 
         local_notes.add_local_note(1373500800, "testing")
 
-        backup_notes.assert_called_once()
+        backup_operations.assert_called_once_with(
+            [('add', 1373500800, "testing")])
         write_header.assert_called_once_with(write_file, '2013-07-11')
         write_line.assert_called_once_with(
             write_file, '[Thu Jul 11 00:00:00 2013] testing')
-        read_file.close.assert_called_once()
         write_file.close.assert_called_once()
+        fsync.assert_not_called()
 
-    @patch('ashaw_notes.connectors.local_notes.get_notes_file_location')
-    @patch('builtins.open')
-    @patch('ashaw_notes.connectors.local_notes.backup_notes')
-    def test_delete_local_note(self,
-                               backup_notes,
-                               mopen,
-                               get_notes_file_location):
-        """Verifies delete_local_note is properly functioning"""
-        get_notes_file_location.return_value = '/home/user/notes'
-        read_file = MagicMock()
-        write_file = MagicMock()
-        read_file.readlines.return_value = [
-            '[Thu Jul 10 23:59:00 2013] not it',
-            '[Thu Jul 11 00:00:00 2013] Im it',
-            '[Thu Jul 11 00:00:01 2013] not it',
-        ]
-        write_file.write.return_value = True
-        mopen.side_effect = [read_file, write_file]
-
-        local_notes.delete_local_note(1373500800)
-
-        backup_notes.assert_called_once()
-        self.assertListEqual(
-            write_file.write.mock_calls,
-            [
-                call('[Thu Jul 10 23:59:00 2013] not it'),
-                call('[Thu Jul 11 00:00:01 2013] not it'),
-            ]
-        )
-        write_file.close.assert_called_once()
-
-    @patch('builtins.open', new_callable=mock_open)
+    @patch('builtins.open', new_callable=mock_open, read_data=b'\n'.join([
+        b'[Thu Jul 11 00:00:00 2013] haystack 2',
+        b'[Thu Jul 11 00:00:01 2013] haystack 1',
+        b'[Thu Jul 11 00:00:02 2013] needle',
+        b'[Thu Jul 11 00:00:03 2013] haystack 3',
+        b'[Thu Jul 11 00:00:04 2013] needle...not.',
+        b'[Thu Jul 11 00:00:05 2013] needle number 2',
+        b'[Sat Jul 13 15:00:00 2013] a different day',
+        b'[Sat Jul 13 15:00:01 2013] still a different day',
+    ]))
     @patch('ashaw_notes.connectors.local_notes.get_notes_file_location')
     def test_find_local_notes(self, get_notes_file_location, mopen):
         """Verifies find_local_notes is properly functioning"""
         get_notes_file_location.return_value = '/home/user/notes'
-        mopen.return_value = [
-            '[Thu Jul 11 00:00:00 2013] haystack 2',
-            '[Thu Jul 11 00:00:01 2013] haystack 1',
-            '[Thu Jul 11 00:00:02 2013] needle',
-            '[Thu Jul 11 00:00:03 2013] haystack 3',
-            '[Thu Jul 11 00:00:04 2013] needle...not.',
-            '[Thu Jul 11 00:00:05 2013] needle number 2',
-            '[Sat Jul 13 15:00:00 2013] a different day',
-            '[Sat Jul 13 15:00:01 2013] still a different day',
-        ]
         request = get_search_request(['needle', '!not'], allow_plugins=False)
         filtered_notes = local_notes.find_local_notes(request)
         self.assertListEqual(
@@ -220,6 +176,28 @@ class LocalNotesTests(unittest.TestCase):
             [(1373727600, 'a different day'), (1373727601, 'still a different day')],
             filtered_notes)
 
+    @unpack
+    @data(
+        ([], '[Thu Jul 11 00:00:00 2013] anything', True),
+        (['needle'], '[Thu Jul 11 00:00:00 2013] needle', True),
+        (['needle'], '[Thu Jul 11 00:00:00 2013] needles', False),
+        (['needle'], '[Thu Jul 11 00:00:00 2013] haystack', False),
+        (['needle', 'hay'], '[Thu Jul 11 00:00:00 2013] hay needle', True),
+        (['need.e'], '[Thu Jul 11 00:00:00 2013] needle', True),
+        (['needle', '!not'], '[Thu Jul 11 00:00:00 2013] needle...not.', False),
+        (['needle', '!n.t'], '[Thu Jul 11 00:00:00 2013] needle...nut.', False),
+        (['needle', '!n.t'], '[Thu Jul 11 00:00:00 2013] needle', True),
+        (['caf\u00e9'], '[Thu Jul 11 00:00:00 2013] caf\u00e9 time', True),
+    )
+    def test_line_matcher(self, terms, line, expectation):
+        """Verifies LineMatcher agrees with per term regex searches"""
+        matcher = local_notes.LineMatcher(
+            get_search_request(terms, allow_plugins=False))
+        raw_line = ("%s\n" % line).encode('utf8')
+        self.assertEqual(
+            expectation,
+            matcher.prefilter(raw_line) and matcher.matches(line))
+
     @patch('ashaw_notes.utils.configuration.load_config')
     def test_get_notes_file_location(self, load_config):
         """Verifies get_notes_file_location is properly functioning"""
@@ -261,6 +239,7 @@ class LocalNotesTests(unittest.TestCase):
         use_backup.assert_called_once()
         copyfile.get.assert_not_called()
 
+    @patch('os.replace')
     @patch('shutil.copyfile')
     @patch('os.path.isfile')
     @patch('ashaw_notes.connectors.local_notes.use_backup')
@@ -270,7 +249,8 @@ class LocalNotesTests(unittest.TestCase):
             get_notes_file_location,
             use_backup,
             isfile,
-            copyfile):
+            copyfile,
+            replace):
         """Verifies backup_notes is properly functioning"""
         use_backup.return_value = True
         isfile.return_value = True
@@ -280,6 +260,10 @@ class LocalNotesTests(unittest.TestCase):
         use_backup.assert_called_once()
         copyfile.assert_called_once_with(
             '/home/user/note',
+            '/home/user/note.bak.tmp'
+        )
+        replace.assert_called_once_with(
+            '/home/user/note.bak.tmp',
             '/home/user/note.bak'
         )
 
@@ -293,10 +277,12 @@ class LocalNotesTests(unittest.TestCase):
         use_backup.assert_called_once()
         copyfile.get.assert_not_called()
 
+    @patch('os.replace')
     @patch('shutil.copyfile')
     @patch('ashaw_notes.connectors.local_notes.use_backup')
     @patch('ashaw_notes.connectors.local_notes.get_notes_file_location')
-    def test_backup_notes(self, get_notes_file_location, use_backup, copyfile):
+    def test_backup_notes(self, get_notes_file_location, use_backup, copyfile,
+                          replace):
         """Verifies restore_from_backup is properly functioning"""
         use_backup.return_value = True
         get_notes_file_location.return_value = '/home/user/note'
@@ -305,6 +291,10 @@ class LocalNotesTests(unittest.TestCase):
         use_backup.assert_called_once()
         copyfile.assert_called_once_with(
             '/home/user/note.bak',
+            '/home/user/note.tmp'
+        )
+        replace.assert_called_once_with(
+            '/home/user/note.tmp',
             '/home/user/note'
         )
 
@@ -372,3 +362,779 @@ class LocalNotesTests(unittest.TestCase):
         local_notes.write_line(file, line)
 
         file.write.assert_called_once_with("%s\n" % line)
+
+    @unpack
+    @data(
+        ('2013-07-11\n', '2013-07-11'),
+        ('[Thu Jul 11 00:00:00 2013] today: testing\n', '2013-07-11'),
+        ('[Mon May  1 17:06:30 2017] today: testing', '2017-05-01'),
+        ('==========\n', None),
+        ('bad line', None),
+    )
+    def test_get_line_day(self, line, expectation):
+        """Verifies get_line_day is properly functioning"""
+        self.assertEqual(expectation, local_notes.get_line_day(line))
+
+
+@ddt
+class LocalNotesFileTests(unittest.TestCase):
+    """Unit Testing Local Notes against a real notes file"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.location = os.path.join(self.directory.name, 'notes')
+        patcher = patch(
+            'ashaw_notes.connectors.local_notes.get_notes_file_location')
+        self.addCleanup(patcher.stop)
+        patcher.start().return_value = self.location
+        patcher = patch('ashaw_notes.connectors.local_notes.use_backup')
+        self.addCleanup(patcher.stop)
+        patcher.start().return_value = False
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write_notes(self, lines):
+        """Writes raw lines to the notes file"""
+        with open(self.location, 'w', encoding='utf8') as notes_file:
+            notes_file.write(''.join("%s\n" % line for line in lines))
+
+    def test_build_day_index(self):
+        """Verifies build_day_index maps each day to its byte ranges"""
+        self.write_notes([
+            '==========',
+            '2013-07-11',
+            '[Thu Jul 11 00:00:00 2013] first',
+            '==========',
+            '2013-07-13',
+            '[Sat Jul 13 15:00:00 2013] second',
+            '[Thu Jul 11 00:00:01 2013] late',
+        ])
+        day_index = local_notes.build_day_index(self.location)
+        self.assertListEqual(
+            [
+                ['2013-07-11', 0, 55],
+                ['2013-07-13', 55, 111],
+                ['2013-07-11', 111, 143],
+            ],
+            day_index['ranges'])
+
+    def test_load_day_index_rebuilds_stale(self):
+        """Verifies load_day_index discards an index for a changed file"""
+        self.write_notes(['2013-07-11', '[Thu Jul 11 00:00:00 2013] first'])
+        day_index = local_notes.load_day_index()
+        self.assertEqual(1, len(day_index['ranges']))
+        self.assertTrue(os.path.isfile(local_notes.get_day_index_location()))
+
+        with open(self.location, 'a', encoding='utf8') as notes_file:
+            notes_file.write('2013-07-13\n[Sat Jul 13 15:00:00 2013] second\n')
+        self.assertIsNone(local_notes.load_day_index(rebuild=False))
+        day_index = local_notes.load_day_index()
+        self.assertEqual(2, len(day_index['ranges']))
+
+    def test_add_local_note_updates_day_index(self):
+        """Verifies add_local_note extends an up to date index"""
+        local_notes.add_local_note(1373500800, "first")
+        local_notes.load_day_index()
+        local_notes.add_local_note(1373500801, "second")
+        local_notes.add_local_note(1373727600, "another day")
+
+        day_index = local_notes.load_day_index(rebuild=False)
+        self.assertIsNotNone(day_index)
+        self.assertListEqual(
+            local_notes.build_day_index(self.location)['ranges'],
+            day_index['ranges'])
+
+    def test_find_local_notes_with_day_index(self):
+        """Verifies date searches only read the indexed day ranges"""
+        local_notes.add_local_note(1373500800, "first needle")
+        local_notes.add_local_note(1373727600, "another day needle")
+        local_notes.add_local_note(1373727601, "another day")
+
+        request = get_search_request(['needle'], allow_plugins=False)
+        request.date = datetime.datetime(2013, 7, 13, 19, 0)
+        with patch('ashaw_notes.connectors.local_notes.scan_range',
+                   wraps=local_notes.scan_range) as scan_range:
+            self.assertListEqual(
+                [(1373727600, 'another day needle')],
+                local_notes.find_local_notes(request))
+            scan_range.assert_called_once()
+
+    def test_find_local_notes_with_date_range(self):
+        """Verifies date ranges read merged neighbouring day ranges"""
+        for timestamp in (1373414400, 1373500800, 1373587200, 1373673600):
+            local_notes.add_local_note(timestamp, "needle %s" % timestamp)
+
+        request = get_search_request(['needle'], allow_plugins=False)
+        request.date_range = (datetime.datetime(2013, 7, 11),
+                              datetime.datetime(2013, 7, 12, 19, 0))
+        with patch('ashaw_notes.connectors.local_notes.scan_range',
+                   wraps=local_notes.scan_range) as scan_range:
+            self.assertListEqual(
+                [(1373500800, 'needle 1373500800'),
+                 (1373587200, 'needle 1373587200')],
+                local_notes.find_local_notes(request))
+            scan_range.assert_called_once()
+
+        request.date_range = (None, datetime.datetime(2013, 7, 10))
+        self.assertListEqual(
+            [(1373414400, 'needle 1373414400')],
+            local_notes.find_local_notes(request))
+
+        os.remove(local_notes.get_day_index_location())
+        with patch('ashaw_notes.connectors.local_notes.load_day_index') \
+                as load_day_index:
+            load_day_index.return_value = None
+            request.date_range = (datetime.datetime(2013, 7, 12), None)
+            self.assertListEqual(
+                [(1373587200, 'needle 1373587200'),
+                 (1373673600, 'needle 1373673600')],
+                local_notes.find_local_notes(request))
+
+    def test_is_header_current_missing_file(self):
+        """Verifies is_header_current handles a missing notes file"""
+        self.assertFalse(local_notes.is_header_current(1373500800))
+
+    @unpack
+    @data(
+        (1373500800, True),
+        (1373727600, True),
+        (1373814000, False),
+        (1373414400, False),
+    )
+    def test_is_header_current(self, timestamp, expectation):
+        """Verifies is_header_current matches is_header_found"""
+        self.write_notes([
+            '==========',
+            '2013-07-11',
+            '[Thu Jul 11 00:00:00 2013] first',
+            '==========',
+            '2013-07-13',
+            '[Sat Jul 13 15:00:00 2013] second',
+        ])
+        with patch('ashaw_notes.connectors.local_notes.is_header_found',
+                   wraps=local_notes.is_header_found) as is_header_found:
+            self.assertEqual(
+                expectation, local_notes.is_header_current(timestamp))
+            self.assertEqual(
+                timestamp < 1373673600, is_header_found.called)
+
+    @unpack
+    @data(
+        ([], None),
+        (['no headers here'], None),
+        (['2013-07-11', 'note'], '2013-07-11'),
+        (['2013-07-11', 'note', '2013-07-13'] + ['note'] * 50, '2013-07-13'),
+    )
+    def test_get_last_header(self, lines, expectation):
+        """Verifies get_last_header reads across block boundaries"""
+        self.write_notes(lines)
+        self.assertEqual(
+            expectation,
+            local_notes.get_last_header(self.location, block_size=7))
+
+    def test_delete_local_note(self):
+        """Verifies delete_local_note journals instead of rewriting"""
+        local_notes.add_local_note(1373500740, "not it")
+        local_notes.add_local_note(1373500800, "Im it")
+        local_notes.add_local_note(1373500801, "not it")
+        with open(self.location, 'rb') as notes_file:
+            contents = notes_file.read()
+
+        local_notes.delete_local_note(1373500800)
+
+        with open(self.location, 'rb') as notes_file:
+            self.assertEqual(contents, notes_file.read())
+        self.assertEqual(1, local_notes.get_journal_entry_count())
+        self.assertListEqual(
+            [(1373500740, 'not it'), (1373500801, 'not it')],
+            local_notes.find_local_notes(
+                get_search_request([], allow_plugins=False)))
+
+    def test_update_note_same_timestamp(self):
+        """Verifies a re-added note survives the tombstone of its original"""
+        local_notes.add_local_note(1373500800, "original")
+        local_notes.update_note(1373500800, 1373500800, "edited")
+        request = get_search_request([], allow_plugins=False)
+        self.assertListEqual(
+            [(1373500800, 'edited')],
+            local_notes.find_local_notes(request))
+
+        local_notes.compact_notes()
+        self.assertFalse(os.path.isfile(local_notes.get_journal_location()))
+        self.assertListEqual(
+            [(1373500800, 'edited')],
+            local_notes.find_local_notes(request))
+        with open(self.location, 'r', encoding='utf8') as notes_file:
+            self.assertNotIn('original', notes_file.read())
+
+    def test_load_tombstones_stale_journal(self):
+        """Verifies a journal written for a replaced notes file is ignored"""
+        local_notes.add_local_note(1373500800, "first")
+        local_notes.delete_local_note(1373500800)
+        self.assertEqual(1, len(local_notes.load_tombstones()))
+
+        os.replace(self.location, "%s.old" % self.location)
+        local_notes.add_local_note(1373500800, "first")
+        self.assertDictEqual({}, local_notes.load_tombstones())
+
+    @patch('ashaw_notes.connectors.local_notes.get_compaction_threshold')
+    def test_delete_local_note_compaction(self, get_compaction_threshold):
+        """Verifies delete_local_note compacts once the threshold is hit"""
+        get_compaction_threshold.return_value = 2
+        local_notes.add_local_note(1373500800, "first")
+        local_notes.add_local_note(1373500801, "second")
+        local_notes.add_local_note(1373500802, "third")
+        with patch('threading.Thread') as thread:
+            local_notes.delete_local_note(1373500800)
+            thread.assert_not_called()
+            local_notes.delete_local_note(1373500801)
+            thread.assert_called_once_with(target=local_notes.compact_notes)
+
+    @patch('ashaw_notes.connectors.local_notes.get_backup_mode')
+    @patch('ashaw_notes.connectors.local_notes.use_backup')
+    def test_journal_backups(self, use_backup, get_backup_mode):
+        """Verifies journal backups log operations between snapshots"""
+        use_backup.return_value = True
+        get_backup_mode.return_value = 'journal'
+        local_notes.add_local_note(1373500800, "first")
+        local_notes.add_local_note(1373500801, "second")
+        local_notes.add_local_note(1373500802, "third")
+        local_notes.delete_local_note(1373500801)
+
+        with open("%s.bak" % self.location, 'r', encoding='utf8') as backup:
+            self.assertEqual(
+                '==========\n2013-07-11\n[Thu Jul 11 00:00:00 2013] first\n',
+                backup.read())
+        self.assertListEqual(
+            [
+                ['add', 1373500801, 'second'],
+                ['add', 1373500802, 'third'],
+                ['delete', 1373500801],
+            ],
+            local_notes.load_backup_log())
+
+        with open(self.location, 'w', encoding='utf8') as notes_file:
+            notes_file.write('corrupted\n')
+        local_notes.restore_from_backup()
+
+        self.assertListEqual(
+            [(1373500800, 'first'), (1373500802, 'third')],
+            local_notes.find_local_notes(
+                get_search_request([], allow_plugins=False)))
+
+    @patch('ashaw_notes.connectors.local_notes.get_backup_mode')
+    @patch('ashaw_notes.connectors.local_notes.use_backup')
+    def test_full_backups(self, use_backup, get_backup_mode):
+        """Verifies full backups copy the delete journal with the notes"""
+        use_backup.return_value = True
+        get_backup_mode.return_value = 'full'
+        local_notes.add_local_note(1373500800, "first")
+        local_notes.add_local_note(1373500801, "second")
+        local_notes.delete_local_note(1373500800)
+        self.assertFalse(
+            os.path.isfile(local_notes.get_journal_backup_location()))
+        local_notes.add_local_note(1373500802, "third")
+
+        with open(self.location, 'rb') as notes_file, \
+                open("%s.bak" % self.location, 'rb') as backup:
+            self.assertTrue(notes_file.read().startswith(backup.read()))
+        self.assertTrue(
+            os.path.isfile(local_notes.get_journal_backup_location()))
+
+        os.remove(local_notes.get_journal_location())
+        with open(self.location, 'w', encoding='utf8') as notes_file:
+            notes_file.write('corrupted\n')
+        local_notes.restore_from_backup()
+
+        self.assertListEqual(
+            [(1373500801, 'second')],
+            local_notes.find_local_notes(
+                get_search_request([], allow_plugins=False)))
+
+    @patch('ashaw_notes.connectors.local_notes.append_notes')
+    @patch('ashaw_notes.connectors.local_notes.get_backup_mode')
+    @patch('ashaw_notes.connectors.local_notes.use_backup')
+    def test_journal_backups_failed_write(self, use_backup, get_backup_mode,
+                                          append_notes):
+        """Verifies notes which failed to be written are never logged"""
+        use_backup.return_value = True
+        get_backup_mode.return_value = 'journal'
+        append_notes.side_effect = OSError("disk full")
+
+        with self.assertRaises(OSError):
+            local_notes.add_local_note(1373500800, "lost")
+        self.assertListEqual([], local_notes.load_backup_log())
+
+    @patch('time.time')
+    @patch('ashaw_notes.connectors.local_notes.get_backup_mode')
+    def test_is_snapshot_due(self, get_backup_mode, mock_time):
+        """Verifies is_snapshot_due follows the snapshot schedule"""
+        get_backup_mode.return_value = 'journal'
+        self.assertTrue(local_notes.is_snapshot_due())
+
+        self.write_notes(['snapshot'])
+        os.replace(self.location, "%s.bak" % self.location)
+        mock_time.return_value = os.path.getmtime("%s.bak" % self.location)
+        self.assertFalse(local_notes.is_snapshot_due())
+
+        mock_time.return_value += 86400
+        self.assertTrue(local_notes.is_snapshot_due())
+
+        get_backup_mode.return_value = 'full'
+        mock_time.return_value -= 86400
+        self.assertTrue(local_notes.is_snapshot_due())
+
+    @unpack
+    @data(
+        (['needle'], [(0, b'needle one'), (29, b'last needle')]),
+        (['!needle'], [(11, b'haystack'), (20, b'haystack')]),
+        ([], [(0, b'needle one'), (11, b'haystack'),
+              (20, b'haystack'), (29, b'last needle')]),
+    )
+    def test_scan_range(self, terms, expectation):
+        """Verifies scan_range keeps line offsets across block boundaries"""
+        with open(self.location, 'wb') as notes_file:
+            notes_file.write(b'needle one\nhaystack\nhaystack\nlast needle')
+        matcher = local_notes.LineMatcher(
+            get_search_request(terms, allow_plugins=False))
+        with open(self.location, 'rb') as notes_file:
+            lines = list(local_notes.scan_range(
+                notes_file, 0, None, matcher, block_size=4))
+        self.assertListEqual(expectation, lines)
+
+    def test_word_index(self):
+        """Verifies the word index is built and extended by appends"""
+        local_notes.add_local_note(1373500800, "deploy the #server")
+        local_notes.add_local_note(1373500801, "lunch")
+        postings, lines = local_notes.build_word_index(self.location)
+        self.assertEqual(2, lines)
+        self.assertListEqual([22], list(postings['deploy']))
+        self.assertListEqual([22], list(postings['#server']))
+
+        self.assertSetEqual(
+            {'deploy', 'the', 'server', '#server', 'lunch'},
+            local_notes.get_common_words())
+        local_notes.add_local_note(1373500802, "deploy again")
+
+        word_index = local_notes.load_word_index(rebuild=False)
+        self.assertIsNotNone(word_index)
+        self.assertEqual(3, word_index['lines'])
+        postings, _ = local_notes.build_word_index(self.location)
+        with open(local_notes.get_word_index_location(), 'rb') as index_file:
+            self.assertListEqual(
+                list(postings['deploy']),
+                list(local_notes.get_postings(
+                    index_file, word_index, 'deploy')))
+
+    @unpack
+    @data(
+        (['deploy', 'server'], {'deploy', 'server'}),
+        (['#on-call'], {'call'}),
+        (['dep.oy', '2013'], set()),
+        (['hu', 'may', 'ay'], {'may'}),
+    )
+    def test_get_indexable_runs(self, terms, expectation):
+        """Verifies get_indexable_runs skips regex and timestamp terms"""
+        self.assertSetEqual(
+            expectation, local_notes.get_indexable_runs(terms))
+
+    def test_find_local_notes_with_word_index(self):
+        """Verifies selective searches only read candidate lines"""
+        for second in range(16):
+            local_notes.add_local_note(1373500800 + second, "haystack")
+        local_notes.add_local_note(1373500900, "redeploy the #server")
+        local_notes.add_local_note(1373500901, "deploying the server")
+        request = get_search_request(['deploy', 'server'], allow_plugins=False)
+
+        with patch('ashaw_notes.connectors.local_notes.scan_range') as scan:
+            self.assertListEqual(
+                [(1373500900, 'redeploy the #server')],
+                local_notes.find_local_notes(request))
+            scan.assert_not_called()
+        self.assertListEqual(
+            [1373500800 + second for second in range(16)],
+            [timestamp for timestamp, _ in local_notes.find_local_notes(
+                get_search_request(['haystack'], allow_plugins=False))])
+
+    @patch('ashaw_notes.connectors.local_notes.get_parallel_scan_size')
+    @patch('ashaw_notes.connectors.local_notes.get_scan_processes')
+    def test_get_scan_chunks(self, get_scan_processes, get_parallel_scan_size):
+        """Verifies get_scan_chunks cuts the notes file at line ends"""
+        get_scan_processes.return_value = 3
+        get_parallel_scan_size.return_value = 0
+        self.write_notes(['a' * 10, 'b' * 2, 'c' * 20, 'd' * 5])
+        self.assertListEqual(
+            [(0, 14), (14, 35), (35, None)],
+            local_notes.get_scan_chunks(self.location))
+
+        get_parallel_scan_size.return_value = 1e6
+        self.assertListEqual(
+            [(0, None)], local_notes.get_scan_chunks(self.location))
+
+    @patch('ashaw_notes.connectors.local_notes.get_parallel_scan_size')
+    @patch('ashaw_notes.connectors.local_notes.get_scan_processes')
+    def test_find_local_notes_in_parallel(
+            self, get_scan_processes, get_parallel_scan_size):
+        """Verifies parallel scans match the single process scan"""
+        get_scan_processes.return_value = 1
+        get_parallel_scan_size.return_value = 0
+        for second in range(30):
+            local_notes.add_local_note(
+                1373500800 + second * 3600, "note %s #even%s" % (
+                    second, second % 2))
+        local_notes.delete_local_note(1373500800 + 7200)
+        request = get_search_request(['!#even1'], allow_plugins=False)
+        expectation = local_notes.find_local_notes(request)
+        self.assertEqual(14, len(expectation))
+
+        get_scan_processes.return_value = 4
+        with patch('ashaw_notes.connectors.local_notes.iter_matching_notes',
+                   wraps=local_notes.iter_matching_notes) as iter_matching_notes:
+            self.assertListEqual(
+                expectation, local_notes.find_local_notes(request))
+            iter_matching_notes.assert_not_called()
+
+    def test_iter_local_notes(self):
+        """Verifies notes stream newest first and page from the newest"""
+        for second in range(5):
+            local_notes.add_local_note(1373500800 + second, "note %s" % second)
+        local_notes.delete_local_note(1373500803)
+
+        self.assertListEqual(
+            [1373500804, 1373500802, 1373500801, 1373500800],
+            [timestamp for timestamp, _ in local_notes.iter_local_notes(
+                get_search_request([], allow_plugins=False))])
+        self.assertListEqual(
+            [1373500800, 1373500801, 1373500802, 1373500804],
+            [timestamp for timestamp, _ in local_notes.iter_local_notes(
+                get_search_request(['note'], allow_plugins=False),
+                newest_first=False)])
+
+        request = get_search_request(['limit:2', 'page:1'], allow_plugins=False)
+        self.assertListEqual(
+            [(1373500801, 'note 1'), (1373500800, 'note 0')],
+            list(local_notes.iter_local_notes(request)))
+        self.assertListEqual(
+            [(1373500800, 'note 0'), (1373500801, 'note 1')],
+            local_notes.find_local_notes(request))
+
+    def test_iter_local_notes_back_dated(self):
+        """Verifies back-dated notes stream in timestamp order"""
+        local_notes.add_local_note(1373500800, "note 0")
+        local_notes.add_local_note(1373587200, "note 1")
+        local_notes.add_local_note(1373587260, "note 2")
+        local_notes.update_note(1373500800, 1373500800, "note 0 edited")
+        local_notes.save_notes([(1373587230, "note 3"), (1373500700, "note 4")])
+
+        expectation = [
+            (1373587260, 'note 2'), (1373587230, 'note 3'),
+            (1373587200, 'note 1'), (1373500800, 'note 0 edited'),
+            (1373500700, 'note 4')]
+        self.assertListEqual(
+            expectation,
+            list(local_notes.iter_local_notes(
+                get_search_request([], allow_plugins=False))))
+        self.assertListEqual(
+            expectation[3:],
+            list(local_notes.iter_local_notes(
+                get_search_request(['edited|4'], allow_plugins=False))))
+        self.assertListEqual(
+            [(1373587230, 'note 3'), (1373587260, 'note 2')],
+            local_notes.find_local_notes(
+                get_search_request(['limit:2'], allow_plugins=False)))
+
+    def add_archivable_notes(self):
+        """Adds notes across two months without archiving in the background"""
+        with patch('ashaw_notes.connectors.local_notes.is_archive_due') \
+                as is_archive_due:
+            is_archive_due.return_value = False
+            local_notes.add_local_note(1370044800, "june needle")
+            local_notes.add_local_note(1370390400, "june haystack")
+            local_notes.add_local_note(1373500800, "july needle")
+
+    @data('gzip', 'lzma')
+    def test_archive_notes(self, archive_format):
+        """Verifies cold months move into compressed, summarised segments"""
+        self.add_archivable_notes()
+        local_notes.delete_local_note(1370390400)
+        with patch('ashaw_notes.connectors.local_notes.get_archive_format') \
+                as get_archive_format:
+            get_archive_format.return_value = archive_format
+            local_notes.archive_notes()
+
+        segments = local_notes.list_segments()
+        self.assertEqual(1, len(segments))
+        self.assertTrue(segments[0].endswith(
+            '2013-06.%s' % ('gz' if archive_format == 'gzip' else 'xz')))
+        self.assertDictEqual(
+            {'first': '2013-06-01', 'last': '2013-06-05',
+             'tokens': ['june', 'needle']},
+            local_notes.read_segment_header(segments[0]))
+        with open(self.location, 'r', encoding='utf8') as notes_file:
+            self.assertEqual(
+                '==========\n2013-07-11\n[Thu Jul 11 00:00:00 2013] july needle\n',
+                notes_file.read())
+        self.assertFalse(os.path.isfile(local_notes.get_journal_location()))
+
+        request = get_search_request(['needle'], allow_plugins=False)
+        self.assertListEqual(
+            [(1370044800, 'june needle'), (1373500800, 'july needle')],
+            local_notes.find_local_notes(request))
+        self.assertListEqual(
+            [(1373500800, 'july needle'), (1370044800, 'june needle')],
+            list(local_notes.iter_local_notes(request)))
+        self.assertSetEqual(
+            {'june', 'july', 'needle'}, local_notes.get_common_words())
+
+    def test_find_local_notes_skips_segments(self):
+        """Verifies segment headers rule out segments before reading them"""
+        self.add_archivable_notes()
+        with patch('ashaw_notes.connectors.local_notes.get_archive_format') \
+                as get_archive_format:
+            get_archive_format.return_value = 'gzip'
+            local_notes.archive_notes()
+
+        with patch('ashaw_notes.connectors.local_notes.read_segment',
+                   wraps=local_notes.read_segment) as read_segment:
+            request = get_search_request(['july'], allow_plugins=False)
+            self.assertListEqual(
+                [(1373500800, 'july needle')],
+                local_notes.find_local_notes(request))
+            request = get_search_request(['needle'], allow_plugins=False)
+            request.date_range = (datetime.datetime(2013, 7, 1), None)
+            self.assertListEqual(
+                [(1373500800, 'july needle')],
+                local_notes.find_local_notes(request))
+            read_segment.assert_not_called()
+
+            request = get_search_request(['hay.tack'], allow_plugins=False)
+            self.assertListEqual(
+                [(1370390400, 'june haystack')],
+                local_notes.find_local_notes(request))
+            read_segment.assert_called_once()
+
+    def test_compact_notes_rewrites_segments(self):
+        """Verifies deletes of archived notes hide and then drop them"""
+        self.add_archivable_notes()
+        with patch('ashaw_notes.connectors.local_notes.get_archive_format') \
+                as get_archive_format:
+            get_archive_format.return_value = 'gzip'
+            local_notes.archive_notes()
+
+        local_notes.delete_local_note(1370044800)
+        request = get_search_request(['june'], allow_plugins=False)
+        self.assertListEqual(
+            [(1370390400, 'june haystack')],
+            local_notes.find_local_notes(request))
+
+        local_notes.compact_notes()
+        segment = local_notes.list_segments()[0]
+        self.assertNotIn(b'june needle', local_notes.read_segment(segment))
+        self.assertListEqual(
+            ['haystack', 'june'],
+            local_notes.read_segment_header(segment)['tokens'])
+        self.assertListEqual(
+            [(1370390400, 'june haystack')],
+            local_notes.find_local_notes(request))
+
+        local_notes.delete_local_note(1370390400)
+        local_notes.compact_notes()
+        self.assertListEqual([], local_notes.list_segments())
+
+    @unpack
+    @data(
+        ('gzip', 1375315200, True),
+        ('gzip', 1373500801, False),
+        ('gzip', 1370044800, False),
+        ('none', 1375315200, False),
+    )
+    def test_is_archive_due(self, archive_format, timestamp, expectation):
+        """Verifies archiving is due once a note opens a new month"""
+        with patch('ashaw_notes.connectors.local_notes.get_archive_format') \
+                as get_archive_format:
+            get_archive_format.return_value = archive_format
+            self.assertFalse(local_notes.is_archive_due(timestamp))
+            self.write_notes([
+                '==========',
+                '2013-07-11',
+                '[Thu Jul 11 00:00:00 2013] first',
+            ])
+            self.assertEqual(
+                expectation, local_notes.is_archive_due(timestamp))
+
+    def test_add_local_note_across_processes(self):
+        """Verifies writers in separate processes never interleave"""
+        def add_notes(first):
+            """Adds a run of notes from a child process"""
+            for second in range(first, first + 25):
+                local_notes.add_local_note(1373500800 + second, "note")
+
+        context = multiprocessing.get_context('fork')
+        writers = [context.Process(target=add_notes, args=(first,))
+                   for first in range(0, 100, 25)]
+        for writer in writers:
+            writer.start()
+        for writer in writers:
+            writer.join()
+
+        with open(self.location, 'r', encoding='utf8') as notes_file:
+            lines = notes_file.read().splitlines()
+        self.assertListEqual(['==========', '2013-07-11'], lines[:2])
+        self.assertEqual(102, len(lines))
+        self.assertSetEqual(
+            {local_notes.build_note_line(1373500800 + second, "note")
+             for second in range(100)},
+            set(lines[2:]))
+        self.assertTrue(os.path.isfile(local_notes.get_lock_location()))
+
+    def set_timezone(self, timezone):
+        """Switches the local timezone until the test ends"""
+        previous = os.environ.get('TZ')
+        os.environ['TZ'] = timezone
+        time.tzset()
+
+        def restore():
+            if previous is None:
+                del os.environ['TZ']
+            else:
+                os.environ['TZ'] = previous
+            time.tzset()
+        self.addCleanup(restore)
+
+    def test_find_local_notes_with_snapshot_timezone(self):
+        """Verifies snapshot date bounds match the notes outside UTC"""
+        self.set_timezone('America/New_York')
+        self.enable_notes_snapshot()
+        self.write_notes([
+            '==========',
+            '2013-07-10',
+            '[Wed Jul 10 23:59:59 2013] hello before',
+            '==========',
+            '2013-07-11',
+            '[Thu Jul 11 00:00:00 2013] hello midnight',
+            '[Thu Jul 11 08:00:00 2013] hello morning',
+            '[Thu Jul 11 20:00:00 2013] hello evening',
+            '[Thu Jul 11 23:59:59 2013] hello late',
+        ])
+        self.assertTrue(local_notes.refresh_notes_snapshot())
+        self.assertIsNotNone(local_notes.load_notes_snapshot())
+        request = get_search_request([], allow_plugins=False)
+        request.date = datetime.datetime(2013, 7, 11)
+        notes = local_notes.find_local_notes(request)
+
+        self.assertListEqual(
+            ['hello midnight', 'hello morning', 'hello evening', 'hello late'],
+            [note for _, note in notes])
+        request.inclusion_terms = ['hello']
+        self.assertListEqual(notes, local_notes.find_local_notes(request))
+        request.inclusion_terms = []
+        self.assertListEqual(
+            list(reversed(notes)), list(local_notes.iter_local_notes(request)))
+
+    def enable_notes_snapshot(self):
+        """Snapshots the notes next to the notes file until the test ends"""
+        patcher = patch(
+            'ashaw_notes.connectors.local_notes.get_notes_snapshot_location')
+        self.addCleanup(patcher.stop)
+        patcher.start().return_value = "%s.snap" % self.location
+        local_notes.__notes_snapshot__ = None
+        local_notes.__snapshot_thread__ = None
+        self.addCleanup(setattr, local_notes, '__snapshot_thread__', None)
+        return "%s.snap" % self.location
+
+    def test_find_local_notes_with_snapshot(self):
+        """Verifies date only requests are answered from the snapshot"""
+        location = self.enable_notes_snapshot()
+        local_notes.add_local_note(1373500800, "first")
+        local_notes.add_local_note(1373587200, "second")
+        request = get_search_request([], allow_plugins=False)
+
+        with patch('threading.Thread') as thread:
+            self.assertListEqual(
+                [(1373500800, 'first'), (1373587200, 'second')],
+                local_notes.find_local_notes(request))
+            thread.assert_called_once_with(
+                target=local_notes.refresh_notes_snapshot, daemon=True)
+        self.assertFalse(os.path.isfile(location))
+        local_notes.__snapshot_thread__ = None
+        self.assertTrue(local_notes.refresh_notes_snapshot())
+
+        with patch('ashaw_notes.connectors.local_notes.iter_active_notes') \
+                as iter_active_notes:
+            request.date = datetime.datetime(2013, 7, 12)
+            self.assertListEqual(
+                [(1373587200, 'second')],
+                local_notes.find_local_notes(request))
+            request.date = None
+            request.page_limit = 1
+            self.assertListEqual(
+                [(1373587200, 'second')],
+                list(local_notes.iter_local_notes(request)))
+            iter_active_notes.assert_not_called()
+
+        # writes leave the snapshot stale, searches scan until it is rebuilt
+        local_notes.delete_local_note(1373587200)
+        local_notes.add_local_note(1373500900, "third")
+        request.page_limit = 0
+        with patch('ashaw_notes.utils.snapshot.write_snapshot') \
+                as write_snapshot, patch('threading.Thread') as thread:
+            self.assertListEqual(
+                [(1373500800, 'first'), (1373500900, 'third')],
+                local_notes.find_local_notes(request))
+            write_snapshot.assert_not_called()
+            thread.assert_called_once()
+
+    def test_find_local_notes_without_snapshot(self):
+        """Verifies notes are only snapshotted once configured"""
+        local_notes.add_local_note(1373500800, "first")
+        with patch('threading.Thread') as thread:
+            self.assertListEqual(
+                [(1373500800, 'first')],
+                local_notes.find_local_notes(
+                    get_search_request([], allow_plugins=False)))
+            thread.assert_not_called()
+        self.assertFalse(any(name.endswith('.snap')
+                             for name in os.listdir(self.directory.name)))
+
+    def test_save_notes(self):
+        """Verifies batches are written sorted under a single backup"""
+        local_notes.add_local_note(1373500800, "deploy first")
+        local_notes.load_day_index()
+        local_notes.load_word_index()
+
+        with patch('ashaw_notes.connectors.local_notes.backup_operations') \
+                as backup_operations:
+            local_notes.save_notes(iter([
+                (1373587300, "deploy third"),
+                (1373587200, "second"),
+                (1373500900, "deploy again"),
+            ]))
+            backup_operations.assert_called_once_with([
+                ('add', 1373500900, "deploy again"),
+                ('add', 1373587200, "second"),
+                ('add', 1373587300, "deploy third"),
+            ])
+
+        with open(self.location, encoding='utf8') as notes_file:
+            self.assertListEqual([
+                '==========',
+                '2013-07-11',
+                '[Thu Jul 11 00:00:00 2013] deploy first',
+                '[Thu Jul 11 00:01:40 2013] deploy again',
+                '==========',
+                '2013-07-12',
+                '[Fri Jul 12 00:00:00 2013] second',
+                '[Fri Jul 12 00:01:40 2013] deploy third',
+            ], notes_file.read().splitlines())
+
+        day_index = local_notes.load_day_index(rebuild=False)
+        self.assertListEqual(
+            local_notes.build_day_index(self.location)['ranges'],
+            day_index['ranges'])
+        word_index = local_notes.load_word_index(rebuild=False)
+        self.assertEqual(4, word_index['lines'])
+        self.assertListEqual(
+            [1373587300, 1373500900, 1373500800],
+            [timestamp for timestamp, _ in local_notes.iter_local_notes(
+                get_search_request(['deploy'], allow_plugins=False))])
@@ -1,6 +1,10 @@
 """ Testing Local Notes Module
 """
 
+import os
+import time
+import datetime
+import tempfile
 import unittest
 import logging
 import redis
@@ -18,6 +22,7 @@ class LocalNotesTests(unittest.TestCase):
     def setUp(self):
         """Setup for testing."""
         self.redis = fakeredis.FakeStrictRedis()
+        redis_notes.clear_caches()
         logging.disable(logging.CRITICAL)
 
     def tearDown(self):
@@ -81,11 +86,17 @@ class LocalNotesTests(unittest.TestCase):
 
         self.assertListEqual(
             [
-                b'day_11',
-                b'hour_0',
-                b'month_7',
+                b'd_2013-07-11',
+                b'indexes',
+                b'lexicon',
+                b'm_2013-07',
                 b'note_1373500800',
+                b'notes_version',
                 b'source_unittests',
+                b'sources',
+                b'sources_by_note',
+                b'timeline',
+                b'vocabulary',
                 b'w_#yolo',
                 b'w_a',
                 b'w_is',
@@ -94,7 +105,6 @@ class LocalNotesTests(unittest.TestCase):
                 b'w_this',
                 b'w_today',
                 b'w_yolo',
-                b'weekday_3',
                 b'year_2013'
             ], keys
         )
@@ -118,12 +128,18 @@ class LocalNotesTests(unittest.TestCase):
 
         self.assertListEqual(
             [
-                b'day_11',
-                b'hour_0',
-                b'month_7',
+                b'd_2013-07-11',
+                b'indexes',
+                b'lexicon',
+                b'm_2013-07',
                 b'note_1373500800',
                 b'note_1373500801',
+                b'notes_version',
                 b'source_unittests',
+                b'sources',
+                b'sources_by_note',
+                b'timeline',
+                b'vocabulary',
                 b'w_#yolo',
                 b'w_a',
                 b'w_different',
@@ -136,7 +152,6 @@ class LocalNotesTests(unittest.TestCase):
                 b'w_time',
                 b'w_today',
                 b'w_yolo',
-                b'weekday_3',
                 b'year_2013'
             ], keys
         )
@@ -151,24 +166,89 @@ class LocalNotesTests(unittest.TestCase):
             self.redis.get('note_1373500801')
         )
 
-    @patch('ashaw_notes.connectors.redis_notes.start_watch')
+    @patch('ashaw_notes.connectors.redis_notes.get_note_source_key')
     @patch('ashaw_notes.connectors.redis_notes.get_redis_connection')
-    def test_add_redis_note_failure(self, get_redis_connection, start_watch):
-        """Verifies that notes attempt re-add on failure"""
-        get_redis_connection.return_value = self.redis
-        start_watch.side_effect = [
-            redis.WatchError(),
-            True,
-        ]
-        redis_notes.add_redis_note(
-            1373500800, "today: this is a simple test #yolo")
+    def test_add_redis_note_round_trips(self, get_redis_connection,
+                                        get_note_source_key):
+        """Verifies notes are inserted with a single script call"""
+        connection = MagicMock(wraps=self.redis)
+        get_redis_connection.return_value = connection
+        get_note_source_key.return_value = 'source_unittests'
+        redis_notes.add_redis_note(1373500800, "first note")
+
+        connection.reset_mock()
         self.assertEqual(
-            2,
-            len(start_watch.mock_calls))
+            1373500801, redis_notes.add_redis_note(1373500800, "second note"))
+        self.assertListEqual(['eval'], [name for name, _, _
+                                        in connection.method_calls])
         self.assertEqual(
-            b"today: this is a simple test #yolo",
-            self.redis.get('note_1373500800')
-        )
+            b"second note", self.redis.get('note_1373500801'))
+        self.assertEqual(2, int(self.redis.get('notes_version')))
+        self.assertListEqual(
+            [(b'note', 2), (b'second', 1), (b'first', 1)],
+            self.redis.zrevrange('vocabulary', 0, -1, withscores=True))
+
+    @patch('ashaw_notes.connectors.redis_notes.get_note_source_key')
+    @patch('ashaw_notes.connectors.redis_notes.get_redis_connection')
+    def test_add_redis_note_without_words(self, get_redis_connection,
+                                          get_note_source_key):
+        """Verifies built indexes are trusted while no note has words"""
+        connection = MagicMock(wraps=self.redis)
+        get_redis_connection.return_value = connection
+        get_note_source_key.return_value = 'source_unittests'
+        redis_notes.add_redis_note(1373500800, "!!!")
+        redis_notes.delete_redis_note(1373500800)
+        self.assertFalse(self.redis.exists(redis_notes.get_vocabulary_key()))
+
+        connection.reset_mock()
+        redis_notes.add_redis_note(1373500900, "!!! ...")
+        self.assertListEqual(
+            ['eval'], [name for name, _, _ in connection.method_calls])
+
+    @patch('ashaw_notes.connectors.redis_notes.get_note_source_key')
+    @patch('ashaw_notes.connectors.redis_notes.get_redis_connection')
+    def test_add_redis_notes(self, get_redis_connection, get_note_source_key):
+        """Verifies batches are pipelined and keep moving taken timestamps"""
+        connection = MagicMock(wraps=self.redis)
+        get_redis_connection.return_value = connection
+        get_note_source_key.return_value = 'source_unittests'
+        redis_notes.add_redis_note(1373500800, "existing note")
+
+        connection.reset_mock()
+        self.assertListEqual(
+            [1373500801, 1373500802, 1373500900],
+            redis_notes.add_redis_notes(iter([
+                (1373500800, "first"),
+                (1373500800, "second"),
+                (1373500900, "third note"),
+            ]), batch_size=2))
+        self.assertListEqual(
+            ['hlen', 'pipeline', 'pipeline'],
+            [name for name, _, _ in connection.method_calls])
+
+        self.assertListEqual(
+            [(1373500800, 'existing note'), (1373500801, 'first'),
+             (1373500802, 'second'), (1373500900, 'third note')],
+            redis_notes.find_redis_notes(get_search_request([])))
+        self.assertEqual(
+            2, self.redis.zscore('vocabulary', 'note'))
+
+    @data(0, 951782400, 1373500800, 1450794188, 1709251199, 4102444800)
+    @patch('ashaw_notes.connectors.redis_notes.get_note_source_key')
+    @patch('ashaw_notes.connectors.redis_notes.get_redis_connection')
+    def test_add_redis_note_tokens(self, timestamp, get_redis_connection,
+                                   get_note_source_key):
+        """Verifies the insert script writes the tokens of get_note_tokens"""
+        get_redis_connection.return_value = self.redis
+        get_note_source_key.return_value = 'source_unittests'
+        redis_notes.add_redis_note(timestamp, "Some #note")
+
+        for token in redis_notes.get_note_tokens(timestamp, "Some #note") + \
+                ['source_unittests']:
+            self.assertSetEqual(
+                {str(timestamp).encode()}, self.redis.smembers(token))
+        self.assertEqual(
+            timestamp, self.redis.zscore('timeline', str(timestamp)))
 
     @patch('ashaw_notes.connectors.redis_notes.get_redis_connection')
     def test_delete_redis_note_miss(self, get_redis_connection):
@@ -184,18 +264,6 @@ class LocalNotesTests(unittest.TestCase):
             b"today: this is note 2",
             self.redis.get('note_1450794188'))
 
-    @patch('ashaw_notes.connectors.redis_notes.get_redis_connection')
-    def test_delete_redis_note_watched(self, get_redis_connection):
-        """Verifies delete_redis_note doesn't delete on a watched timestamp"""
-        get_redis_connection.return_value = self.redis
-        redis_notes.add_redis_note(1373500800, "today: this is note 1")
-        self.redis.set(redis_notes.get_watch_key(1373500800), 1234)
-        with self.assertRaises(RuntimeWarning):
-            redis_notes.delete_redis_note(1373500800)
-        self.assertEqual(
-            b"today: this is note 1",
-            self.redis.get('note_1373500800'))
-
     @patch('ashaw_notes.connectors.redis_notes.get_note_source_key')
     @patch('ashaw_notes.connectors.redis_notes.get_redis_connection')
     def test_delete_redis_note_hit(self, get_redis_connection, get_note_source_key):
@@ -210,15 +278,20 @@ class LocalNotesTests(unittest.TestCase):
 
         self.assertListEqual(
             [
-                b'day_11',
-                b'day_22',
-                b'hour_0',
-                b'hour_14',
-                b'month_12',
-                b'month_7',
+                b'd_2013-07-11',
+                b'd_2015-12-22',
+                b'indexes',
+                b'lexicon',
+                b'm_2013-07',
+                b'm_2015-12',
                 b'note_1373500800',
                 b'note_1450794188',
+                b'notes_version',
                 b'source_unittests',
+                b'sources',
+                b'sources_by_note',
+                b'timeline',
+                b'vocabulary',
                 b'w_#yolo',
                 b'w_2',
                 b'w_a',
@@ -229,8 +302,6 @@ class LocalNotesTests(unittest.TestCase):
                 b'w_this',
                 b'w_today',
                 b'w_yolo',
-                b'weekday_1',
-                b'weekday_3',
                 b'year_2013',
                 b'year_2015'
             ], keys
@@ -239,31 +310,65 @@ class LocalNotesTests(unittest.TestCase):
         redis_notes.delete_redis_note(1373500800)
         keys.sort()
 
-        self.assertEqual(b"set()", self.redis.get('day_11'))
-        self.assertEqual(b"{b'1450794188'}", self.redis.get('day_22'))
-        self.assertEqual(b"set()", self.redis.get('hour_0'))
-        self.assertEqual(b"{b'1450794188'}", self.redis.get('hour_14'))
-        self.assertEqual(b"{b'1450794188'}", self.redis.get('month_12'))
-        self.assertEqual(b"set()", self.redis.get('month_7'))
+        self.assertSetEqual(set(), self.redis.smembers('d_2013-07-11'))
+        self.assertSetEqual({b'1450794188'}, self.redis.smembers('d_2015-12-22'))
+        self.assertSetEqual({b'1450794188'}, self.redis.smembers('m_2015-12'))
+        self.assertSetEqual(set(), self.redis.smembers('m_2013-07'))
         self.assertEqual(None, self.redis.get('note_1373500800'))
         self.assertEqual(
             b"today: this is note 2",
             self.redis.get('note_1450794188'))
-        self.assertEqual(b"set()", self.redis.get('w_#yolo'))
-        self.assertEqual(b"{b'1450794188'}", self.redis.get('w_2'))
-        self.assertEqual(b"set()", self.redis.get('w_a'))
-        self.assertEqual(b"{b'1450794188'}", self.redis.get('w_is'))
-        self.assertEqual(b"{b'1450794188'}", self.redis.get('w_note'))
-        self.assertEqual(b"set()", self.redis.get('w_simple'))
-        self.assertEqual(b"set()", self.redis.get('w_test'))
-        self.assertEqual(b"{b'1450794188'}", self.redis.get('w_this'))
-        self.assertEqual(b"{b'1450794188'}", self.redis.get('w_today'))
-        self.assertEqual(b"set()", self.redis.get('w_yolo'))
-        self.assertEqual(b"{b'1450794188'}", self.redis.get('weekday_1'))
-        self.assertEqual(b"set()", self.redis.get('weekday_3'))
-        self.assertEqual(b"set()", self.redis.get('year_2013'))
-        self.assertEqual(b"{b'1450794188'}", self.redis.get('year_2015'))
-        self.assertEqual(b"{b'1450794188'}", self.redis.get('source_unittests'))
+        self.assertSetEqual(set(), self.redis.smembers('w_#yolo'))
+        self.assertSetEqual({b'1450794188'}, self.redis.smembers('w_2'))
+        self.assertSetEqual(set(), self.redis.smembers('w_a'))
+        self.assertSetEqual({b'1450794188'}, self.redis.smembers('w_is'))
+        self.assertSetEqual({b'1450794188'}, self.redis.smembers('w_note'))
+        self.assertSetEqual(set(), self.redis.smembers('w_simple'))
+        self.assertSetEqual(set(), self.redis.smembers('w_test'))
+        self.assertSetEqual({b'1450794188'}, self.redis.smembers('w_this'))
+        self.assertSetEqual({b'1450794188'}, self.redis.smembers('w_today'))
+        self.assertSetEqual(set(), self.redis.smembers('w_yolo'))
+        self.assertSetEqual(set(), self.redis.smembers('year_2013'))
+        self.assertSetEqual({b'1450794188'}, self.redis.smembers('year_2015'))
+        self.assertSetEqual({b'1450794188'}, self.redis.smembers('source_unittests'))
+
+    @patch('ashaw_notes.connectors.redis_notes.get_note_source_key')
+    @patch('ashaw_notes.connectors.redis_notes.get_redis_connection')
+    def test_delete_redis_notes(self, get_redis_connection,
+                                get_note_source_key):
+        """Verifies batches of notes leave only their own sources"""
+        connection = MagicMock(wraps=self.redis)
+        get_redis_connection.return_value = connection
+        get_note_source_key.side_effect = [
+            'source_laptop', 'source_phone', 'source_laptop']
+        redis_notes.add_redis_note(1373500800, "deploy #cleanup")
+        redis_notes.add_redis_note(1373500801, "lunch #cleanup")
+        redis_notes.add_redis_note(1373500802, "deploy again")
+        # saved before notes were mapped to their source
+        self.redis.set('note_1373500803', "old #cleanup")
+        self.redis.sadd('w_#cleanup', 1373500803)
+        self.redis.zadd('timeline', 1373500803, 1373500803)
+        self.redis.sadd('source_desktop', 1373500803)
+        self.redis.sadd('sources', 'source_desktop')
+
+        connection.reset_mock()
+        redis_notes.delete_redis_notes(redis_notes.get_redis_timestamps(
+            get_search_request(['#cleanup'])), batch_size=2)
+        self.assertNotIn('keys', [name for name, _, _
+                                  in connection.method_calls])
+
+        self.assertListEqual(
+            [(1373500802, 'deploy again')],
+            redis_notes.find_redis_notes(get_search_request([])))
+        self.assertSetEqual({b'1373500802'}, self.redis.smembers('source_laptop'))
+        self.assertSetEqual(set(), self.redis.smembers('source_phone'))
+        self.assertSetEqual(set(), self.redis.smembers('source_desktop'))
+        self.assertDictEqual(
+            {b'1373500802': b'source_laptop'},
+            self.redis.hgetall('sources_by_note'))
+        self.assertListEqual(
+            [b'again', b'deploy'],
+            sorted(self.redis.zrange('vocabulary', 0, -1)))
 
     @unpack
     @data(
@@ -295,29 +400,23 @@ class LocalNotesTests(unittest.TestCase):
             'w_quick',
             'w_note',
             'year_2013',
-            'month_7',
-            'day_11',
-            'hour_0',
-            'weekday_3']),
+            'm_2013-07',
+            'd_2013-07-11']),
         (1373500800, "a a a quick note", [
             'w_a',
             'w_quick',
             'w_note',
             'year_2013',
-            'month_7',
-            'day_11',
-            'hour_0',
-            'weekday_3']),
+            'm_2013-07',
+            'd_2013-07-11']),
         (1373500800, "special&&& characters #awesome", [
             'w_special',
             'w_characters',
             'w_awesome',
             'w_#awesome',
             'year_2013',
-            'month_7',
-            'day_11',
-            'hour_0',
-            'weekday_3']),
+            'm_2013-07',
+            'd_2013-07-11']),
         (1450794188, "#yolo #sl4life #tons-of-hashtags #yolo", [
             'w_yolo',
             'w_sl4life',
@@ -328,10 +427,8 @@ class LocalNotesTests(unittest.TestCase):
             'w_#sl4life',
             'w_#tons-of-hashtags',
             'year_2015',
-            'month_12',
-            'day_22',
-            'hour_14',
-            'weekday_1']),
+            'm_2015-12',
+            'd_2015-12-22']),
     )
     def test_get_note_tokens(self, timestamp, note, expectation):
         """Verifies get_note_tokens is properly functioning"""
@@ -353,6 +450,44 @@ class LocalNotesTests(unittest.TestCase):
             words
         )
 
+        with patch.object(self.redis, 'keys') as keys:
+            redis_notes.get_common_words()
+            keys.assert_not_called()
+
+    @unpack
+    @data(
+        (0, ['note', 'test', 'today', 'yolo', 'tests']),
+        (2, ['note', 'test']),
+    )
+    @patch('ashaw_notes.connectors.redis_notes.get_redis_connection')
+    def test_get_top_words(self, limit, expectation, get_redis_connection):
+        """Verifies get_top_words orders words by usage"""
+        get_redis_connection.return_value = self.redis
+        redis_notes.add_redis_note(1373500800, "note test today yolo")
+        redis_notes.add_redis_note(1373500801, "note test today")
+        redis_notes.add_redis_note(1373500802, "note test tests")
+        redis_notes.add_redis_note(1373500803, "note today yolo")
+        redis_notes.add_redis_note(1373500804, "note")
+        redis_notes.delete_redis_note(1373500803)
+
+        self.assertListEqual(
+            expectation, redis_notes.get_top_words(limit))
+
+    @patch('ashaw_notes.connectors.redis_notes.get_redis_connection')
+    def test_rebuild_vocabulary(self, get_redis_connection):
+        """Verifies keyspaces without a vocabulary are counted once"""
+        get_redis_connection.return_value = self.redis
+        self.redis.sadd('w_note', 1, 2, 3)
+        self.redis.sadd('w_test', 1)
+        self.redis.sadd('w_gone', 1)
+        self.redis.srem('w_gone', 1)
+        self.redis.sadd('year_2013', 1, 2, 3)
+
+        self.assertListEqual(['note', 'test'], redis_notes.get_top_words())
+        self.assertListEqual(
+            [(b'note', 3), (b'test', 1)],
+            self.redis.zrevrange('vocabulary', 0, -1, withscores=True))
+
     @patch('ashaw_notes.connectors.redis_notes.get_note_source_key')
     @patch('ashaw_notes.connectors.redis_notes.get_redis_connection')
     def test_find_redis_notes(self, get_redis_connection, get_note_source_key):
@@ -398,32 +533,545 @@ class LocalNotesTests(unittest.TestCase):
         self.assertListEqual(
             [(None, None)], redis_notes.find_redis_notes(request))
 
+    @patch('ashaw_notes.connectors.redis_notes.get_note_source_key')
+    @patch('ashaw_notes.connectors.redis_notes.get_redis_connection')
+    def test_iter_redis_notes(self, get_redis_connection, get_note_source_key):
+        """Verifies iter_redis_notes streams and pages newest first"""
+        get_redis_connection.return_value = self.redis
+        get_note_source_key.return_value = 'source_unittests'
+        for second in range(5):
+            redis_notes.add_redis_note(1373500800 + second, "note %s" % second)
+
+        self.assertListEqual(
+            [1373500804, 1373500803, 1373500802, 1373500801, 1373500800],
+            [timestamp for timestamp, _ in redis_notes.iter_redis_notes(
+                get_search_request([]), batch_size=2)])
+        self.assertListEqual(
+            [(1373500800, 'note 0'), (1373500801, 'note 1')],
+            list(redis_notes.iter_redis_notes(
+                get_search_request(['note']), newest_first=False))[:2])
+
+        request = get_search_request(['limit:2', 'page:1'])
+        self.assertListEqual(
+            [(1373500802, 'note 2'), (1373500801, 'note 1')],
+            list(redis_notes.iter_redis_notes(request)))
+        self.assertListEqual(
+            [(1373500801, 'note 1'), (1373500802, 'note 2')],
+            redis_notes.find_redis_notes(request))
+        self.assertListEqual(
+            [], list(redis_notes.iter_redis_notes(
+                get_search_request(['missing']))))
+
+    @patch('ashaw_notes.connectors.redis_notes.get_note_source_key')
+    @patch('ashaw_notes.connectors.redis_notes.get_redis_connection')
+    def test_find_redis_notes_date_range(self, get_redis_connection,
+                                         get_note_source_key):
+        """Verifies date ranges are answered from the timeline"""
+        get_redis_connection.return_value = self.redis
+        get_note_source_key.return_value = 'source_unittests'
+        for timestamp in (1373414400, 1373500800, 1373587200, 1373673600):
+            redis_notes.add_redis_note(timestamp, "note %s" % timestamp)
+
+        request = get_search_request(['date:2013-07-11..2013-07-12'])
+        self.assertListEqual(
+            [(1373500800, 'note 1373500800'), (1373587200, 'note 1373587200')],
+            redis_notes.find_redis_notes(request))
+
+        request = get_search_request(['until:2013-07-11', '!1373500800'])
+        self.assertListEqual(
+            [(1373414400, 'note 1373414400')],
+            redis_notes.find_redis_notes(request))
+
+        # databases written before the timeline existed are indexed lazily
+        self.redis.delete(redis_notes.get_timeline_key())
+        self.redis.hdel(redis_notes.get_indexes_key(), 'timeline')
+        request = get_search_request(['since:2013-07-12', '1373673600'])
+        self.assertListEqual(
+            [(1373673600, 'note 1373673600')],
+            redis_notes.find_redis_notes(request))
+        self.assertEqual(4, self.redis.zcard(redis_notes.get_timeline_key()))
+
+        redis_notes.delete_redis_note(1373673600)
+        self.assertListEqual(
+            [b'1373414400', b'1373500800', b'1373587200'],
+            self.redis.zrange(redis_notes.get_timeline_key(), 0, -1))
+
+    @unpack
+    @data(
+        ([], False, [1373500800, 1373500801, 1373500802, 1373500803]),
+        ([], True, [1373500803, 1373500802, 1373500801, 1373500800]),
+        (['limit:2', 'page:1'], True, [1373500801, 1373500800]),
+        (['even', 'limit:1'], False, [1373500800]),
+        (['even', 'limit:1'], True, [1373500802]),
+        (['!even', 'limit:1', 'page:1'], True, [1373500801]),
+        (['note', '!odd', '!2'], False, [1373500800]),
+        (['date:2013-07-11'], False,
+         [1373500800, 1373500801, 1373500802, 1373500803]),
+        (['date:2013-07-12'], False, []),
+    )
+    @patch('ashaw_notes.connectors.redis_notes.get_note_source_key')
+    @patch('ashaw_notes.connectors.redis_notes.get_redis_connection')
+    def test_get_redis_timestamps(self, terms, newest_first, expectation,
+                                  get_redis_connection, get_note_source_key):
+        """Verifies timestamps come sorted and paged from the timeline"""
+        get_redis_connection.return_value = self.redis
+        get_note_source_key.return_value = 'source_unittests'
+        for second in range(4):
+            redis_notes.add_redis_note(
+                1373500800 + second,
+                "note %s %s" % (second, 'odd' if second % 2 else 'even'))
+        keys = set(self.redis.keys())
+
+        with patch.object(self.redis, 'keys') as redis_keys:
+            self.assertListEqual(
+                expectation,
+                redis_notes.get_redis_timestamps(
+                    get_search_request(terms), newest_first))
+            redis_keys.assert_not_called()
+        for key in set(self.redis.keys()) - keys:
+            self.assertTrue(key.startswith(b'search_'))
+            self.assertLessEqual(self.redis.ttl(key), 60)
+
+    @patch('ashaw_notes.connectors.redis_notes.get_note_source_key')
+    @patch('ashaw_notes.connectors.redis_notes.get_redis_connection')
+    def test_get_redis_timestamps_cached(self, get_redis_connection,
+                                         get_note_source_key):
+        """Verifies later pages reuse stored results until the next write"""
+        get_redis_connection.return_value = self.redis
+        get_note_source_key.return_value = 'source_unittests'
+        redis_notes.add_redis_notes(
+            [(1373500800 + second, "note %s" % second) for second in range(5)])
+
+        pages = [redis_notes.get_redis_timestamps(get_search_request(
+            ['note', '!3', 'limit:2', 'page:%s' % page]), newest_first=True)
+                 for page in range(3)]
+        self.assertListEqual(
+            [[1373500804, 1373500802], [1373500801, 1373500800], []], pages)
+        self.assertEqual(1, len([key for key in self.redis.keys()
+                                 if key.startswith(b'search_')]))
+
+        redis_notes.add_redis_note(1373500805, "note 5")
+        self.assertListEqual(
+            [1373500805, 1373500804],
+            redis_notes.get_redis_timestamps(get_search_request(
+                ['note', '!3', 'limit:2']), newest_first=True))
+        self.assertEqual(2, len([key for key in self.redis.keys()
+                                 if key.startswith(b'search_')]))
+
+    @patch('ashaw_notes.connectors.redis_notes.get_note_source_key')
+    @patch('ashaw_notes.connectors.redis_notes.get_redis_connection')
+    def test_find_redis_notes_local_cache(self, get_redis_connection,
+                                          get_note_source_key):
+        """Verifies repeated requests are served locally until a write"""
+        get_redis_connection.return_value = self.redis
+        get_note_source_key.return_value = 'source_unittests'
+        redis_notes.add_redis_notes(
+            [(1373500800 + second, "note %s" % second) for second in range(3)])
+        request = get_search_request(['note'])
+        expectation = redis_notes.find_redis_notes(request)
+
+        get_redis_connection.return_value = MagicMock(wraps=self.redis)
+        self.assertListEqual(expectation, redis_notes.find_redis_notes(request))
+        self.assertListEqual(
+            ['get'], [name for name, _, _ in
+                      get_redis_connection.return_value.method_calls])
+
+        # another client replaces a note under the same timestamp
+        get_redis_connection.return_value = self.redis
+        redis_notes.delete_redis_note(1373500801)
+        self.redis.set(redis_notes.get_note_key(1373500801), "changed note")
+        self.redis.zadd(redis_notes.get_timeline_key(), 1373500801, 1373500801)
+        self.redis.sadd(redis_notes.get_word_key('note'), 1373500801)
+        self.redis.incr(redis_notes.get_version_key())
+        self.assertListEqual(
+            [(1373500800, "note 0"), (1373500801, "changed note"),
+             (1373500802, "note 2")],
+            redis_notes.find_redis_notes(request))
+        self.assertListEqual(
+            [(4, b'1373500801')],
+            [(int(score), timestamp) for timestamp, score in self.redis.zrange(
+                redis_notes.get_deleted_notes_key(), 0, -1, withscores=True)])
+
+    @unpack
+    @data(
+        (1373500800, 1373587199, 'd_2013-07-11'),
+        (1372636800, 1375315199, 'm_2013-07'),
+        (1372636800, 1372723199, 'd_2013-07-01'),
+        (1373500800, 1373673599, None),
+        (1373500801, 1373587199, None),
+        (None, 1373587199, None),
+    )
+    def test_get_date_filter_key(self, start, end, expectation):
+        """Verifies only whole UTC days and months map to a date key"""
+        self.assertEqual(expectation,
+                         redis_notes.get_date_filter_key(start, end))
+
+    @patch('ashaw_notes.connectors.redis_notes.get_note_source_key')
+    @patch('ashaw_notes.connectors.redis_notes.get_redis_connection')
+    def test_get_redis_timestamps_date_key(self, get_redis_connection,
+                                           get_note_source_key):
+        """Verifies filtered dates intersect their day key"""
+        get_redis_connection.return_value = self.redis
+        get_note_source_key.return_value = 'source_unittests'
+        redis_notes.add_redis_notes([
+            (1373500800, "deploy api"),
+            (1373587200, "deploy web"),
+            (1373590800, "lunch"),
+        ])
+
+        self.assertListEqual(
+            [1373587200],
+            redis_notes.get_redis_timestamps(
+                get_search_request(['deploy', 'date:2013-07-12'])))
+        self.assertTrue(self.redis.exists(redis_notes.get_search_key(
+            3, ['d_2013-07-12', 'w_deploy'], [])))
+
+    @patch('ashaw_notes.connectors.redis_notes.get_note_source_key')
+    @patch('ashaw_notes.connectors.redis_notes.get_redis_connection')
+    def test_rebuild_date_index(self, get_redis_connection,
+                                get_note_source_key):
+        """Verifies older keyspaces get fully qualified date keys"""
+        get_redis_connection.return_value = self.redis
+        get_note_source_key.return_value = 'source_unittests'
+        self.redis.set(redis_notes.get_note_key(1373500800), "old note")
+        self.redis.sadd('day_11', 1373500800)
+        self.redis.sadd('weekday_3', 1373500800)
+        redis_notes.add_redis_note(1450794188, "new note")
+
+        self.assertFalse(self.redis.exists('day_11'))
+        self.assertFalse(self.redis.exists('weekday_3'))
+        self.assertSetEqual({b'1373500800'}, self.redis.smembers('d_2013-07-11'))
+        self.assertSetEqual({b'1373500800'}, self.redis.smembers('m_2013-07'))
+        self.assertSetEqual({b'1450794188'}, self.redis.smembers('d_2015-12-22'))
+        self.assertEqual(2, redis_notes.rebuild_date_index())
+
+    @unpack
+    @data(
+        ('de', 0, ['deep', 'deploy', 'deployed']),
+        ('DEP', 0, ['deploy', 'deployed']),
+        ('de', 2, ['deep', 'deploy']),
+        ('x', 0, []),
+    )
+    @patch('ashaw_notes.connectors.redis_notes.get_note_source_key')
+    @patch('ashaw_notes.connectors.redis_notes.get_redis_connection')
+    def test_complete(self, prefix, limit, expectation,
+                      get_redis_connection, get_note_source_key):
+        """Verifies complete ranges the lexicon by prefix"""
+        get_redis_connection.return_value = self.redis
+        get_note_source_key.return_value = 'source_unittests'
+        redis_notes.add_redis_notes([
+            (1373500800, "deploy deep"),
+            (1373500801, "deployed api"),
+        ])
+        self.assertListEqual(expectation, redis_notes.complete(prefix, limit))
+
+    @patch('ashaw_notes.connectors.redis_notes.get_note_source_key')
+    @patch('ashaw_notes.connectors.redis_notes.get_redis_connection')
+    def test_complete_after_delete(self, get_redis_connection,
+                                   get_note_source_key):
+        """Verifies words leave the lexicon with their last note"""
+        get_redis_connection.return_value = self.redis
+        get_note_source_key.return_value = 'source_unittests'
+        redis_notes.add_redis_notes([
+            (1373500800, "deploy api"),
+            (1373500801, "deployed api"),
+        ])
+        redis_notes.delete_redis_note(1373500801)
+        self.assertListEqual(['api', 'deploy'], redis_notes.complete(''))
+
+    @patch('ashaw_notes.connectors.redis_notes.get_note_source_key')
+    @patch('ashaw_notes.connectors.redis_notes.get_redis_connection')
+    def test_rebuild_lexicon(self, get_redis_connection, get_note_source_key):
+        """Verifies older keyspaces get their lexicon from the vocabulary"""
+        get_redis_connection.return_value = self.redis
+        get_note_source_key.return_value = 'source_unittests'
+        redis_notes.add_redis_note(1373500800, "deploy api")
+        self.redis.delete(redis_notes.get_lexicon_key())
+        self.redis.hdel(redis_notes.get_indexes_key(), 'lexicon')
+        self.assertListEqual(['deploy'], redis_notes.complete('dep'))
+
+    @unpack
+    @data(
+        (['deploy*'], [1373500800, 1373500801, 1373500802]),
+        (['deploy*', 'api'], [1373500800, 1373500802]),
+        (['api', '!deployed*'], [1373500800, 1373500803]),
+        (['missing*'], []),
+    )
+    @patch('ashaw_notes.connectors.redis_notes.get_note_source_key')
+    @patch('ashaw_notes.connectors.redis_notes.get_redis_connection')
+    def test_get_redis_timestamps_prefix(self, terms, expectation,
+                                         get_redis_connection,
+                                         get_note_source_key):
+        """Verifies prefix* terms match every word starting with them"""
+        get_redis_connection.return_value = self.redis
+        get_note_source_key.return_value = 'source_unittests'
+        redis_notes.add_redis_notes([
+            (1373500800, "deploy api"),
+            (1373500801, "deploying web"),
+            (1373500802, "deployed api"),
+            (1373500803, "api docs"),
+        ])
+        self.assertListEqual(
+            expectation,
+            redis_notes.get_redis_timestamps(get_search_request(terms)))
+
+    @patch('ashaw_notes.connectors.redis_notes.get_note_source_key')
+    @patch('ashaw_notes.connectors.redis_notes.get_redis_connection')
+    def test_rebuild_timeline(self, get_redis_connection,
+                              get_note_source_key):
+        """Verifies notes written before the timeline are indexed first"""
+        get_redis_connection.return_value = self.redis
+        get_note_source_key.return_value = 'source_unittests'
+        self.redis.set(redis_notes.get_note_key(1373500800), "old note")
+        redis_notes.add_redis_note(1373500900, "new note")
+
+        self.assertListEqual(
+            [(b'1373500800', 1373500800), (b'1373500900', 1373500900)],
+            self.redis.zrange(
+                redis_notes.get_timeline_key(), 0, -1, withscores=True))
+
+    @patch('ashaw_notes.connectors.redis_notes.get_snapshot_location')
+    @patch('ashaw_notes.connectors.redis_notes.get_note_source_key')
+    @patch('ashaw_notes.connectors.redis_notes.get_redis_connection')
+    def test_find_redis_notes_with_snapshot(self, get_redis_connection,
+                                            get_note_source_key,
+                                            get_snapshot_location):
+        """Verifies unfiltered requests are answered from a local snapshot"""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        get_redis_connection.return_value = self.redis
+        get_note_source_key.return_value = 'source_unittests'
+        get_snapshot_location.return_value = os.path.join(
+            directory.name, 'redis.snap')
+        redis_notes.__notes_snapshot__ = None
+        redis_notes.__snapshot_thread__ = None
+        self.addCleanup(setattr, redis_notes, '__notes_snapshot__', None)
+        self.addCleanup(setattr, redis_notes, '__snapshot_thread__', None)
+        redis_notes.add_redis_note(1373500800, "first")
+        redis_notes.add_redis_note(1450794188, "second")
+
+        # a missing snapshot is rebuilt in the background, not on the search
+        request = get_search_request([])
+        with patch('threading.Thread') as thread:
+            self.assertListEqual(
+                [(1373500800, 'first'), (1450794188, 'second')],
+                redis_notes.find_redis_notes(request))
+            thread.assert_called_once_with(
+                target=redis_notes.refresh_notes_snapshot, daemon=True)
+        redis_notes.__snapshot_thread__ = None
+        self.assertTrue(redis_notes.refresh_notes_snapshot())
+
+        with patch('ashaw_notes.connectors.redis_notes.get_redis_notes') \
+                as get_redis_notes:
+            self.assertListEqual(
+                [(1450794188, 'second')],
+                redis_notes.find_redis_notes(
+                    get_search_request(['date:1450794188'])))
+            self.assertListEqual(
+                [(1450794188, 'second')],
+                list(redis_notes.iter_redis_notes(
+                    get_search_request(['limit:1']))))
+            self.assertListEqual(
+                [(None, None)],
+                redis_notes.find_redis_notes(
+                    get_search_request(['date:2001-01-01'])))
+            get_redis_notes.assert_not_called()
+
+        # writes leave the snapshot stale, searches query the server meanwhile
+        redis_notes.add_redis_note(1450794189, "third")
+        with patch('ashaw_notes.utils.snapshot.write_snapshot') \
+                as write_snapshot, patch('threading.Thread') as thread:
+            self.assertListEqual(
+                [(1450794188, 'second'), (1450794189, 'third')],
+                redis_notes.find_redis_notes(get_search_request(['limit:2'])))
+            write_snapshot.assert_not_called()
+            thread.assert_called_once()
+
+    @patch('ashaw_notes.connectors.redis_notes.get_note_source_key')
+    @patch('ashaw_notes.connectors.redis_notes.get_redis_connection')
+    def test_find_redis_notes_timezone(self, get_redis_connection,
+                                       get_note_source_key):
+        """Verifies dates and date ranges select the same days outside UTC"""
+        previous = os.environ.get('TZ')
+        os.environ['TZ'] = 'America/New_York'
+        time.tzset()
+
+        def restore():
+            if previous is None:
+                del os.environ['TZ']
+            else:
+                os.environ['TZ'] = previous
+            time.tzset()
+        self.addCleanup(restore)
+
+        get_redis_connection.return_value = self.redis
+        get_note_source_key.return_value = 'source_unittests'
+        redis_notes.add_redis_note(1373500799, "before")
+        redis_notes.add_redis_note(1373500800, "midnight")
+        redis_notes.add_redis_note(1373587199, "late")
+        redis_notes.add_redis_note(1373587200, "after")
+
+        expectation = [(1373500800, 'midnight'), (1373587199, 'late')]
+        day = datetime.datetime(2013, 7, 11)
+        request = get_search_request([], allow_plugins=False)
+        request.date = day
+        self.assertListEqual(expectation, redis_notes.find_redis_notes(request))
+        request = get_search_request([], allow_plugins=False)
+        request.date_range = (day, day)
+        self.assertListEqual(expectation, redis_notes.find_redis_notes(request))
+        request.inclusion_terms = ['late']
+        self.assertListEqual(
+            [(1373587199, 'late')], redis_notes.find_redis_notes(request))
+
+    @patch('ashaw_notes.connectors.redis_notes.get_storage_layout')
+    @patch('ashaw_notes.connectors.redis_notes.get_note_source_key')
+    @patch('ashaw_notes.connectors.redis_notes.get_redis_connection')
+    def test_bucketed_storage_layout(self, get_redis_connection,
+                                     get_note_source_key, get_storage_layout):
+        """Verifies note bodies can be stored in day hashes"""
+        get_redis_connection.return_value = self.redis
+        get_note_source_key.return_value = 'source_unittests'
+        get_storage_layout.return_value = 'buckets'
+        redis_notes.add_redis_note(1373500800, "first note")
+        redis_notes.add_redis_notes([(1373500800, "second note"),
+                                     (1373587200, "next day")])
+
+        self.assertListEqual([], self.redis.keys('note_*'))
+        self.assertDictEqual(
+            {b'1373500800': b'first note', b'1373500801': b'second note'},
+            self.redis.hgetall('bucket_15897'))
+        self.assertDictEqual(
+            {b'1373587200': b'next day'}, self.redis.hgetall('bucket_15898'))
+        self.assertListEqual(
+            [(1373500800, 'first note'), (1373500801, 'second note'),
+             (1373587200, 'next day')],
+            redis_notes.find_redis_notes(get_search_request(['!missing'])))
+
+        redis_notes.delete_redis_note(1373500800)
+        self.assertListEqual(
+            [(1373587200, 'next day'), (1373500801, 'second note')],
+            list(redis_notes.iter_redis_notes(get_search_request([]))))
+        self.assertDictEqual(
+            {b'1373500801': b'second note'}, self.redis.hgetall('bucket_15897'))
+
+    @patch('ashaw_notes.connectors.redis_notes.get_storage_layout')
+    @patch('ashaw_notes.connectors.redis_notes.get_note_source_key')
+    @patch('ashaw_notes.connectors.redis_notes.get_redis_connection')
+    def test_migrate_storage_layout(self, get_redis_connection,
+                                    get_note_source_key, get_storage_layout):
+        """Verifies note bodies move between layouts in batches"""
+        get_redis_connection.return_value = self.redis
+        get_note_source_key.return_value = 'source_unittests'
+        get_storage_layout.return_value = 'keys'
+        notes = [(1373500800 + hour * 3600, "note %s" % hour)
+                 for hour in range(30)]
+        redis_notes.add_redis_notes(notes)
+
+        self.assertEqual(
+            30, redis_notes.migrate_storage_layout('buckets', batch_size=7))
+        get_storage_layout.return_value = 'buckets'
+        self.assertListEqual([], self.redis.keys('note_*'))
+        self.assertListEqual(
+            [b'bucket_15897', b'bucket_15898'],
+            sorted(self.redis.keys('bucket_*')))
+        self.assertListEqual(
+            notes, redis_notes.find_redis_notes(get_search_request([])))
+
+        # the timeline can be rebuilt from the buckets alone
+        self.redis.delete(redis_notes.get_timeline_key())
+        self.redis.hdel(redis_notes.get_indexes_key(), 'timeline')
+        self.assertListEqual(
+            notes[:2], redis_notes.find_redis_notes(
+                get_search_request(['limit:2', 'page:14'])))
+
+        self.assertEqual(30, redis_notes.migrate_storage_layout('keys'))
+        get_storage_layout.return_value = 'keys'
+        self.assertEqual(30, len(self.redis.keys('note_*')))
+        self.assertListEqual(
+            notes, redis_notes.find_redis_notes(get_search_request([])))
+        with self.assertRaises(ValueError):
+            redis_notes.migrate_storage_layout('lists')
+
     @patch('ashaw_notes.utils.configuration.load_config')
     def test_get_redis_connection(self, load_config):
         """Verifies that Redis is loaded correctly"""
+        options = {
+            'endpoint': 'myredis.server',
+            'port': 4000,
+            'db': 0,
+            'password': 'supersecurepassword',
+            'socket_timeout': '2.5',
+            'max_connections': '4',
+        }
         config = MagicMock()
-        config.get.side_effect = [
-            'myredis.server',
-            4000,
-            0,
-            'supersecurepassword',
-        ]
+        config.get.side_effect = \
+            lambda section, option, **kwargs: options.get(
+                option, kwargs.get('fallback'))
         load_config.return_value = config
+        redis_notes.__redis__ = None
+        self.addCleanup(setattr, redis_notes, '__redis__', None)
 
         redis_connection = redis_notes.get_redis_connection()
+        self.assertIs(redis_connection, redis_notes.get_redis_connection())
+        load_config.assert_called_once()
 
-        connection_kwargs = redis_connection.connection_pool.connection_kwargs
+        pool = redis_connection.connection_pool
+        connection_kwargs = pool.connection_kwargs
         self.assertEqual('myredis.server', connection_kwargs['host'])
         self.assertEqual(4000, connection_kwargs['port'])
         self.assertEqual(0, connection_kwargs['db'])
         self.assertEqual('supersecurepassword', connection_kwargs['password'])
+        self.assertEqual(2.5, connection_kwargs['socket_timeout'])
+        self.assertIsNone(connection_kwargs['socket_connect_timeout'])
+        self.assertTrue(connection_kwargs['socket_keepalive'])
+        self.assertIs(redis.Connection, pool.connection_class)
+        self.assertEqual(4, pool.max_connections)
+        self.assertEqual(20, pool.timeout)
+        self.assertEqual(30, pool.health_check_interval)
 
-        self.assertListEqual(
-            config.get.mock_calls,
-            [
-                call('redis_notes', 'endpoint'),
-                call('redis_notes', 'port'),
-                call('redis_notes', 'db'),
-                call('redis_notes', 'password'),
-            ]
-        )
+    @data('/var/run/redis.sock', 'unix:///var/run/redis.sock')
+    @patch('ashaw_notes.utils.configuration.load_config')
+    def test_get_connection_pool_unix_socket(self, endpoint, load_config):
+        """Verifies socket paths connect through unix domain sockets"""
+        options = {'endpoint': endpoint, 'db': 1, 'password': None}
+        config = MagicMock()
+        config.get.side_effect = \
+            lambda section, option, **kwargs: options.get(
+                option, kwargs.get('fallback'))
+        load_config.return_value = config
+
+        pool = redis_notes.get_connection_pool()
+
+        self.assertIs(redis.UnixDomainSocketConnection, pool.connection_class)
+        self.assertEqual('/var/run/redis.sock', pool.connection_kwargs['path'])
+        self.assertNotIn('host', pool.connection_kwargs)
+        self.assertEqual(
+            '/var/run/redis.sock', pool.make_connection().path)
+
+    @unpack
+    @data(
+        (None, 60, False, False),
+        (b'PONG', 10, False, False),
+        (b'PONG', 60, True, False),
+        (redis.ConnectionError(), 60, True, True),
+    )
+    def test_health_checked_connection_pool(self, reply, idle, pinged,
+                                            dropped):
+        """Verifies idle connections are pinged and dropped when broken"""
+        pool = redis_notes.HealthCheckedConnectionPool(
+            health_check_interval=30, max_connections=1)
+        connection = MagicMock()
+        connection.pid = pool.pid
+        connection._sock = None
+        connection.read_response.side_effect = [reply]
+        pool.make_connection = lambda: connection
+        self.assertIs(connection, pool.get_connection('GET'))
+
+        if reply is not None:
+            connection._sock = MagicMock()
+        pool.release(connection)
+        connection.last_used = time.time() - idle
+
+        self.assertIs(connection, pool.get_connection('GET'))
+        self.assertEqual(pinged, connection.send_command.called)
+        self.assertEqual(dropped, connection.disconnect.called)
@@ -0,0 +1,181 @@
+""" Testing SQLite Notes Module
+"""
+
+import os
+import logging
+import tempfile
+import unittest
+import datetime
+from mock import MagicMock, patch
+from ddt import ddt, data, unpack
+from ashaw_notes.connectors import sqlite_notes
+from ashaw_notes.utils.search import get_search_request
+
+
+@ddt
+class SqliteNotesTests(unittest.TestCase):
+    """Unit Testing SQLite Notes"""
+
+    def setUp(self):
+        """Points the connector at a fresh database"""
+        logging.disable(logging.CRITICAL)
+        self.directory = tempfile.TemporaryDirectory()
+        patcher = patch(
+            'ashaw_notes.connectors.sqlite_notes.get_database_location')
+        self.addCleanup(patcher.stop)
+        patcher.start().return_value = os.path.join(
+            self.directory.name, 'notes.db')
+        sqlite_notes.__sqlite__ = None
+
+    def tearDown(self):
+        sqlite_notes.get_sqlite_connection().close()
+        sqlite_notes.__sqlite__ = None
+        self.directory.cleanup()
+
+    def add_notes(self):
+        """Adds a few notes across three days"""
+        sqlite_notes.save_note(1373500800, "today: deploy the #server")
+        sqlite_notes.save_note(1373500860, "Deployment review with the team")
+        sqlite_notes.save_note(1373587200, "server tests failed, redeploy")
+        sqlite_notes.save_note(1373673600, "lunch #team")
+
+    @unpack
+    @data(
+        ('sqlite_notes', True),
+        ('redis_notes, sqlite_notes', True),
+        ('local_notes', False),
+    )
+    @patch('ashaw_notes.utils.configuration.load_config')
+    def test_is_enabled(self, string, expectation, load_config):
+        """Verifies is_enabled is properly functioning"""
+        mock_config = MagicMock()
+        mock_config.get.return_value = string
+        load_config.return_value = mock_config
+
+        self.assertEqual(expectation, sqlite_notes.is_enabled())
+
+    def test_get_sqlite_connection(self):
+        """Verifies the database is opened in WAL mode with its schema"""
+        connection = sqlite_notes.get_sqlite_connection()
+        self.assertIs(connection, sqlite_notes.get_sqlite_connection())
+        self.assertEqual(
+            'wal', connection.execute("PRAGMA journal_mode").fetchone()[0])
+        self.assertSetEqual(
+            {'notes', 'notes_fts', 'notes_vocab'},
+            set(name for name, in connection.execute(
+                "SELECT name FROM sqlite_master WHERE name LIKE 'notes%' "
+                "AND type = 'table' AND name NOT LIKE 'notes_fts_%'")))
+
+    @unpack
+    @data(
+        ([], [1373500800, 1373500860, 1373587200, 1373673600]),
+        (['deploy'], [1373500800]),
+        (['server', '!tests'], [1373500800]),
+        (['#team'], [1373673600]),
+        (['team'], [1373500860, 1373673600]),
+        (['deploy.*'], [1373500800, 1373500860, 1373587200]),
+        (['!#server', '!deploy'], [1373673600]),
+        (['!dep.oy'], [1373673600]),
+        (['missing'], []),
+        (['date:2013-07-12'], [1373587200]),
+        (['since:2013-07-12', 'server'], [1373587200]),
+        (['limit:2'], [1373587200, 1373673600]),
+        (['limit:2', 'page:1'], [1373500800, 1373500860]),
+    )
+    def test_find_notes(self, terms, expectation):
+        """Verifies find_notes searches through the full text index"""
+        self.add_notes()
+        self.assertListEqual(
+            expectation,
+            [timestamp for timestamp, _ in sqlite_notes.find_notes(terms)])
+
+    def test_iter_sqlite_notes(self):
+        """Verifies iter_sqlite_notes streams newest first by default"""
+        self.add_notes()
+        request = get_search_request(['server'], allow_plugins=False)
+        self.assertListEqual(
+            [(1373587200, 'server tests failed, redeploy'),
+             (1373500800, 'today: deploy the #server')],
+            list(sqlite_notes.iter_sqlite_notes(request)))
+
+        request.date_range = (None, datetime.datetime(2013, 7, 11))
+        self.assertListEqual(
+            [(1373500800, 'today: deploy the #server')],
+            list(sqlite_notes.iter_sqlite_notes(request, newest_first=False)))
+
+    def test_build_search_query(self):
+        """Verifies requests become parameterised statements"""
+        request = get_search_request(
+            ['#ops', 'dep.oy', '!tests', 'limit:5', 'page:2'],
+            allow_plugins=False)
+        query, parameters = sqlite_notes.build_search_query(request)
+        self.assertEqual(
+            "SELECT timestamp, note FROM notes WHERE timestamp IN "
+            "(SELECT rowid FROM notes_fts WHERE notes_fts MATCH ?) "
+            "AND instr(lower(note), ?) > 0 AND note REGEXP ? "
+            "AND instr(lower(note), ?) = 0 "
+            "ORDER BY timestamp DESC LIMIT ? OFFSET ?", query)
+        self.assertListEqual(
+            ['"ops"', '#ops', r'(?:dep.oy)\b', 'tests', 5, 10], parameters)
+
+    def test_save_note_duplicate(self):
+        """Verifies duplicate timestamps move to the next free second"""
+        sqlite_notes.save_note(1373500800, "first")
+        sqlite_notes.save_note(1373500800, "second")
+        self.assertListEqual(
+            [(1373500800, 'first'), (1373500801, 'second')],
+            sqlite_notes.find_notes([]))
+
+    def test_save_notes(self):
+        """Verifies batches are saved in one transaction"""
+        sqlite_notes.save_note(1373500800, "existing")
+        with patch.object(sqlite_notes, 'get_sqlite_connection',
+                          wraps=sqlite_notes.get_sqlite_connection) \
+                as get_sqlite_connection:
+            sqlite_notes.save_notes(iter([
+                (1373500800, "first"),
+                (1373500900, "second"),
+            ]))
+            get_sqlite_connection.assert_called_once()
+
+        self.assertListEqual(
+            [(1373500800, 'existing'), (1373500801, 'first'),
+             (1373500900, 'second')],
+            sqlite_notes.find_notes([]))
+
+    def test_delete_note(self):
+        """Verifies deletes also leave the full text index"""
+        self.add_notes()
+        sqlite_notes.delete_note(1373673600)
+        sqlite_notes.delete_note(1373673600)
+
+        self.assertListEqual([], sqlite_notes.find_notes(['lunch']))
+        self.assertNotIn('lunch', sqlite_notes.get_common_words())
+
+    def test_update_note(self):
+        """Verifies update_note replaces the note and its index entries"""
+        self.add_notes()
+        sqlite_notes.update_note(1373673600, 1373673601, "dinner #team")
+
+        self.assertListEqual(
+            [(1373673601, 'dinner #team')], sqlite_notes.find_notes(['#team']))
+        self.assertListEqual([], sqlite_notes.find_notes(['lunch']))
+
+    def test_get_common_words(self):
+        """Verifies get_common_words lists the indexed vocabulary"""
+        self.assertSetEqual(set(), sqlite_notes.get_common_words())
+        sqlite_notes.save_note(1373500800, "Deploy the #server")
+        self.assertSetEqual(
+            {'deploy', 'the', 'server'}, sqlite_notes.get_common_words())
+
+    def test_complete(self):
+        """Verifies complete ranges the indexed terms by prefix"""
+        sqlite_notes.save_notes([
+            (1373500800, "Deploy the server"),
+            (1373500801, "deployed, then tested"),
+        ])
+        self.assertListEqual(
+            ['deploy', 'deployed'], sqlite_notes.complete('DEP'))
+        self.assertListEqual(['the', 'then'], sqlite_notes.complete('th'))
+        self.assertListEqual(['tested'], sqlite_notes.complete('t', 1))
+        self.assertListEqual([], sqlite_notes.complete('x'))
@@ -2,8 +2,10 @@
 """
 
 import unittest
+from datetime import datetime
 from ddt import ddt, data, unpack
 from ashaw_notes.plugins.datehandler import Plugin
+from ashaw_notes.utils.search import SearchRequest
 
 
 @ddt
@@ -27,3 +29,27 @@ class PluginTests(unittest.TestCase):
             expectation,
             Plugin().format_note_line(timestamp, note)
         )
+
+    @unpack
+    @data(
+        (['note'], ['note'], None, None),
+        (['date:2013-07-11', 'note'], ['note'], datetime(2013, 7, 11), None),
+        (['date:2013-07-11..2013-07-14'], [], None,
+         (datetime(2013, 7, 11), datetime(2013, 7, 14))),
+        (['date:2013-07..2013-08'], [], None,
+         (datetime(2013, 7, 1), datetime(2013, 8, 31))),
+        (['date:2013-02'], [], None,
+         (datetime(2013, 2, 1), datetime(2013, 2, 28))),
+        (['since:2013-07-11', 'until:2013-07'], [], None,
+         (datetime(2013, 7, 11), datetime(2013, 7, 31))),
+        (['since:july_11_2013'], [], None, (datetime(2013, 7, 11), None)),
+        (['date:..'], ['date:..'], None, None),
+        (['since:derp'], ['since:derp'], None, None),
+    )
+    def test_process_search_request(self, terms, inclusion_terms,
+                                    date, date_range):
+        """Verifies process_search_request parses dates and date ranges"""
+        request = Plugin().process_search_request(SearchRequest(terms))
+        self.assertListEqual(inclusion_terms, request.inclusion_terms)
+        self.assertEqual(date, request.date)
+        self.assertEqual(date_range, request.date_range)
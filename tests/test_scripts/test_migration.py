@@ -55,18 +55,35 @@ class MigrationTests(unittest.TestCase):
     def test_migrate_notes(self):
         """Verifies migrate_notes is properly functioning"""
         source = MagicMock()
-        source.find_notes.return_value = [
+        source.iter_notes.return_value = iter([
             (0, 'note1'),
             (1, 'note2'),
             (2, 'note3'),
-        ]
+        ])
         target = MagicMock()
 
         migration.migrate_notes(source, target)
 
-        source.find_notes.assert_called_once_with([])
-        target.save_note.assert_has_calls([
-            call(0, 'note1'),
-            call(1, 'note2'),
-            call(2, 'note3'),
-        ])
+        source.iter_notes.assert_called_once_with([], newest_first=False)
+        target.save_notes.assert_called_once()
+        self.assertListEqual(
+            [(0, 'note1'), (1, 'note2'), (2, 'note3')],
+            list(target.save_notes.call_args[0][0]))
+        target.save_note.assert_not_called()
+
+    @patch('ashaw_notes.connectors.redis_notes.migrate_storage_layout')
+    def test_run_layout_migration(self, migrate_storage_layout):
+        """Verifies run_layout_migration only accepts known layouts"""
+        migration.run_layout_migration('lists')
+        migrate_storage_layout.assert_not_called()
+
+        migrate_storage_layout.return_value = 3
+        migration.run_layout_migration('buckets')
+        migrate_storage_layout.assert_called_once_with('buckets')
+
+    @patch('ashaw_notes.connectors.redis_notes.rebuild_date_index')
+    def test_run_date_index_migration(self, rebuild_date_index):
+        """Verifies run_date_index_migration rebuilds the date keys"""
+        rebuild_date_index.return_value = 3
+        migration.run_date_index_migration()
+        rebuild_date_index.assert_called_once_with()
@@ -39,29 +39,36 @@ class QuicknoteTests(unittest.TestCase):
             quicknote.import_connectors()
         )
 
+    @patch('readline.set_completer')
     @patch('readline.parse_and_bind')
     @patch('ashaw_notes.scripts.quicknote.Completer')
-    def test_setup_auto_complete(self, completer, parse_and_bind):
-        """Verifies process_note is properly functioning"""
-        module1 = MagicMock()
-        module1.get_common_words.return_value = set(['a', 'b', 'c'])
-        module2 = MagicMock()
-        module2.get_common_words.return_value = set(['c', 'd', 'e'])
-        quicknote.setup_auto_complete([module1, module2])
+    def test_setup_auto_complete(self, completer, parse_and_bind,
+                                 set_completer):
+        """Verifies setup_auto_complete completes from the connectors"""
+        modules = [MagicMock(), MagicMock()]
+        quicknote.setup_auto_complete(modules)
 
         parse_and_bind.assert_called_once_with('tab: complete')
-        self.assertEqual(1, len(completer.mock_calls))
-        only_call = completer.mock_calls[0]
-        call_argument = sorted(only_call[1][0])
-        self.assertListEqual(['a', 'b', 'c', 'd', 'e'], call_argument)
+        completer.assert_called_once_with(modules)
+        set_completer.assert_called_once_with(
+            completer.return_value.complete)
 
     def test_completer(self):
         """Verifies Completer class is properly functioning"""
-        test = quicknote.Completer(['test', 'top', 'tent'])
-        self.assertEqual('test ', test.complete('te', 0))
+        module1 = MagicMock()
+        module1.complete.side_effect = lambda prefix: [
+            word for word in ['tent', 'test', 'top'] if word.startswith(prefix)]
+        module2 = MagicMock()
+        module2.complete.side_effect = lambda prefix: [
+            word for word in ['team', 'test'] if word.startswith(prefix)]
+        test = quicknote.Completer([module1, module2])
+        self.assertEqual('team ', test.complete('te', 0))
         self.assertEqual('tent ', test.complete('te', 1))
-        self.assertEqual(None, test.complete('te', 2))
+        self.assertEqual('test ', test.complete('te', 2))
+        self.assertEqual(None, test.complete('te', 3))
         self.assertEqual(None, test.complete('p', 2))
+        module1.complete.assert_any_call('te')
+        self.assertEqual(2, module1.complete.call_count)
 
     @patch('time.time')
     def test_write_note(self, time):
@@ -0,0 +1,50 @@
+""" Testing Snapshot Script Module
+"""
+
+import os
+import tempfile
+import unittest
+from mock import MagicMock, patch, call
+from ashaw_notes.utils.connection_manager import ConnectionManager
+from ashaw_notes.scripts import snapshot
+
+
+class SnapshotScriptTests(unittest.TestCase):
+    """Unit Testing Snapshot Script"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.location = os.path.join(self.directory.name, 'notes.snap')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    @patch.object(ConnectionManager, 'load_connectors')
+    @patch.object(ConnectionManager, 'load_connector')
+    def test_export_and_import_notes(self, load_connector, load_connectors):
+        """Verifies notes survive an export and import round trip"""
+        source = MagicMock()
+        source.iter_notes.return_value = iter([
+            (0, 'note1'),
+            (1, 'note2'),
+        ])
+        target = MagicMock()
+        load_connector.side_effect = [source, target]
+        load_connectors.return_value = True
+
+        snapshot.export_notes('redis_notes', self.location)
+        snapshot.import_notes(self.location, 'local_notes')
+
+        load_connector.assert_has_calls(
+            [call('redis_notes'), call('local_notes')])
+        source.iter_notes.assert_called_once_with([], newest_first=False)
+        target.save_notes.assert_called_once()
+        self.assertListEqual(
+            [(0, 'note1'), (1, 'note2')],
+            list(target.save_notes.call_args[0][0]))
+
+    @patch.object(ConnectionManager, 'load_connector')
+    def test_import_notes_invalid(self, load_connector):
+        """Verifies files which are not snapshots are never imported"""
+        snapshot.import_notes(self.location, 'local_notes')
+        load_connector.assert_not_called()
@@ -0,0 +1,37 @@
+""" Testing Cache Module
+"""
+
+import unittest
+from ashaw_notes.utils.cache import LRUCache
+
+
+class CacheTests(unittest.TestCase):
+    """Unit Testing Cache"""
+
+    def test_lru_cache(self):
+        """Verifies the least recently used entries are evicted first"""
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(1, cache.get('a'))
+        cache.set('c', 3)
+
+        self.assertEqual(2, len(cache))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual(3, cache.get('c'))
+
+        cache.pop('a')
+        self.assertEqual('missing', cache.get('a', 'missing'))
+        cache.clear()
+        self.assertEqual(0, len(cache))
+
+    def test_lru_cache_disabled(self):
+        """Verifies a cache sized 0 keeps nothing"""
+        cache = LRUCache(0)
+        cache.set('a', 1)
+        self.assertIsNone(cache.get('a'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,6 +2,9 @@
 """
 
 import unittest
+import calendar
+import datetime
+import time
 from ashaw_notes.utils import search
 from ddt import ddt, data, unpack
 
@@ -36,6 +39,18 @@ class SearchTests(unittest.TestCase):
         """Verifies is_hashtag is properly functioning"""
         self.assertEqual(search.is_hashtag(string), expectation)
 
+    @unpack
+    @data(
+        ("a a a quick note", ['a', 'quick', 'note']),
+        ("special&&& characters #awesome",
+         ['special', 'characters', 'awesome', '#awesome']),
+        ("#Yolo #tons-of-hashtags", ['yolo', 'tons', 'of', 'hashtags',
+                                     '#yolo', '#tons-of-hashtags']),
+    )
+    def test_get_note_words(self, note, expectation):
+        """Verifies get_note_words is properly functioning"""
+        self.assertListEqual(expectation, search.get_note_words(note))
+
     @unpack
     @data(
         ('Thu Jul 11 00:00:00 2013', 1373500800),
@@ -46,6 +61,36 @@ class SearchTests(unittest.TestCase):
         """Verifies string can be converted into a timstamp"""
         self.assertEqual(search.datestring_to_timestamp(string), expectation)
 
+    def test_datestring_to_timestamp_matches_strptime(self):
+        """Verifies parse_asctime agrees with strptime across years of days"""
+        for timestamp in range(946684800, 1893456000, 86400 * 3 + 3607):
+            string = search.timestamp_to_datestring(timestamp)
+            self.assertEqual(
+                int(calendar.timegm(time.strptime(string))),
+                search.parse_asctime(string), string)
+
+    @unpack
+    @data(
+        ('Mon May 01 17:06:30 2017', 1493658390),
+        ('Thu Jul 11 00:00:61 2013', 1373500861),
+        ('thu jul 11 00:00:00 2013', 1373500800),
+        ('Thu  Jul 11 00:00:00 2013', 1373500800),
+        ('Thu Feb 30 00:00:00 2013', ValueError),
+        ('Thu Jul 11 24:00:00 2013', ValueError),
+        ('Thu Jul 11 00:60:00 2013', ValueError),
+        ('Thu Jul 00 00:00:00 2013', ValueError),
+        ('Thu Jux 11 00:00:00 2013', ValueError),
+        ('not a date', ValueError),
+    )
+    def test_datestring_to_timestamp_fallback(self, string, expectation):
+        """Verifies unusual strings parse or fail exactly like strptime"""
+        if expectation is ValueError:
+            self.assertRaises(
+                ValueError, search.datestring_to_timestamp, string)
+        else:
+            self.assertEqual(
+                expectation, search.datestring_to_timestamp(string))
+
     @unpack
     @data(
         (1373500800, True, 'Thu Jul 11 00:00:00 2013'),
@@ -72,3 +117,50 @@ class SearchTests(unittest.TestCase):
 
         self.assertListEqual(['include', 'include!'], request.inclusion_terms)
         self.assertListEqual(['exclude'], request.exclusion_terms)
+
+    def test_get_search_request_paging(self):
+        """Verifies paging terms are pulled out of the search terms"""
+        request = search.get_search_request(
+            ['include', 'limit:10', 'PAGE:2', 'limit:x'])
+        self.assertListEqual(['include', 'limit:x'], request.inclusion_terms)
+        self.assertEqual(10, request.page_limit)
+        self.assertEqual(2, request.page_index)
+        self.assertTrue(request.is_paged())
+        self.assertFalse(search.get_search_request([]).is_paged())
+
+    @unpack
+    @data(
+        ([], [0, 1, 2, 3, 4, 5, 6]),
+        (['limit:3'], [0, 1, 2]),
+        (['limit:3', 'page:2'], [6]),
+        (['limit:3', 'page:5'], []),
+    )
+    def test_page_notes(self, terms, expectation):
+        """Verifies page_notes slices out the requested page"""
+        request = search.get_search_request(terms, allow_plugins=False)
+        self.assertListEqual(
+            expectation, list(search.page_notes(iter(range(7)), request)))
+
+    @unpack
+    @data(
+        (None, None, None, None, True),
+        (datetime.datetime(2013, 7, 11, 9), None,
+         ('2013-07-11', '2013-07-11'), (1373500800, 1373587199), True),
+        (None, (datetime.datetime(2013, 7, 11), datetime.datetime(2013, 7, 12)),
+         ('2013-07-11', '2013-07-12'), (1373500800, 1373673599), True),
+        (None, (None, datetime.datetime(2013, 7, 12)),
+         (None, '2013-07-12'), (None, 1373673599), True),
+        (None, (datetime.datetime(2013, 7, 12), None),
+         ('2013-07-12', None), (1373587200, None), False),
+    )
+    def test_search_request_date_range(self, date, date_range, day_range,
+                                       timestamp_range, includes_day):
+        """Verifies date and date_range resolve to the same bounds"""
+        request = search.get_search_request([], allow_plugins=False)
+        request.date = date
+        request.date_range = date_range
+        self.assertEqual(day_range, request.get_day_range())
+        self.assertEqual(timestamp_range, request.get_timestamp_range())
+        self.assertEqual(includes_day, request.includes_day('2013-07-11'))
+        if day_range:
+            self.assertFalse(request.includes_day(None))
@@ -0,0 +1,79 @@
+""" Testing Snapshot Module
+"""
+
+import os
+import tempfile
+import unittest
+from ddt import ddt, data, unpack
+from ashaw_notes.utils import snapshot
+
+
+@ddt
+class SnapshotTests(unittest.TestCase):
+    """Unit Testing Snapshot"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.location = os.path.join(self.directory.name, 'notes.snap')
+        snapshot.write_snapshot(self.location, [
+            (1373587200, 'third'),
+            (1373500800, 'first #note'),
+            (1373500801, 'sécond'),
+        ], signature=[12, 34])
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_load_snapshot(self):
+        """Verifies snapshots map their notes back in timestamp order"""
+        notes = snapshot.load_snapshot(self.location, [12, 34])
+        self.assertEqual(3, len(notes))
+        self.assertListEqual([12, 34], notes.signature)
+        self.assertListEqual(
+            [1373500800, 1373500801, 1373587200], notes.timestamps.tolist())
+        self.assertListEqual(
+            [(1373500800, 'first #note'),
+             (1373500801, 'sécond'),
+             (1373587200, 'third')],
+            list(notes.iter_notes()))
+        notes.close()
+
+    @unpack
+    @data(
+        (None, None, False, [1373500800, 1373500801, 1373587200]),
+        (1373500801, None, False, [1373500801, 1373587200]),
+        (None, 1373500801, True, [1373500801, 1373500800]),
+        (1373500801, 1373587199, False, [1373500801]),
+        (1373587201, None, False, []),
+        (1373587200, 1373500800, False, []),
+    )
+    def test_iter_notes(self, start, end, newest_first, expectation):
+        """Verifies iter_notes bisects the timestamp column"""
+        notes = snapshot.load_snapshot(self.location)
+        self.assertListEqual(
+            expectation,
+            [timestamp for timestamp, _
+             in notes.iter_notes(start, end, newest_first)])
+        notes.close()
+
+    def test_load_snapshot_invalid(self):
+        """Verifies stale, missing and damaged snapshots are not loaded"""
+        self.assertIsNone(snapshot.load_snapshot(self.location, [12, 35]))
+        self.assertIsNone(snapshot.load_snapshot(
+            os.path.join(self.directory.name, 'missing')))
+
+        with open(self.location, 'rb+') as snapshot_file:
+            snapshot_file.truncate(os.path.getsize(self.location) - 1)
+        self.assertIsNone(snapshot.load_snapshot(self.location))
+
+        with open(self.location, 'wb') as snapshot_file:
+            snapshot_file.write(b'{"format": 0}\n')
+        self.assertIsNone(snapshot.load_snapshot(self.location))
+
+    def test_write_snapshot_empty(self):
+        """Verifies a snapshot without notes loads empty"""
+        snapshot.write_snapshot(self.location, [])
+        notes = snapshot.load_snapshot(self.location)
+        self.assertEqual(0, len(notes))
+        self.assertListEqual([], list(notes.iter_notes()))
+        notes.close()